@@ -1,6 +1,7 @@
 bl_info = {
     'name': 'PBR Model Importer',
     'author': 'pjsamm',
+    'version': (1, 0, 0),
     'blender': (2, 93, 0),
     'category': 'Import-Export',
 }
@@ -16,8 +17,11 @@ if 'bpy' in locals():
                 print('   Reloaded', name[name.index('.'):])
             importlib.reload(sys.modules[name])
 
+import os, tempfile
+
 import bpy
 from bpy.types import (
+    AddonPreferences,
     Scene,
     Panel,
     Operator,
@@ -30,8 +34,52 @@ from bpy_extras.io_utils import ImportHelper
 from bpy_extras.io_utils import ExportHelper
 
 from .importer import importer
+from .shared import parser
 from .exporter import exporter
 
+## Texture formats
+
+texture_formats = [
+    ('RGB5A3', 'RGB5A3', '16 bits per pixel, 3 bit alpha'),
+    ('RGB565', 'RGB565', '16 bits per pixel, no alpha'),
+    ('IA8', 'IA8', '16 bits per pixel, grayscale with alpha'),
+    ('I8', 'I8', '8 bits per pixel, grayscale'),
+    ('CMPR', 'CMPR', '4 bits per pixel, compressed, 1 bit alpha'),
+    ('C8', 'C8', '8 bits per pixel, up to 256 colors'),
+    ('C4', 'C4', '4 bits per pixel, up to 16 colors'),
+]
+
+texture_format = EnumProperty(
+    name='Texture Format',
+    description='Encoding used for this material\'s texture on export.',
+    items=[('DEFAULT', 'Export Setting', 'Use the format chosen when exporting'),
+           ('AUTO', 'Automatic', 'Pick the smallest format within the error budget')] + \
+          texture_formats,
+    default='DEFAULT'
+)
+
+class MatTexturePanel(Panel):
+    bl_idname = 'OBJECT_PT_mat_textures_panel'
+    bl_label = 'Textures'
+    bl_space_type = 'NODE_EDITOR'
+    bl_region_type = 'UI'
+    bl_category = 'PBR'
+    bl_context = 'objectmode'
+
+    @classmethod
+    def poll(self, context):
+        return context.object is not None and \
+            context.object.type == 'MESH'
+
+    def draw(self, context):
+        layout = self.layout
+        for slot in context.object.material_slots:
+            mat = slot.material
+            # empty slot
+            if mat is None:
+                continue
+            layout.prop(mat, 'prop_texture_format', text=mat.name)
+
 ## Material animations tab
 
 anim_name = StringProperty(
@@ -186,6 +234,50 @@ subpanels = (
     WakeupAnimPanel
 )
 
+### Add-on preferences
+
+class PBRPreferences(AddonPreferences):
+    bl_idname = __name__
+
+    texture_cache_dir: StringProperty(
+        name='Texture Cache',
+        description='Folder where decoded textures are kept so that ' + \
+                    'models can be\nre-imported without decoding them again.',
+        subtype='DIR_PATH',
+        default=os.path.join(tempfile.gettempdir(), 'pbr-texture-cache')
+    )
+
+    texture_cache_size: IntProperty(
+        name='Cache Size (MB)',
+        description='Least recently used textures are removed once the ' + \
+                    'cache grows past\nthis size. Set to 0 to disable the cache.',
+        default=512,
+        min=0
+    )
+
+    model_cache_dir: StringProperty(
+        name='Model Cache',
+        description='Folder where parsed models are kept so that ' + \
+                    're-importing them\nskips parsing altogether.',
+        subtype='DIR_PATH',
+        default=os.path.join(tempfile.gettempdir(), 'pbr-model-cache')
+    )
+
+    model_cache_size: IntProperty(
+        name='Cache Size (MB)',
+        description='Least recently used models are removed once the ' + \
+                    'cache grows past\nthis size. Set to 0 to disable the cache.',
+        default=512,
+        min=0
+    )
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, 'texture_cache_dir')
+        layout.prop(self, 'texture_cache_size')
+        layout.prop(self, 'model_cache_dir')
+        layout.prop(self, 'model_cache_size')
+
 ### Import/export operators
 
 class ImportModel(Operator, ImportHelper):
@@ -215,10 +307,49 @@ class ImportModel(Operator, ImportHelper):
         default=False
     )
 
+    preview: EnumProperty(
+        name='Preview',
+        description="Import quickly for a rough look: textures at reduced " + \
+                    "resolution,\nsimplified materials and no animations.",
+        items=[
+            ('OFF', 'Off', 'Import the full model'),
+            ('2', '1/2 Resolution', 'Decode textures at half resolution'),
+            ('4', '1/4 Resolution', 'Decode textures at quarter resolution'),
+        ],
+        default='OFF'
+    )
+
+    decode_workers: IntProperty(
+        name='Texture Decoding Processes',
+        description="Number of processes used to decode textures. " + \
+                    "Set to 1 to decode\nthem one at a time in Blender itself. " + \
+                    "The processes take a moment to start\nand are kept " + \
+                    "for later imports, so this mostly helps with many large textures.",
+        default=1,
+        min=1,
+        max=64
+    )
+
+    trace_io: BoolProperty(
+        name='Trace File Access',
+        description="Record every read made while parsing the model " + \
+                    "and save a report\nnext to it as <file>.iotrace.json.",
+        default=False
+    )
+
     def execute(self, context):
+        prefs = context.preferences.addons[__name__].preferences
         importer.importSDR(context, self.filepath,
                            useDefaultPose=self.use_default_pose,
-                           joinMeshes=self.join_meshes)
+                           joinMeshes=self.join_meshes,
+                           traceIO=self.trace_io,
+                           cacheDir=bpy.path.abspath(prefs.texture_cache_dir),
+                           cacheSize=prefs.texture_cache_size * 2**20,
+                           decodeWorkers=self.decode_workers,
+                           previewScale=1 if self.preview == 'OFF' else int(self.preview),
+                           modelCacheDir=bpy.path.abspath(prefs.model_cache_dir),
+                           modelCacheSize=prefs.model_cache_size * 2**20,
+                           version=bl_info['version'])
         # set viewport shading to Material Preview in Layout view
         view = [space for area in bpy.data.screens['Layout'].areas
                 for space in area.spaces if space.type == 'VIEW_3D'][0]
@@ -238,6 +369,44 @@ class ExportModel(Operator, ExportHelper):
         options={'HIDDEN'}
     )
 
+    texture_format: EnumProperty(
+        name='Texture Format',
+        description='Encoding used for textures without a format set on their material.',
+        items=[('AUTO', 'Automatic', 'Pick the smallest format within the error budget')] + \
+              texture_formats,
+        default='AUTO'
+    )
+
+    texture_error_budget: FloatProperty(
+        name='Max. Texture Error',
+        description='Largest RMS color difference (out of 255) an automatically ' + \
+                    'chosen texture format may introduce.',
+        default=4.0,
+        min=0.0,
+        max=255.0
+    )
+
+    mipmap_filter: EnumProperty(
+        name='Mipmaps',
+        description='Filter used to generate lower resolution versions of textures.',
+        items=[
+            ('NONE', 'None', 'Only export the full resolution textures'),
+            ('BOX', 'Box', 'Average each 2x2 block of pixels'),
+            ('KAISER', 'Kaiser', 'Sharper results with a Kaiser-windowed sinc filter'),
+        ],
+        default='NONE'
+    )
+
+    cmpr_quality: EnumProperty(
+        name='CMPR Quality',
+        description='How much effort to spend compressing CMPR textures.',
+        items=[
+            ('FAST', 'Fast', 'Pick each block\'s colors along its main axis of variation'),
+            ('REFINE', 'Refine', 'Also improve the picked colors with least-squares fits'),
+        ],
+        default='REFINE'
+    )
+
     def execute(self, context):
         exporter.writeSDR(self, context)
         self.report({'INFO'}, 'Export successful.')
@@ -262,6 +431,7 @@ def set_mat_action(self, context):
 
 def register():
     from bpy.utils import register_class
+    register_class(PBRPreferences)
     # import/export operators
     register_class(ImportModel)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
@@ -270,6 +440,8 @@ def register():
     # material animations tab
     register_class(AddMatAnim)
     register_class(MatAnimPanel)
+    register_class(MatTexturePanel)
+    Material.prop_texture_format = texture_format
     Material.prop_action = \
             PointerProperty(type=Action, poll=poll_node, update=set_mat_action)
     Scene.prop_anim_name = anim_name
@@ -292,6 +464,8 @@ def unregister():
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
     # material animations tab
     unregister_class(MatAnimPanel)
+    unregister_class(MatTexturePanel)
+    del Material.prop_texture_format
     del Material.prop_action
     del Scene.prop_anim_name
     # animations tab
@@ -300,6 +474,8 @@ def unregister():
         unregister_class(cls)
         RemoveProperty(Armature, attr=f'prop_{cls.anim_id}')
         RemoveProperty(Material, attr=f'prop_{cls.anim_id}')
+    unregister_class(PBRPreferences)
+    parser.shutdownDecodePool()
 
 if __name__ == '__main__':
     register()
@@ -0,0 +1,264 @@
+"""
+Converts PBR models without Blender:
+
+    python cli.py <input dir> <output dir> [-j workers] [--timeout seconds]
+
+Every .sdr/.odr/.mdr file below the input directory is parsed in a pool
+of worker processes and written to the output directory (mirroring the
+input's layout) as an .npz bundle, with its textures as PNG files
+"""
+import os, sys, json, time, zlib, struct, argparse, traceback, multiprocessing
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from shared import parser, vtx
+
+MODEL_EXTENSIONS = ('.sdr', '.odr', '.mdr')
+
+def findModels(directory):
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(MODEL_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return paths
+
+## Output
+
+def writePNG(path, rgba):
+    """Writes an RGBA8 array of shape (height, width, 4), rows top-to-bottom"""
+    h, w = rgba.shape[:2]
+    # every row starts with its filter type (0 = none)
+    raw = np.zeros((h, w * 4 + 1), np.uint8)
+    raw[:, 1:] = rgba.reshape(h, w * 4)
+
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', crc)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+def imageRows(image):
+    # same cropping/padding as the Blender importer, flipped to top-to-bottom
+    pixels = np.zeros(image.width * image.height * 4, np.uint8)
+    n = min(len(pixels), len(image.pixels))
+    pixels[:n] = image.pixels[:n]
+    return pixels.reshape(image.height, image.width, 4)[::-1]
+
+def meshArrays(prefix, mesh):
+    arrays = {
+        f'{prefix}vertices': mesh.vertices,
+        f'{prefix}normals': mesh.vertNormals,
+    }
+    if mesh.texCoords is not None:
+        arrays[f'{prefix}uvs'] = mesh.texCoords
+    # the other uv layers and vertex colors
+    for i, attr in enumerate(vtx.texCoordAttrs[1:]):
+        if attr in mesh.attributes:
+            arrays[f'{prefix}uvs{i + 1}'] = mesh.attributes[attr]
+    for i, attr in enumerate(vtx.colorAttrs):
+        if attr in mesh.attributes:
+            arrays[f'{prefix}colors{i}'] = mesh.attributes[attr]
+    if mesh.weights is not None:
+        # one (vertex, bone, weight) entry per influence
+        influences = [(i, bone, w) for i, weights in enumerate(mesh.weights)
+                      for bone, w in weights.items()]
+        arrays[f'{prefix}weightVertices'] = np.array([i for i, _, _ in influences], np.int32)
+        arrays[f'{prefix}weightBones'] = np.array([b for _, b, _ in influences], np.int32)
+        arrays[f'{prefix}weights'] = np.array([w for _, _, w in influences], np.float32)
+    for j, part in enumerate(mesh.parts):
+        # (face, corner, [position, normal, uv] index), -1 if missing
+        missing = np.full((part.numFaces, 3), -1, np.int32)
+        arrays[f'{prefix}part{j}_faces'] = np.stack(
+            [missing if indices is None else indices
+             for indices in (part.vertexIndices, part.vertNormalIndices,
+                             part.texCoordIndices)], axis=-1)
+        arrays[f'{prefix}part{j}_material'] = np.int32(part.materialIndex)
+    return arrays
+
+def modelArrays(model):
+    arrays = {}
+    for i, mesh in enumerate(model['meshes']):
+        arrays.update(meshArrays(f'mesh{i}_', mesh))
+    for i, skele in enumerate(model['skeletons']):
+        prefix = f'skeleton{i}_'
+        bones = skele.bones
+        arrays[f'{prefix}names'] = np.array([bone.name for bone in bones])
+        arrays[f'{prefix}parents'] = np.array([-1 if bone.parentIndex is None else bone.parentIndex
+                                               for bone in bones], np.int32)
+        arrays[f'{prefix}meshes'] = np.array([-1 if bone.meshIndex is None else bone.meshIndex
+                                              for bone in bones], np.int32)
+        arrays[f'{prefix}localTransforms'] = np.array([bone.localTransform for bone in bones])
+        arrays[f'{prefix}inverseBindMatrices'] = np.array([bone.inverseBindMatrix for bone in bones])
+    arrays['materialNames'] = np.array([mat.name for mat in model['materials']])
+    arrays['materialTextures'] = np.array([-1 if mat.textureIndex is None else mat.textureIndex
+                                           for mat in model['materials']], np.int32)
+    arrays['textureImages'] = np.array([tex.imageIndex for tex in model['textures']], np.int32)
+    arrays['textureExtensions'] = np.array([tex.extensionType for tex in model['textures']],
+                                           np.int32).reshape(-1, 2)
+    arrays['actions'] = np.array(json.dumps(model['actions'], default=lambda v: np.asarray(v).tolist()))
+    return arrays
+
+def convertModel(path, outBase, useDefaultPose=False):
+    """Converts one model; returns the number of meshes and images written"""
+    model = parser.parseModel(path, useDefaultPose)
+    os.makedirs(os.path.dirname(outBase), exist_ok=True)
+    for i, image in enumerate(model['images']):
+        writePNG(f'{outBase}.image{i}.png', imageRows(image))
+    np.savez_compressed(outBase + '.npz', **modelArrays(model))
+    return len(model['meshes']), len(model['images'])
+
+## Worker pool
+
+def worker(conn, useDefaultPose):
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        path, outBase = job
+        start = time.perf_counter()
+        try:
+            numMeshes, numImages = convertModel(path, outBase, useDefaultPose)
+            result = {'ok': True, 'meshes': numMeshes, 'images': numImages}
+        except Exception as e:
+            result = {'ok': False, 'error': f'{type(e).__name__}: {e}',
+                      'traceback': traceback.format_exc()}
+        result['seconds'] = time.perf_counter() - start
+        conn.send(result)
+
+class Worker:
+    """A worker process, fed one model at a time over a pipe"""
+
+    def __init__(self, context, useDefaultPose):
+        self.conn, childConn = context.Pipe()
+        self.process = context.Process(target=worker, args=(childConn, useDefaultPose),
+                                       daemon=True)
+        self.process.start()
+        childConn.close()
+        self.job = None
+        self.started = None
+
+    def submit(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.conn.send(job)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+def convertAll(jobs, numWorkers, timeout, useDefaultPose=False, log=print):
+    """
+    Converts every (path, outBase) job in worker processes; models
+    taking longer than `timeout` seconds are abandoned and their
+    worker replaced. Returns a result dict for each path
+    """
+    context = multiprocessing.get_context('spawn')
+    pending = list(reversed(jobs))
+    results = {}
+    workers = [Worker(context, useDefaultPose) for _ in range(min(numWorkers, len(jobs)))]
+
+    def finish(w, result):
+        path = w.job[0]
+        results[path] = result
+        status = 'ok' if result['ok'] else 'FAILED: ' + result['error']
+        log(f'[{len(results)}/{len(jobs)}] {path} ({result["seconds"]:.2f}s) {status}')
+        w.job = None
+
+    try:
+        while pending or any(w.job for w in workers):
+            for w in workers:
+                if w.job is None and pending:
+                    w.submit(pending.pop())
+            busy = [w for w in workers if w.job]
+            now = time.monotonic()
+            deadline = min(w.started + timeout for w in busy)
+            ready = wait([w.conn for w in busy] + [w.process.sentinel for w in busy],
+                         max(deadline - now, 0))
+            for i, w in enumerate(workers):
+                if w.job is None:
+                    continue
+                seconds = time.monotonic() - w.started
+                if w.conn in ready:
+                    try:
+                        finish(w, w.conn.recv())
+                        continue
+                    except (EOFError, OSError):
+                        error = 'worker exited unexpectedly'
+                elif w.process.sentinel in ready:
+                    error = f'worker exited unexpectedly (exit code {w.process.exitcode})'
+                elif seconds >= timeout:
+                    error = f'timed out after {timeout}s'
+                else:
+                    continue
+                # the worker is dead or stuck, replace it
+                finish(w, {'ok': False, 'error': error, 'seconds': seconds})
+                w.kill()
+                workers[i] = Worker(context, useDefaultPose)
+    finally:
+        for w in workers:
+            if w.job is None:
+                w.stop()
+            else:
+                w.kill()
+    return results
+
+def summarize(jobs, results, elapsed):
+    totalBytes = sum(os.path.getsize(path) for path, _ in jobs)
+    failures = {path: r for path, r in results.items() if not r['ok']}
+    lines = [
+        f'{len(jobs)} model(s), {len(jobs) - len(failures)} converted, {len(failures)} failed',
+        f'{elapsed:.1f}s, {len(jobs) / max(elapsed, 1e-9):.1f} models/s, ' + \
+        f'{totalBytes / 2**20 / max(elapsed, 1e-9):.1f} MB/s',
+    ]
+    for path, result in sorted(failures.items()):
+        lines.append(f'  {path}: {result["error"]}')
+    return '\n'.join(lines)
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Convert PBR models to .npz bundles and PNG textures.')
+    args.add_argument('input', help='folder searched for .sdr/.odr/.mdr files')
+    args.add_argument('output', help='folder the converted models are written to')
+    args.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                      help='number of worker processes')
+    args.add_argument('--timeout', type=float, default=120,
+                      help='seconds after which a model is given up on')
+    args.add_argument('--default-pose', action='store_true',
+                      help='use the models\' default pose instead of their bind pose')
+    args.add_argument('--errors', metavar='FILE',
+                      help='also write the failures with tracebacks to FILE as JSON')
+    args = args.parse_args(argv)
+
+    jobs = []
+    for path in findModels(args.input):
+        rel = os.path.relpath(path, args.input)
+        jobs.append((path, os.path.join(args.output, rel)))
+    if not jobs:
+        print(f'No models found in {args.input}')
+        return 1
+
+    start = time.perf_counter()
+    results = convertAll(jobs, max(args.jobs, 1), args.timeout, args.default_pose)
+    print(summarize(jobs, results, time.perf_counter() - start))
+    if args.errors:
+        with open(args.errors, 'w') as f:
+            json.dump({path: r for path, r in results.items() if not r['ok']}, f, indent=2)
+    return 0 if all(r['ok'] for r in results.values()) else 2
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 import time
 import bpy, math, struct
+import numpy as np
+from ..shared import gtx_encode, records
 from ..shared.file_io import BinaryWriter
 
 def approxEqual(f1, f2):
@@ -29,165 +31,138 @@ def getMatMapNode(material):
         return maps[0]
     return None
 
-def imageToRGB5A3(image):
-    w,h = image.size
-    blocks_x = w // 4
-    blocks_y = h // 4
-    # converting to ints in advance significantly improves speed
-    rgba = [int(f * 255) for f in image.pixels]
-    data = [None] * (w * h * 2) # pre-allocate for speed
-    idx = 0
-    # add rows bottom-to-top to cooperate with Blender
-    for row in range(blocks_y - 1, -1, -1):
-        for col in range(blocks_x):
-            for i in range(3, -1, -1):
-                for j in range(4):
-                    pos = (row * w * 4 + col * 4 + i * w + j) * 4
-                    r,g,b,a = rgba[pos:pos+4]
-                    if a < 255:
-                        val = ((a >> 5) << 12) + \
-                              ((r // 0x11) << 8) + \
-                              ((g // 0x11) << 4) + \
-                              (b // 0x11)
-                    else:
-                        val = 0x8000 + \
-                              ((r >> 3) << 10) + \
-                              ((g >> 3) << 5) + \
-                              (b >> 3)
-                    data[idx:idx+2] = val.to_bytes(2, 'big')
-                    idx += 2
-    return bytes(data)
-
-def imageToRGBA32(image):
-    w,h = image.size
-    blocks_x = w // 4
-    blocks_y = h // 4
-    rgba = [int(f * 255) for f in image.pixels]
-    data = [None] * (w * h * 4) # pre-allocate for speed
-    for row in range(blocks_y):
-        for col in range(blocks_x):
-            offset = (row * w * 4 + col * 4) * 4
-            # each block is 4x4 pixels
-            for i in range(4):
-                for j in range(4):
-                    pos = (row * w * 4 + col * 4 + i * w + j) * 4
-                    idx = (row * blocks_x + col) * 64 + (i * 4 + j) * 2
-                    data[idx] = rgba[pos+3] # a
-                    data[idx+1] = rgba[pos] # r
-                    data[idx+32] = rgba[pos+1] # g
-                    data[idx+33] = rgba[pos+2] # b
-    return bytes(data)
+textureEncodings = {
+    'C4': 0x00,
+    'C8': 0x01,
+    'I4': 0x40,
+    'IA4': 0x41,
+    'I8': 0x42,
+    'IA8': 0x43,
+    'RGB565': 0x44,
+    'RGBA32': 0x45,
+    'RGB5A3': 0x90,
+    'CMPR': 0xB0,
+}
+
+paletteEncodings = {
+    'IA8': 0x1,
+    'RGB565': 0x2,
+    'RGB5A3': 0x3,
+}
 
 def writeTexture(file, address, texture):
     image = texture.image
     w,h = image.size
-    file.write('ushort', w, address, offset=0)
-    file.write('ushort', h, address, offset=0x2)
-    file.write('uchar', 1, address, offset=0x5)
-    file.write('uint', 0x90, address, offset=0x8) # encoding
     # extrapolation
     if texture.extension == 'EXTEND':
-        file.write('uint', 0, address, offset=0x10) # x
-        file.write('uint', 0, address, offset=0x14) # y
+        extrap = 0
     elif texture.extension == 'REPEAT':
-        file.write('uint', 1, address, offset=0x10) # x
-        file.write('uint', 1, address, offset=0x14) # y
+        extrap = 1
     else:
         raise Exception(f"Extrapolation type '{texture.extension}' unsupported")
     # image data address needs to be a multiple of 0x20
     offset = 0x80 + address % 0x20
-    file.write('uint', offset, address, offset=0x28)
-    #data = imageToRGBA32(image) # currently doesn't load correctly in-game
-    data = imageToRGB5A3(image)
-    file.write('uint', len(data), address, offset=0x4c)
+    # materials can override the format chosen on export
+    encoding = textureFormats.get(image.name, operator.texture_format)
+    rgba = gtx_encode.imagePixels(image)
+    mipmaps = []
+    if operator.mipmap_filter != 'NONE':
+        mipmaps = gtx_encode.mipmapChain(rgba, operator.mipmap_filter)
+    if encoding == 'AUTO':
+        encoding, encoded = gtx_encode.chooseEncoding(rgba, operator.texture_error_budget,
+                                                      operator.cmpr_quality, mipmaps)
+        print(f"Texture '{image.name}': {encoding}")
+    else:
+        encoded = gtx_encode.encodeTexture(rgba, encoding, operator.cmpr_quality, mipmaps)
+    data, tlut, palEncoding = encoded
+    palette = {}
+    if tlut is not None:
+        # the palette goes right after the indices, inside the image data
+        paletteOffset = (len(data) + 0x1f) // 0x20 * 0x20
+        palette['paletteEncoding'] = paletteEncodings[palEncoding]
+        palette['paletteAddr'] = address + offset + paletteOffset
+        data = data.ljust(paletteOffset, b'\x00') + tlut
+    # lossy formats (CMPR) have no fixed bound
+    if encoding in gtx_encode.maxQuantizationError:
+        error = gtx_encode.quantizationError(rgba, data, encoding)
+        if any(error > gtx_encode.maxQuantizationError[encoding]):
+            operator.report({'WARNING'}, f"Texture '{image.name}' changed more " + \
+                            f"than expected when encoded (max. error {tuple(error)})")
+    file.write_record(records.TEXTURE, address,
+                      width=w,
+                      height=h,
+                      numLevels=len(mipmaps) + 1,
+                      encoding=textureEncodings[encoding],
+                      extrapX=extrap,
+                      extrapY=extrap,
+                      imageOffset=offset,
+                      dataSize=len(data),
+                      **palette)
     file.write_chunk(data, address + offset)
     return file.tell() + 0x10 # next address (add some padding)
 
 def writeMaterial(file, address, material):
     # name
-    nameAddr = address + 0x8c
-    file.write('uint', nameAddr, address)
+    nameAddr = address + records.MATERIAL.size
     file.write('string', material.name, nameAddr)
     sz = len(material.name) + 1 # null terminate
     sz = (sz + 3) // 4 * 4
-    nextAddr = nameAddr + sz
+    addr2c = nameAddr + sz
 
     texture = getMatTexture(material)
-    texAddr = textures[texture.image.name]['address']
-    file.write('uint', texAddr, address, offset=0x18)
-    file.write('uint', nextAddr, address, offset=0x2c)
-    file.write('uchar', 0x1, address, offset=0x5a)
-    file.write('uchar', 0x1, 0, whence='current')
-    file.write('uchar', 0x1, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0x80, address, offset=0x60)
-    file.write('uchar', 0x80, 0, whence='current')
-    file.write('uchar', 0x80, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, address, offset=0x64)
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0x0, address, offset=0x70)
-    file.write('uchar', 0x0, 0, whence='current')
-    file.write('uchar', 0x0, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, address, offset=0x74)
-    file.write('uchar', 0x33, address, offset=0x78)
-    file.write('uchar', 0x33, 0, whence='current')
-    file.write('uchar', 0x33, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, address, offset=0x80)
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-
-    file.write('uchar', 0x1, nextAddr)
+    texAddr = file.lookup(f'texture:{texture.image.name}')
+
+    file.write('uchar', 0x1, addr2c)
     file.write('uchar', 0x4, 0, whence='current')
-    file.write('float', 0.0, 2, whence='current')
-    file.write('float', 0.0, 0, whence='current')
-    file.write('float', 0.0, 0, whence='current')
-    file.write('float', 1.0, 0, whence='current')
-    file.write('float', 1.0, 0, whence='current')
-
-    nextAddr = file.tell()
-    file.write('uint', nextAddr, address, offset=0x40)
-    file.write('uchar', 0x0, nextAddr)
-    file.write('uchar', 0x0, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0xff, 0, whence='current')
-    file.write('uchar', 0x0, 0, whence='current')
-    file.write('uchar', 0x0, 0, whence='current')
-    file.write('uchar', 0x0, 0, whence='current')
+    file.write_array('float', (0.0, 0.0, 0.0, 1.0, 1.0), addr2c + 0x4)
+
+    addr40 = addr2c + 0x18
+    file.write_array('uchar', (0x0, 0x0, 0xff, 0xff, 0x0, 0x0, 0x0), addr40)
 
     # animation data
-    nextAddr = file.tell() + 1
+    nextAddr = addr40 + 0x8
+    animDataAddr = 0
     if isMaterialAnimated(material):
-        file.write('uint', nextAddr, address, offset=0x84)
+        animDataAddr = nextAddr
         nextAddr = writeFCurves(file, nextAddr, material)
 
+    file.write_record(records.MATERIAL, address,
+                      nameAddr=nameAddr,
+                      textureAddr=texAddr,
+                      idk2c=addr2c,
+                      idk40=addr40,
+                      idk5a=(0x1, 0x1, 0x1, 0xff),
+                      color60=(0x80, 0x80, 0x80, 0xff),
+                      color64=(0xff, 0xff, 0xff, 0xff),
+                      color70=(0x0, 0x0, 0x0, 0xff),
+                      idk74=0xff,
+                      color78=(0x33, 0x33, 0x33, 0xff),
+                      color80=(0xff, 0xff, 0xff, 0xff),
+                      animDataAddr=animDataAddr)
     return nextAddr
 
 def writeAction(file, address, action_id):
     time = actions[action_id]['length'] / FRAME_RATE
+    action = { 'length': time, 'loops': 1, 'idk2a': 1 }
     # determines portion of animation played during attacks
     if action_id == 'move_spec':
         # 1.5 is fairly arbitrary, length of Psychic's animation
-        file.write('float', time - 1.5, address, offset=0x4)
+        action['idk4'] = time - 1.5
     # determines position of mon when animation is played
     if action_id == 'move_phys':
         # 1.0 is entirely arbitrary
-        file.write('float', 1.0, address, offset=0x8)
-    file.write('float', time, address, offset=0xc)
-    file.write('uchar', 1, address, offset=0x28) # loops?
+        action['idk8'] = 1.0
     if not action_id.startswith('tx_'):
-        file.write('uchar', 1, address, offset=0x29)
-    file.write('uchar', 1, address, offset=0x2a)
-    return address + 0x30
+        action['idk29'] = 1
+    file.write_record(records.ACTION, address, **action)
+    return address + records.ACTION.size
 
 def writeBone(file, address, bone):
     print(bone.name)
-    nextAddr = address + 0x30
+    file.define(f'bone:{bone.name}', address)
+    layout = records.NODE_HEADER
+    node = {}
+    nextAddr = address + layout.size
     
     # root bone cannot be part of a vertex group
     if bone.parent is not None:
@@ -200,41 +175,33 @@ def writeBone(file, address, bone):
         r = r.to_euler()
         # just gonna mark every bone as a vertex group instead
         # of trying to track which ones actually are
-        file.write('uint', 0x2, address)
+        layout = records.NODE
+        node['type'] = 0x2
         # inverse bind matrix
-        file.seek(address + 0x44)
-        for row in bone.matrix_local.inverted()[:3]:
-            for f in row:
-                file.write('float', f, 0, whence='current')
-        nextAddr += 72
+        node['inverseBindMatrix'] = [f for row in bone.matrix_local.inverted()[:3]
+                                     for f in row]
+        nextAddr = address + layout.size
         if any(f != 0.0 for f in t):
-            file.write('uint', nextAddr, address, offset=0xc)
-            file.write('float', t[0], nextAddr)
-            file.write('float', t[1], 0, whence='current')
-            file.write('float', t[2], 0, whence='current')
+            node['posAddr'] = nextAddr
+            file.write_array('float', t, nextAddr)
             nextAddr += 12
         if any(f != 0.0 for f in r):
-            file.write('uint', nextAddr, address, offset=0x10)
-            file.write('float', r[0], nextAddr)
-            file.write('float', r[1], 0, whence='current')
-            file.write('float', r[2], 0, whence='current')
+            node['rotAddr'] = nextAddr
+            file.write_array('float', r, nextAddr)
             nextAddr += 12
         if any(f != 1.0 for f in s):
-            file.write('uint', nextAddr, address, offset=0x14)
-            file.write('float', s[0], nextAddr)
-            file.write('float', s[1], 0, whence='current')
-            file.write('float', s[2], 0, whence='current')
+            node['scaAddr'] = nextAddr
+            file.write_array('float', s, nextAddr)
             nextAddr += 12
         if bone.name == 'ct_all':
             # this affects camera positioning during run animation;
             # should not be hard-coded
-            file.write('float', 8, address, offset=0x1c)
+            node['idk1c'] = 8
 
     nameAddr = nextAddr
-    file.write('uint', nameAddr, address, offset=0x4)
-    idx = bones.find(bone.name)
-    file.write('ushort', idx, address, offset=0x8)
-    file.write('ushort', 0x18, address, offset=0xa)
+    node['nameAddr'] = nameAddr
+    node['boneIndex'] = bones.find(bone.name)
+    node['nodeFlags'] = 0x18
     file.write('string', bone.name, nameAddr)
     sz = len(bone.name) + 1 # null terminate
     sz = (sz + 3) // 4 * 4
@@ -243,11 +210,11 @@ def writeBone(file, address, bone):
     # since the origin bone is used for scaling, ignore its
     # animation data (it shouldn't be animated anyway)
     if bone.name.lower() != 'origin' and isBoneAnimated(bone):
-        file.write('uint', nextAddr, address, offset=0x20)
+        node['animDataAddr'] = nextAddr
         nextAddr = writeFCurves(file, nextAddr, bone)
 
     if len(bone.children) > 0:
-        file.write('uint', nextAddr, address, offset=0x24)
+        node['childAddr'] = nextAddr
         nextAddr = writeBone(file, nextAddr, bone.children[0])
 
     if bone.parent is not None:
@@ -255,18 +222,17 @@ def writeBone(file, address, bone):
         idx = siblings.find(bone.name)
         # if has next sibling...
         if len(siblings) > idx + 1:
-            file.write('uint', nextAddr, address, offset=0x28)
+            node['siblingAddr'] = nextAddr
             nextAddr = writeBone(file, nextAddr, siblings[idx + 1])
 
+    file.write_record(layout, address, **node)
     return nextAddr
 
 def writeFCurves(file, address, object):
     i = 0
     for action_id in actions:
-        file.write('ushort', i, address, offset=0)
         # anim. length can't be 0 or it will freeze the game
         animLength = max(actions[action_id]['length'] / FRAME_RATE, 0.0001)
-        file.write('float', animLength, address, offset=0x8)
 
         numFCurves = 0
         if type(object) == bpy.types.Bone:
@@ -288,18 +254,13 @@ def writeFCurves(file, address, object):
                 }
         for comp in keyframes:
             numFCurves += len(keyframes[comp])
-        file.write('ushort', numFCurves, address, offset=0x2)
-        fcurveListAddr = address + 0x10
-        file.write('uint', fcurveListAddr, address, offset=0x4)
+        fcurveListAddr = address + records.ANIM_DATA.size
 
-        nextAddr = fcurveListAddr + numFCurves * 0x10
+        nextAddr = fcurveListAddr + numFCurves * records.FCURVE.size
         c = 0
         for m in keyframes: # component
             for n in keyframes[m]: # axis
-                entryAddr = fcurveListAddr + c * 0x10
-                file.write('uchar', m, entryAddr, offset=0x1)
-                file.write('uchar', n+1, entryAddr, offset=0x2)
-                file.write('uchar', 0x8, entryAddr, offset=0x6) # format code?
+                entryAddr = fcurveListAddr + c * records.FCURVE.size
                 # calc largest exponent that satisfies
                 #   |x| * (2 ^ exp) < (2 ^ 15)
                 # for all keyframe points (2 ^ 15 = max signed short)
@@ -308,14 +269,22 @@ def writeFCurves(file, address, object):
                     exp = 0
                 else:
                     exp = min(14, math.ceil(15 - math.log(umax, 2)) - 1)
-                file.write('uchar', exp, entryAddr, offset=0x7)
-                file.write('uint', nextAddr, entryAddr, offset=0x8)
+                file.write_record(records.FCURVE, entryAddr,
+                                  component=m,
+                                  axis=n+1,
+                                  dataType=0x8, # format code?
+                                  exponent=exp,
+                                  keyframeDataAddr=nextAddr)
                 nextAddr = writeKeyframes(file, nextAddr,
                                           keyframes[m][n], 2 ** exp)
                 c += 1
         # actions are stored in a linked list
-        if i < len(actions) - 1:
-            file.write('uint', nextAddr, address, offset=0xc)
+        file.write_record(records.ANIM_DATA, address,
+                          actionIndex=i,
+                          numFCurves=numFCurves,
+                          fcurveListAddr=fcurveListAddr,
+                          length=animLength,
+                          nextAddr=(nextAddr if i < len(actions) - 1 else 0))
         address = nextAddr
         i += 1
     return nextAddr
@@ -326,16 +295,15 @@ def writeKeyframes(file, address, keyframes, scale):
     pointsAddr = address + 0x20
     # each point uses 2 bytes so need to do some alignment
     framesAddr = pointsAddr + (numFrames * 2 + 3) // 4 * 4
-    file.write('uint', pointsAddr, address, offset=0)
-    file.write('ushort', numFrames, address, offset=0x8)
-    file.write('float', maxTime, address, offset=0xc)
-    file.write('uint', framesAddr, address, offset=0x10)
-    file.write('ushort', numFrames, address, offset=0x14)
-    file.write('float', -1234567.0, address, offset=0x18) # "-inf"
-    file.seek(pointsAddr)
-    for kf in keyframes:
-        scaled = round(kf[1] * scale)
-        file.write('short', scaled, 0, whence='current')
+    file.write_record(records.KEYFRAME_DATA, address,
+                      valuesAddr=pointsAddr,
+                      valueCount=numFrames,
+                      maxTime=maxTime,
+                      keyframesAddr=framesAddr,
+                      numKeyframes=numFrames,
+                      idk18=-1234567.0) # "-inf"
+    file.write_array('short', [round(kf[1] * scale) for kf in keyframes],
+                     pointsAddr)
 
     # not currently supporting Bezier interpolation
 ##    file.seek(tangentsAddr)
@@ -347,58 +315,38 @@ def writeKeyframes(file, address, keyframes, scale):
 ##            file.write('float', h0, 0, whence='current')
 ##            file.write('float', h1, 0, whence='current')
 
-    file.seek(framesAddr)
-    for i in range(numFrames):
-        kf = keyframes[i]
-        # interpolation - using constant (0) for everything atm
-        file.write('ushort', 0, 0, whence='current')
-        file.write('ushort', i, 0, whence='current')
-        timestamp = kf[0] / FRAME_RATE
-        file.write('float', timestamp, 4, whence='current')
-    return framesAddr + numFrames * 0xc
-
-def writeMeshes(file, boneAddr, nextAddr):
-    file.seek(boneAddr)
-    # check if the bone is a skin node
-    if file.read('uint', boneAddr) == 0x3:
-        # if so, get the bone name
-        nameAddr = file.read('uint', boneAddr, offset=0x4)
-        name = file.read('string', nameAddr)
-        # write the mesh address
-        file.write('uint', nextAddr, boneAddr, offset=0x30)
-        # write the mesh data
-        mesh = bpy.data.objects[name]
-        nextAddr = writeMesh(file, nextAddr, mesh)
-
-    childAddr = file.read('uint', boneAddr, offset=0x24)
-    if childAddr != 0:
-        nextAddr = writeMeshes(file, childAddr, nextAddr)
-
-    sibAddr = file.read('uint', boneAddr, offset=0x28)
-    if sibAddr != 0:
-        nextAddr = writeMeshes(file, sibAddr, nextAddr)
+    # interpolation - using constant (0) for everything atm
+    file.write_chunk(b''.join(records.KEYFRAME.pack(valueIndex=i,
+                                                    time=kf[0] / FRAME_RATE)
+                              for i, kf in enumerate(keyframes)),
+                     framesAddr)
+    return framesAddr + numFrames * records.KEYFRAME.size
 
-    return nextAddr
+def writeMeshes(file, address, objs):
+    for obj in objs:
+        # fills in the pointer left in the object's skin node
+        file.define(f'mesh:{obj.name}', address)
+        address = writeMesh(file, address, obj)
+    return address
 
 def writeMesh(file, address, obj):
     mesh = obj.data
-    file.write('ushort', 0xa00, address)
     numVerts = len(mesh.vertices)
-    file.write('ushort', numVerts, address, offset=0x2)
-    file.write('ushort', 0x1, address, offset=0x6) # num. uv layers
+    header = {
+        'idk0': 0xa00,
+        'numVertices': numVerts,
+        'numUVLayers': 0x1,
+    }
 
     # vertices & normals
-    vertsAddr = address + 0x30
-    file.write('uint', vertsAddr, address, offset=0x8)
-    file.seek(vertsAddr)
+    vertsAddr = address + records.MESH.size
+    header['verticesAddr'] = vertsAddr
+    coords = []
     for v in mesh.vertices:
-        # vertex
-        for f in v.co:
-            file.write('float', f, 0, whence='current')
-        # normal
-        for f in v.normal:
-            file.write('float', f, 0, whence='current')
-    nextAddr = file.tell()
+        coords.extend(v.co) # vertex
+        coords.extend(v.normal) # normal
+    file.write_array('float', coords, vertsAddr)
+    nextAddr = vertsAddr + 4 * len(coords)
 
     # weights
     vertGroups = []
@@ -410,21 +358,16 @@ def writeMesh(file, address, obj):
         vertGroups.append(groups[:4])
     if any(len(groups) > 0 for groups in vertGroups):
         skinAddr = nextAddr
-        file.write('uint', skinAddr, address, offset=0xc)
-        file.write('ushort', len(mesh.vertices), skinAddr, offset=0x8)
-        file.write('ushort', len(mesh.vertices), skinAddr, offset=0xa)
-        groupsListAddr = skinAddr + 0x1c
-        file.write('uint', groupsListAddr, skinAddr, offset=0xc)
-        weightsListAddr = groupsListAddr + 6 * len(mesh.vertices)
-        file.write('uint', weightsListAddr, skinAddr, offset=0x10)
+        header['weightsAddr'] = skinAddr
+        groupsListAddr = skinAddr + records.SKIN.size
+        weightsListAddr = groupsListAddr + 6 * numVerts
+        groupsList = []
+        weightsList = []
         for i in range(len(vertGroups)):
             groups = vertGroups[i]
-            file.write('ushort', 1, groupsListAddr, offset=(6 * i))
             b1 = getVertexGroupBoneIndex(obj, groups[0].group)
-            file.write('ushort', b1, 0, whence='current')
             if len(groups) > 1:
                 b2 = getVertexGroupBoneIndex(obj, groups[1].group)
-                file.write('ushort', b2, 0, whence='current')
                 w1 = groups[0].weight
                 w2 = groups[1].weight
                 # weights are out of 0xffff
@@ -435,18 +378,18 @@ def writeMesh(file, address, obj):
                     # normalize in case there are > 2 groups
                     weight = round(0xffff * (w1 / (w1 + w2)))
             else:
-                file.write('ushort', 0, 0, whence='current')
+                b2 = 0
                 # only one group, give entire weight to it
                 weight = 0xffff
-            file.write('ushort', weight, weightsListAddr, offset=(2 * i))
-        groupsListAddr = file.tell()
-        file.write('uint', groupsListAddr, skinAddr, offset=0x18)
-        n = 0
-        file.seek(groupsListAddr)
+            groupsList += [1, b1, b2]
+            weightsList.append(weight)
+        file.write_array('ushort', groupsList, groupsListAddr)
+        file.write_array('ushort', weightsList, weightsListAddr)
+        extrasAddr = weightsListAddr + 2 * numVerts
+        extras = []
         for i in range(len(vertGroups)):
             groups = vertGroups[i]
             if len(groups) > 2:
-                file.write('ushort', i, 0, whence='current')
                 b1 = getVertexGroupBoneIndex(obj, groups[2].group)
                 w1 = round(groups[2].weight * 0xffff)
                 if len(groups) == 4:
@@ -455,93 +398,89 @@ def writeMesh(file, address, obj):
                 else:
                     b2 = 0xffff
                     w2 = 0
-                file.write('ushort', b1, 0, whence='current')
-                file.write('ushort', b2, 0, whence='current')
-                file.write('ushort', w1, 0, whence='current')
-                file.write('ushort', w2, 0, whence='current')
-                n += 1
-        nextAddr = file.tell()
-        file.write('ushort', n, skinAddr, offset=0x14)
+                extras += [i, b1, b2, w1, w2]
+        file.write_array('ushort', extras, extrasAddr)
+        nextAddr = extrasAddr + 2 * len(extras)
+        file.write_record(records.SKIN, skinAddr,
+                          numDouble=numVerts,
+                          numDoubleVerts=numVerts,
+                          doubleGroupsAddr=groupsListAddr,
+                          doubleWeightsAddr=weightsListAddr,
+                          numExtra=len(extras) // 5,
+                          extraAddr=extrasAddr)
 
     # uv coordinates
     uvCoordsAddr = nextAddr
-    file.write('uint', uvCoordsAddr, address, offset=0x14)
-    file.write('uint', uvCoordsAddr + 0x8, uvCoordsAddr) # start of uv coords
-    file.write('ushort', len(mesh.loops), uvCoordsAddr, offset=0x4)
+    header['uvLayersAddr'] = uvCoordsAddr
+    coordsAddr = uvCoordsAddr + records.UV_LAYER.size
+    file.write_record(records.UV_LAYER, uvCoordsAddr,
+                      coordsAddr=coordsAddr,
+                      numCoords=len(mesh.loops))
     uvMap = mesh.uv_layers.active.data
-    file.seek(uvCoordsAddr + 0x8)
+    coords = []
     for loop in mesh.loops:
-        coords = uvMap[loop.index].uv
-        file.write('float', coords[0], 0, whence='current') # x
-        file.write('float', 1.0 - coords[1], 0, whence='current') # y
+        uv = uvMap[loop.index].uv
+        coords += [uv[0], 1.0 - uv[1]]
+    file.write_array('float', coords, coordsAddr)
 
     # face groups
-    facesAddr = file.tell()
-    file.write('uint', facesAddr, address, offset=0x18)
+    facesAddr = coordsAddr + 4 * len(coords)
+    header['partsAddr'] = facesAddr
     for i in range(len(obj.material_slots)):
-        file.write('uint', 0x1, facesAddr)
         faces = [face for face in mesh.polygons if face.material_index == i]
         mat = obj.material_slots[i].material
-        matListAddr = file.read('uint', 0, offset=0x14)
-        matAddr = file.read('uint', matListAddr,
-                            offset=(4 * materials.index(mat)))
-        file.write('uint', matAddr, facesAddr, offset=0x8)
+        matAddr = file.lookup(f'material:{materials.index(mat)}')
 
-        file.write('ushort', 0x1, facesAddr, offset=0xc) # num. ops
         faceOpsAddr = facesAddr + 0x40
         # the start address needs to be a multiple of 0x20
         faceOpsAddr = (faceOpsAddr + 0x1f) // 0x20 * 0x20
-        file.write('uint', faceOpsAddr, facesAddr, offset=0x14)
         faceOpsSize = 0x3 + len(faces) * 3 * 6
         # the region size also needs to be a multiple of 0x20
         faceOpsSize = (faceOpsSize + 0x1f) // 0x20 * 0x20
-        file.write('uint', faceOpsSize, facesAddr, offset=0x18)
         vertInfoAddr = faceOpsAddr + faceOpsSize
-        file.write('uint', vertInfoAddr, facesAddr, offset=0x10)
 
         # faces
         file.write('uchar', 0x90, faceOpsAddr) # GX_DRAW_TRIANGLES
         file.write('ushort', len(faces) * 3, 0, whence='current')
+        indices = []
         for face in faces:
-            file.write('ushort', face.vertices[1], 0, whence='current') # vertex
-            file.write('ushort', face.vertices[1], 0, whence='current') # normal
-            file.write('ushort', face.loop_indices[1], 0, whence='current') # uv coord
-            file.write('ushort', face.vertices[0], 0, whence='current')
-            file.write('ushort', face.vertices[0], 0, whence='current')
-            file.write('ushort', face.loop_indices[0], 0, whence='current')
-            file.write('ushort', face.vertices[2], 0, whence='current')
-            file.write('ushort', face.vertices[2], 0, whence='current')
-            file.write('ushort', face.loop_indices[2], 0, whence='current')
+            # vertex, normal, uv coord for each corner
+            for j in (1, 0, 2):
+                indices += [face.vertices[j], face.vertices[j],
+                            face.loop_indices[j]]
+        file.write_array('ushort', indices, faceOpsAddr + 0x3)
 
         # vertex info
-        file.write('uchar', 0x9, vertInfoAddr) # vertices
-        file.write('uchar', 0x1, 0, whence='current')
-        file.write('uchar', 0x4, 0, whence='current')
-        file.write('uchar', 0x0, 0, whence='current')
-        file.write('uchar', 0x3, 0, whence='current')
-        file.write('uchar', 0x18, 0, whence='current') # stride
-        file.write('uchar', 0xa, 2, whence='current') # normals
-        file.write('uchar', 0x0, 0, whence='current')
-        file.write('uchar', 0x4, 0, whence='current')
-        file.write('uchar', 0x0, 0, whence='current')
-        file.write('uchar', 0x3, 0, whence='current')
-        file.write('uchar', 0x18, 0, whence='current') # stride
-        file.write('uchar', 0xd, 2, whence='current') # uv coords
-        file.write('uchar', 0x1, 0, whence='current')
-        file.write('uchar', 0x4, 0, whence='current')
-        file.write('uchar', 0x0, 0, whence='current')
-        file.write('uchar', 0x3, 0, whence='current')
-        file.write('uchar', 0x8, 0, whence='current') # stride
-        file.write('uchar', 0xff, 2, whence='current')
+        attrs = [(0x9, 0x1, 0x18), # vertices
+                 (0xa, 0x0, 0x18), # normals
+                 (0xd, 0x1, 0x8)] # uv coords
+        for j, (attr, count, stride) in enumerate(attrs):
+            file.write_record(records.VERTEX_ATTR,
+                              vertInfoAddr + j * records.VERTEX_ATTR.size,
+                              attr=attr,
+                              componentCount=count,
+                              componentType=0x4,
+                              indexType=0x3,
+                              stride=stride)
+        file.write('uchar', 0xff, vertInfoAddr + len(attrs) * records.VERTEX_ATTR.size)
 
         nextAddr = vertInfoAddr + 0xc0
+        part = {
+            'idk0': 0x1,
+            'materialAddr': matAddr,
+            'numGroups': 0x1, # num. ops
+            'vertInfoAddr': vertInfoAddr,
+            'facesAddr': faceOpsAddr,
+            'facesSize': faceOpsSize,
+        }
         if i < len(obj.material_slots) - 1:
-            file.write('uint', nextAddr, facesAddr, offset=0x1c)
-            facesAddr = nextAddr
+            part['nextAddr'] = nextAddr
+        file.write_record(records.MESH_PART, facesAddr, **part)
+        facesAddr = nextAddr
 
     # bounding boxes
     bboxesAddr = nextAddr
-    file.write('uint', bboxesAddr, address, offset=0x1c)
+    header['bboxesAddr'] = bboxesAddr
     file.write('ushort', 0x1, bboxesAddr, offset=0x18) # count
     file.write('uint', bboxesAddr + 0x24, bboxesAddr, offset=0x1c)
 
@@ -552,16 +491,12 @@ def writeMesh(file, address, obj):
 
     # currently just writing a single bounding box for
     # proper scaling in the Pokemon summary menu
-    x_min, y_min, z_min = [min(dim) for dim in zip(*obj.bound_box)]
-    x_max, y_max, z_max = [max(dim) for dim in zip(*obj.bound_box)]
-    file.write('float', x_min, bboxesAddr, offset=0x30)
-    file.write('float', y_min, 0, whence='current')
-    file.write('float', z_min, 0, whence='current')
-    file.write('float', x_max, 0, whence='current')
-    file.write('float', y_max, 0, whence='current')
-    file.write('float', z_max, 0, whence='current')
+    bbox = [min(dim) for dim in zip(*obj.bound_box)] + \
+           [max(dim) for dim in zip(*obj.bound_box)]
+    file.write_array('float', bbox, bboxesAddr + 0x30)
 
-    return file.tell()
+    file.write_record(records.MESH, address, **header)
+    return bboxesAddr + 0x48
 
 def writeSDR(op, cx):
     t0 = time.time()
@@ -577,6 +512,7 @@ def writeSDR(op, cx):
     global actions
     global materials
     global textures
+    global textureFormats
     global keyframes
 
     operator = op
@@ -594,10 +530,23 @@ def writeSDR(op, cx):
         materials += [slot.material for slot in mesh.material_slots]
 
     textures = {}
+    textureFormats = {}
+    # material that chose each image's format
+    formatMaterials = {}
     for mat in materials:
         tex = getMatTexture(mat)
-        if tex.image.name not in textures:
-            textures[tex.image.name] = tex
+        name = tex.image.name
+        if name not in textures:
+            textures[name] = tex
+        if mat.prop_texture_format == 'DEFAULT':
+            continue
+        if name not in textureFormats:
+            textureFormats[name] = mat.prop_texture_format
+            formatMaterials[name] = mat.name
+        elif textureFormats[name] != mat.prop_texture_format:
+            operator.report({'WARNING'}, f"Materials '{formatMaterials[name]}' and " + \
+                            f"'{mat.name}' share image '{name}' but override its " + \
+                            f"format differently; using {textureFormats[name]}")
 
     # build keyframe dictionary
     actions = {}
@@ -676,33 +625,38 @@ def writeSDR(op, cx):
     t0 = time.time()
 
     fout = BinaryWriter(path)
-    fout.write('uchar', 0x1, 0)
-    fout.write('ushort', 0x4, 0x2)
+    header = {
+        'idk0': 0x1,
+        'idk2': 0x4,
+    }
 
     # textures
     texListAddr = 0x30
-    fout.write('uint', texListAddr, 0xc)
-    fout.write('ushort', len(textures), 0x1a)
+    header['texturesListAddr'] = texListAddr
+    header['numTextures'] = len(textures)
     nextAddr = texListAddr + 4 * len(textures)
     nextAddr = (nextAddr + 0xf) // 0x10 * 0x10
-    i = 0
+    texAddrs = []
     for tex in textures.values():
-        textures[tex.image.name]['address'] = nextAddr
-        fout.write('uint', nextAddr, texListAddr, offset=(4 * i))
+        fout.define(f'texture:{tex.image.name}', nextAddr)
+        texAddrs.append(nextAddr)
         nextAddr = writeTexture(fout, nextAddr, tex)
-        i += 1
+    fout.write_array('uint', texAddrs, texListAddr)
     print('Textures:', time.time() - t0)
     t0 = time.time()
 
     # materials
     matListAddr = nextAddr
-    fout.write('uint', matListAddr, 0x14)
-    fout.write('ushort', len(materials), 0x1e)
+    header['materialsListAddr'] = matListAddr
+    header['numMaterials'] = len(materials)
     nextAddr = matListAddr + 4 * len(materials)
     nextAddr = (nextAddr + 0xf) // 0x10 * 0x10
+    matAddrs = []
     for i in range(len(materials)):
-        fout.write('uint', nextAddr, matListAddr, offset=(4 * i))
+        fout.define(f'material:{i}', nextAddr)
+        matAddrs.append(nextAddr)
         nextAddr = writeMaterial(fout, nextAddr, materials[i])
+    fout.write_array('uint', matAddrs, matListAddr)
     print('Materials:', time.time() - t0)
     t0 = time.time()
 
@@ -712,7 +666,7 @@ def writeSDR(op, cx):
         nextAddr = writeAction(fout, nextAddr, action_id)
     i = 0
     for action_id in actions:
-        actionAddr = actionListAddr + i * 0x30
+        actionAddr = actionListAddr + i * records.ACTION.size
         fout.write('uint', nextAddr, actionAddr)
         fout.write('string', action_id, nextAddr)
         sz = len(action_id) + 1 # null terminate
@@ -725,50 +679,49 @@ def writeSDR(op, cx):
     # skeleton
     skeleListAddr = nextAddr
     skeleAddr = skeleListAddr + 0x10
-    skeleNameAddr = skeleAddr + 0x1c
-    fout.write('uint', skeleListAddr, 0x8)
-    fout.write('ushort', 0x1, 0x18) # skeleton count
+    skeleNameAddr = skeleAddr + records.SKELETON.size
+    header['skeletonsListAddr'] = skeleListAddr
+    header['numSkeletons'] = 0x1
     fout.write('uint', skeleAddr, skeleListAddr)
-    fout.write('uint', skeleNameAddr, skeleAddr, offset=0)
-    # an extra bone will get added for each mesh
-    fout.write('ushort', len(bones) + len(meshes), skeleAddr, offset=0x6)
-    fout.write('ushort', len(actions), skeleAddr, offset=0x8)
-    fout.write('uint', actionListAddr, skeleAddr, offset=0xc)
     fout.write('string', arma.name, skeleNameAddr)
     sz = len(arma.name) + 1
     sz = (sz + 3) // 4 * 4
     rootAddr = skeleNameAddr + sz
-    fout.write('uint', rootAddr, skeleAddr, offset=0x10) # root bone pointer
-    nextAddr = writeBone(fout, rootAddr, bones[0]) # write bone tree
+    fout.write_record(records.SKELETON, skeleAddr,
+                      nameAddr=skeleNameAddr,
+                      # an extra bone will get added for each mesh
+                      numBones=len(bones) + len(meshes),
+                      numActions=len(actions),
+                      actionsAddr=actionListAddr,
+                      rootAddr=rootAddr)
+    writeBone(fout, rootAddr, bones[0]) # write bone tree
     print('Skeleton:', time.time() - t0)
     t0 = time.time()
 
     # meshes
-    address = fout.read('uint', rootAddr, offset=0x24)
-    while True:
-        nextSibling = fout.read('uint', address, offset=0x28)
-        if nextSibling == 0:
-            break
-        address = nextSibling
-    fout.write('uint', nextAddr, address, offset=0x28)
-    address = nextAddr
+    # skin nodes are appended to the root bone's children
+    if len(meshes) > 0:
+        lastChildAddr = fout.lookup(f'bone:{bones[0].children[-1].name}')
+        fout.write_pointer('skin:0', lastChildAddr + 0x28)
     # add skin nodes
     for i in range(len(meshes)):
-        fout.write('uint', 0x3, address, offset=0)
-        nameAddr = address + 0x3c
-        fout.write('uint', nameAddr, address, offset=0x4)
-        idx = len(bones) + i
-        fout.write('ushort', idx, address, offset=0x8)
-        fout.write('ushort', 0x18, address, offset=0xa)
-        fout.write('string', meshes[i].name, nameAddr)
         sz = len(meshes[i].name) + 1 # null terminate
         sz = (sz + 3) // 4 * 4
-        nextAddr = nameAddr + sz
+        address = fout.alloc(0x3c + sz)
+        fout.define(f'skin:{i}', address)
+        nameAddr = address + 0x3c
+        fout.write_record(records.NODE_HEADER, address,
+                          type=0x3,
+                          nameAddr=nameAddr,
+                          boneIndex=len(bones) + i,
+                          nodeFlags=0x18)
         if i < len(meshes) - 1:
-            fout.write('uint', nextAddr, address, offset=0x28)
-        address = nextAddr
-    writeMeshes(fout, rootAddr, nextAddr)
+            fout.write_pointer(f'skin:{i + 1}', address + 0x28)
+        fout.write_pointer(f'mesh:{meshes[i].name}', address + 0x30)
+        fout.write('string', meshes[i].name, nameAddr)
+    writeMeshes(fout, fout.alloc(0), meshes)
     print('Meshes:', time.time() - t0)
 
+    fout.write_record(records.SDR_HEADER, 0, **header)
     fout.close()
     print(f'\n"{arma.name}" exported successfully.')
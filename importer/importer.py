@@ -1,663 +1,17 @@
-import os, math, struct
-from mathutils import Euler, Matrix, Vector, Quaternion
+import json, math
+from mathutils import Euler, Matrix, Vector
 
-import bpy, bmesh
+import bpy
+import numpy as np
 
-from . import gtx
-from .classes import *
 from ..shared.const import *
-from ..shared.file_io import BinaryReader
+from ..shared.modelcache import ModelCache
+from ..shared.parser import parseModel
+from ..shared.texcache import TextureCache
 
-encodings = {
-        0x00: 'C4',
-        0x01: 'C8',
-        0x30: 'C14X2',
-        0x40: 'I4',
-        0x41: 'IA4',
-        0x42: 'I8',
-        0x43: 'IA8',
-        0x44: 'RGB565',
-        0x45: 'RGBA32',
-        0x90: 'RGB5A3',
-        0xB0: 'CMPR',
-    }
-
-palEncodings = {
-        0x0: 'UNUSED',
-        0x1: 'IA8', 
-        0x2: 'RGB565',
-        0x3: 'RGB5A3',
-    }
-
-mesh_dict = {}
-mat_dict = {}
-tex_dict = {}
-img_dict = {}
-anim_dict = {}
-
-def readString(file, address):
-    s = ''
-    nextChar = file.read('uchar', address)
-    while nextChar != 0:
-        s += chr(nextChar)
-        nextChar = file.read('uchar', 0, whence='current')
-    return s
-
-def toRotationMatrix(x, y, z):
-    return Euler((x, y, z), 'XYZ').to_matrix().to_4x4()
-
-def toScaleMatrix(x, y, z):
-    return Matrix.Diagonal((x, y, z)).to_4x4()
-
-def flattenIndexedDict(d):
-    return [data['object'] for addr,data in
-            sorted(d.items(), key=lambda item: item[1]['index'])]
-
-def parseTextures(file, address, numTextures):
-    for i in range(numTextures):
-        textureAddr = file.read('uint', address, offset=(4 * i))
-        imageOffset = file.read('uint', textureAddr, offset=0x28)
-        imageAddr = textureAddr + imageOffset
-        if imageAddr not in img_dict:
-            img = decompressImage(file, textureAddr, imageAddr)
-            img_dict[imageAddr] = {
-                'object': img,
-                'index': len(img_dict)
-            }
-        extrapX = file.read('uint', textureAddr, offset=0x10)
-        extrapY = file.read('uint', textureAddr, offset=0x14)
-        tex = Texture(img_dict[imageAddr]['index'], (extrapX, extrapY))
-        tex_dict[textureAddr] = {
-            'object': tex,
-            'index': len(tex_dict)
-        }
-        
-def decompressImage(file, texAddress, imageAddr):
-    width = file.read('ushort', texAddress, offset=0)
-    height = file.read('ushort', texAddress, offset=0x2)
-    encoding = file.read('uint', texAddress, offset=0x8)
-    palEncoding = file.read('uint', texAddress, offset=0xC)
-    palAddr = file.read('uint', texAddress, offset=0x48)
-    size = file.read('uint', texAddress, offset=0x4c)
-    compressedData = file.read_chunk(imageAddr, size)
-    imageData = gtx.decompress(compressedData,
-                               width, height,
-                               encodings[encoding],
-                               palEncodings[palEncoding],
-                               palAddr - imageAddr)
-    image = Image(imageData, width, height)
-    return image
-
-def parseMaterial(file, address):
-    nameAddr = file.read('uint', address, offset=0)
-    name = file.read('string', nameAddr)
-    textureAddr = file.read('uint', address, offset=0x18)
-    mat = Material(name,
-                   tex_dict[textureAddr]['index'] if textureAddr else None)
-    return mat
-
-def parseVertices(file, address, numEntries, stride):
-    vertices = []
-    for i in range(numEntries):
-        x = file.read('float', address, offset=(i * stride))
-        y = file.read('float', 0, whence='current')
-        z = file.read('float', 0, whence='current')
-        vertices.append((x, y, z))
-    return vertices
-
-def parseNormals(file, address, numEntries, stride):
-    normals = []
-    for i in range(numEntries):
-        nx = file.read('float', address, offset=(i * stride + 0xc))
-        ny = file.read('float', 0, whence='current')
-        nz = file.read('float', 0, whence='current')
-        normals.append((nx, ny, nz))
-    return normals
-
-def parseTextureCoords(file, address, numEntries, stride):
-    texcoords = []
-    for i in range(numEntries):
-        x = file.read('float', address, offset=(i * stride))
-        # mirror vertically
-        y = 1.0 - file.read('float', 0, whence='current')
-        texcoords.append((x, y))
-    return texcoords
-
-def parseActions(file, address, numActions):
-    for i in range(numActions):
-        actionAddr = address + i * 0x30
-        nameAddr = file.read('uint', actionAddr)
-        name = file.read('string', nameAddr)
-        anim_dict[i] = {'name': name,
-                        'bones': {}}
-
-# these are the types used in the game code as far as I can tell
-keyframeDataTypes = {
-    0 : 'float',
-    2 : 'quat',
-    5 : 'uchar',
-    6 : 'char',
-    7 : 'ushort',
-    8 : 'short', 
-}
-# for vector quantities, component 0 implies 3 component float and 4, 5, 6 imply 2 component float values
-
-# these data types are suggested by some setup code
-# they could correspond to the types implied by certain components
-unknownKeyFrameDataTypes = {
-    1 : 'unknown 1',
-    3 : 'unknown 3',
-    4 : 'unknown 4',
-    10 : 'unknown 10',
-    11 : 'unknown 11',
-}
-
-def parseFCurves(file, address, boneName):
-    nextAddr = address
-    while nextAddr != 0:
-        actionIndex = file.read('ushort', nextAddr, offset=0)
-        numFCurves = file.read('ushort', nextAddr, offset=0x2)
-        fcurveListAddr = file.read('uint', nextAddr, offset=0x4)
-        anim_dict[actionIndex]['bones'][boneName] = []
-        for i in range(numFCurves):
-            fcurveAddr = fcurveListAddr + i * 0x10
-            axis = file.read('uchar', fcurveAddr, offset=0x2)
-            if axis == 0:
-                # implies vec3 values
-                dataType = 'vec3'
-            elif (axis == 4 or axis == 5 or axis == 6):
-                # the actual ingame implementation of this looks broken so I don't expect it to be used outside of texture animation which uses different code
-                print('vec2 animation found in 3d anim: ', boneName)
-
-            compIndex = file.read('uchar', fcurveAddr, offset=0x1)
-            dataType = file.read('uchar', fcurveAddr, offset=0x6)
-            if dataType in keyframeDataTypes:
-                dataType = keyframeDataTypes[dataType]
-            elif dataType in unknownKeyFrameDataTypes:
-                print('found one of the expected but undocumented data types: ', dataType)
-            else:
-                print('completely undocumented data type: ', dataType)
-            channelIndex = file.read('uchar', fcurveAddr, offset=0x3)
-            unkIndex = file.read('uchar', fcurveAddr, offset=0x4)
-            idk = file.read('uchar', fcurveAddr, offset=0x0)
-            if compIndex >= 3:
-                print(f'Unknown component type: {compIndex} ({boneName}, {hex(fcurveAddr)})')
-                continue
-            component = ['location', 'rotation_euler', 'scale'][compIndex]
-            exp = file.read('uchar', fcurveAddr, offset=0x7)
-            if dataType == 'float' or dataType == 'quat' or dataType == 'vec3' or dataType == 'vec2':
-                # float values, no scaling required
-                exp = 0.0
-            keyframeAddr = file.read('uint', fcurveAddr, offset=0x8)
-            keyframes = parseKeyframes(file, keyframeAddr, exp, dataType)
-            if len(keyframes) == 0:
-                continue
-            fcurve = {'axis': axis,
-                      'component': component,
-                      'keyframes': keyframes}
-            anim_dict[actionIndex]['bones'][boneName].append(fcurve)
-        nextAddr = file.read('uint', nextAddr, offset=0xc)
-
-def parseKeyframes(file, address, scale_exp, dataType):
-    valsAddr = file.read('uint', address, offset=0)
-    derivsAddr = file.read('uint', address, offset=0x4)
-    valueCount = file.read('ushort', address, offset=0x8)
-    keyframesAddr = file.read('uint', address, offset=0x10)
-    numKeyframes = file.read('ushort', address, offset=0x14)
-    keyframes = []
-    if numKeyframes > 0:
-        for i in range(numKeyframes):
-            keyframeAddr = keyframesAddr + i * 0xc
-            interpIndex = file.read('ushort', keyframeAddr)
-            interpolation = ['CONSTANT', 'LINEAR', 'BEZIER'][interpIndex]
-            valueIndex = file.read('ushort', keyframeAddr, offset=0x2)
-            value = readKeyframeValue(file, dataType, valsAddr, valueIndex)
-            if derivsAddr > 0:
-                if dataType == 'quat' or dataType == 'vec3' or dataType == 'vec2':
-                    derivLIndex = file.read('ushort', keyframeAddr, offset=0x4)
-                    derivLeft = readKeyframeValue(file, dataType, derivsAddr, derivLIndex)
-                    derivRIndex = file.read('ushort', keyframeAddr, offset=0x6)
-                    derivRight = readKeyframeValue(file, dataType, derivsAddr, derivRIndex)
-                else:
-                    derivLIndex = file.read('ushort', keyframeAddr, offset=0x4)
-                    derivLeft = file.read('float', derivsAddr, offset=(4 * derivLIndex))
-                    derivRIndex = file.read('ushort', keyframeAddr, offset=0x6)
-                    derivRight = file.read('float', derivsAddr, offset=(4 * derivRIndex))
-            else:
-                print('derivative data not present even though it should be ...')
-                derivLeft = 0.0
-                derivRight = 0.0
-            time = file.read('float', keyframeAddr, offset=0x8)
-            keyframe = {'value': value / (2 ** scale_exp),
-                        'derivativeL': derivLeft,
-                        'derivativeR': derivRight,
-                        'interpolation': interpolation,
-                        'time': time}
-            keyframes.append(keyframe)
-    elif valueCount > 0:
-        # "keyframe" animation. stores data for each individual frame
-        # probably used for baked data, such as animation data from constraints and IK
-        framerate = file.read('ushort', address, offset=0x16) & 0xFF
-        for i in range(valueCount):
-            value = readKeyframeValue(file, dataType, valsAddr, i)
-            time = (0.5 + (i - 1)) / framerate
-            keyframe = {'value': value / (2 ** scale_exp),
-                        'derivativeL': 0.0,
-                        'derivativeR': 0.0,
-                        'interpolation': 'CONSTANT',
-                        'time': time}
-            keyframes.append(keyframe)
-    return keyframes
-
-def readKeyframeValue(file, type, baseAdress, index):
-
-    if BinaryReader.is_primitive(type):
-        size = BinaryReader.primitive_size(type)
-        return file.read(type, baseAdress, offset=(size * index))
-    elif type == 'quat' or type == 'vec3' or type == 'vec2':
-        # multicomponent stuff needs to be handled separately
-        size = 4
-        if type == 'vec2':
-            n = 2
-            return Vector([file.read(type, baseAdress, offset=(size * (index * n + i))) for i in range(n)])
-        elif type == 'vec3':
-            n = 3
-            return Vector([file.read(type, baseAdress, offset=(size * (index * n + i))) for i in range(n)])
-        elif type == 'quat':
-            n = 4
-            return Quaternion([file.read(type, baseAdress, offset=(size * (index * n + i))) for i in range(n)])
-    else:
-        print('unknown data type: ', type)
-        return None
-
-def parseWeights(file, address):
-    weights = []
-    
-    n = file.read('ushort', address, offset=0)
-    addr1 = file.read('uint', address, offset=0x4)
-    file.seek(addr1)
-    for i in range(n):
-        numVerts = file.read('ushort', 0, whence='current')
-        bone1 = file.read('ushort', 0, whence='current')
-        for j in range(numVerts):
-            weights.append({bone1: 1.0})
-
-    n = file.read('ushort', address, offset=0x8)
-    addr1 = file.read('uint', address, offset=0xc)
-    addr2 = file.read('uint', address, offset=0x10)
-    count = 0
-    for i in range(n):
-        numVerts = file.read('ushort', addr1, offset=(6 * i))
-        bone1 = file.read('ushort', 0, whence='current')
-        bone2 = file.read('ushort', 0, whence='current')
-        file.seek(addr2 + 2 * count)
-        for j in range(numVerts):
-            # weights need to be normalized
-            w = file.read('ushort', 0, whence='current') / 0xffff
-            weights.append({bone1: w, bone2: 1 - w})
-        count += numVerts
-
-    n = file.read('ushort', address, offset=0x14)
-    addr1 = file.read('uint', address, offset=0x18)
-    file.seek(addr1)
-    for i in range(n):
-        vertNum = file.read('ushort', 0, whence='current')
-        bone1 = file.read('ushort', 0, whence='current')
-        bone2 = file.read('ushort', 0, whence='current')
-        # weights need to be normalized
-        w1 = file.read('ushort', 0, whence='current') / 0xffff
-        w2 = file.read('ushort', 0, whence='current') / 0xffff
-        for bone in weights[vertNum]:
-            weights[vertNum][bone] *= (1 - w1 - w2)
-        weights[vertNum][bone1] = w1
-        if bone2 != 0xffff:
-            weights[vertNum][bone2] = w2
-            
-    return weights
-
-def parseFaces(file, address, numGroups, vertAttrs):
-    faces = []
-    file.seek(address)
-    for i in range(numGroups):
-        op = file.read('uchar', 0, whence='current')
-        count = file.read('ushort', 0, whence='current')
-        vertices = []
-        for j in range(count):
-            v = n = t = None
-            for attr in vertAttrs:
-                idx = file.read('ushort', 0, whence='current')
-                if attr == GX_VA_POS:
-                    v = idx
-                elif attr in [GX_VA_NRM, GX_VA_NBT]:
-                    n = idx
-                elif attr == GX_VA_TEX0:
-                    t = idx
-            vertices.append((v, n, t))
-        
-        if op == GX_DRAW_QUADS:
-            for i in range(0, count, 4):
-                faces.append(
-                    Face(*zip(vertices[i+1], vertices[i], vertices[i+2])))
-                faces.append(
-                    Face(*zip(vertices[i+2], vertices[i], vertices[i+3])))
-        elif op == GX_DRAW_TRIANGLES:
-            for i in range(0, count, 3):
-                faces.append(
-                    Face(*zip(vertices[i+1], vertices[i], vertices[i+2])))
-        elif op == GX_DRAW_TRIANGLE_STRIP:
-            for i in range(count - 2):
-                if i % 2 == 0:
-                    faces.append(
-                        Face(*zip(vertices[i+1], vertices[i], vertices[i+2])))
-                else:
-                    faces.append(
-                        Face(*zip(vertices[i], vertices[i+1], vertices[i+2])))
-        else:
-            raise Exception(f"Unknown opcode '{k}' at offset {hex(file.tell())}")
-    return faces
-
-def parseMesh(file, address):
-    meshAddr = file.read('uint', address, offset=0x18)
-    parts = []
-    for mesh in parseMeshPart(file, meshAddr):
-        parts.append(mesh)
-    vertStride = max([part.vertStride for part in parts])
-    assert vertStride != 0
-    assert all([part.vertStride == vertStride for part in parts])
-    texStride = max([part.texStride for part in parts])
-    assert all([part.texStride == 0 or part.texStride == texStride
-                for part in parts])
-    
-    # vertices
-    numVertices = file.read('ushort', address, offset=0x2)
-    verticesAddr = file.read('uint', address, offset=0x8)
-    v = parseVertices(file, verticesAddr, numVertices, vertStride)
-    # vertex normals
-    n = parseNormals(file, verticesAddr, numVertices, vertStride)
-    # texture coordinates
-    uvLayerAddr = file.read('uint', address, offset=0x14)
-    t = None
-    if uvLayerAddr != 0 and texStride > 0:
-        texCoordsAddr = file.read('uint', uvLayerAddr, offset=0)
-        numTexCoords = file.read('ushort', uvLayerAddr, offset=0x4)
-        t = parseTextureCoords(file, texCoordsAddr, numTexCoords, texStride)
-
-    # bone weights
-    boneWeightsAddr = file.read('uint', address, offset=0xc)
-    if boneWeightsAddr != 0:
-        w = parseWeights(file, boneWeightsAddr)
-    else:
-        w = None
-
-    meshGroup = Mesh(v, n, t, w)
-    meshGroup.parts = parts
-    return meshGroup
-
-def parseMeshPart(file, address):
-    vertInfoAddr = file.read('uint', address, offset=0x10)
-    vas = {}
-    va = list(file.read_chunk(vertInfoAddr, 6))
-    while va[0] != 0xff:
-        vas[va[0]] = va
-        va = list(file.read_chunk(0x2, 6, whence='current'))
-    
-    materialAddr = file.read('uint', address, offset=0x8)
-    numGroups = file.read('ushort', address, offset=0xc)
-    facesAddr = file.read('uint', address, offset=0x14)
-    f = parseFaces(file, facesAddr, numGroups, vas)
-    mesh = MeshPart(f, mat_dict[materialAddr]['index'])
-    if GX_VA_POS in vas:
-        mesh.vertStride = vas[GX_VA_POS][5]
-    if GX_VA_TEX0 in vas:
-        mesh.texStride = vas[GX_VA_TEX0][5]
-    yield mesh
-    
-    # check if there is a next part of the mesh
-    nextMeshAddr = file.read('uint', address, offset=0x1c)
-    if nextMeshAddr != 0:
-        for mesh in parseMeshPart(file, nextMeshAddr):
-            yield mesh
-
-def parseSkeleton(file, address, useDefaultPose=False, sceneSettings=None):
-    objNameAddr = file.read('uint', address, offset=0)
-    name = file.read('string', objNameAddr)
-    # actions
-    actionsAddr = file.read('uint', address, offset=0xc)
-    numActions = file.read('ushort', address, offset=0x8)
-    parseActions(file, actionsAddr, numActions)
-    # bones
-    numBones = file.read('ushort', address, offset=0x6)
-    rootAddr = file.read('uint', address, offset=0x10)
-    bones = [None] * numBones
-    rootBone = next(parseBones(file, rootAddr, bones, useDefaultPose, sceneSettings))
-    return Skeleton(name, numBones, bones)
-
-def parseBones(file, address, bones, useDefaultPose=False, sceneSettings=None):
-    k = file.read('uint', address, offset=0)
-    nameAddr = file.read('uint', address, offset=0x4)
-    name = file.read('string', nameAddr)
-    idx = file.read('ushort', address, offset=0x8)
-    nodeFlags = file.read('ushort', address, offset=0xA)
-
-    if k == 2:
-        boneFlags = file.read('uint', address, offset=0x30)
-    else:
-        boneFlags = 0
-    
-
-    i = 1
-    blenderName = name
-    boneNames = [bone.name for bone in bones if bone]
-    while blenderName in boneNames:
-        blenderName = f'{name}.{i:03d}'
-        i += 1
-    name = blenderName
-
-    pos = Matrix.Identity(4)
-    posAddr = file.read('uint', address, offset=0xc)
-    if posAddr != 0:
-        x = file.read('float', posAddr)
-        y = file.read('float', 0, whence='current')
-        z = file.read('float', 0, whence='current')
-        pos = Matrix.Translation((x, y, z))
-    else:
-        pos = Matrix.Identity(4)
-        (x, y, z) = (0, 0, 0)
-    
-    if useDefaultPose:
-        rotAddr = file.read('uint', address, offset=0x10)
-        if rotAddr != 0:
-            rx = file.read('float', rotAddr)
-            ry = file.read('float', 0, whence='current')
-            rz = file.read('float', 0, whence='current')
-            rot = toRotationMatrix(rx, ry, rz)
-        else:
-            rot = Matrix.Identity(4)
-            (rx, ry, rz) = (0, 0, 0)
-    else:
-        rot = Matrix.Identity(4)
-        (rx, ry, rz) = (0, 0, 0)
-    
-    scaAddr = file.read('uint', address, offset=0x14)
-    if scaAddr != 0:
-        file.seek(scaAddr)
-        sx = file.read('float', scaAddr)
-        sy = file.read('float', 0, whence='current')
-        sz = file.read('float', 0, whence='current')
-        sca = toScaleMatrix(sx, sy, sz)
-    else:
-        sca = Matrix.Identity(4)
-        (sx, sy, sz) = (1, 1, 1)
-
-
-    sp = Vector((0.0, 0.0, 0.0))
-    st = Vector((0.0, 0.0, 0.0))
-    rp = Vector((0.0, 0.0, 0.0))
-    rt = Vector((0.0, 0.0, 0.0))
-    pivots = [sp, st, rp, rt]
-    
-    if k == 0x2:
-        # bind pose rotation
-        brx = file.read('float', address, offset=0x34)
-        bry = file.read('float', 0, whence='current')
-        brz = file.read('float', 0, whence='current')
-        rot2 = toRotationMatrix(brx, bry, brz)
-        orot = rot
-        rot = rot2 @ rot
-        # inverse bind matrix
-        mat = []
-        file.seek(address + 0x44)
-        for r in range(3):
-            row = []
-            for c in range(4):
-                row.append(file.read('float', 0, whence='current'))
-            mat.append(row)
-        mat.append([0.0, 0.0, 0.0, 1.0])
-    else:
-        transPointer = file.read('uint', address, offset=0x18)
-        if transPointer:
-            print("MAYA MEME DETECTED IN ", name)
-            precomputed = sceneSettings['precomputedPivots']
-            file.seek(transPointer)
-            if precomputed:
-                length = 3
-                rt[0] = rt[1] = rt[2] = float('inf')
-            else:
-                length = 4 #len(pivots)
-
-            for i in range(length):
-                V = pivots[i]
-                for j in range(3):
-                    V[j] = file.read('float', 0, whence='current')
-
-        mat = [[1.0, 0.0, 0.0, 0.0],
-               [0.0, 1.0, 0.0, 0.0],
-               [0.0, 0.0, 1.0, 0.0],
-               [0.0, 0.0, 0.0, 1.0]]
-        rot2 = Matrix.Identity(4)
-        orot = Matrix.Identity(4)
-
-    mat = Matrix(mat)
-    bone = Bone(idx, name, k, pivots, (pos @ rot @ sca), mat, rot2, (rx, ry, rz), (sx, sy, sz), (x, y, z), nodeFlags, boneFlags)
-    bone.type = k
-    bone.idk1 = file.read('uint', address, offset=0x40)
-    bone.idk2 = file.read('uint', address, offset=0x74)
-    bones[idx] = bone
-
-    animDataAddr = file.read('uint', address, offset=0x20)
-    if animDataAddr != 0:
-        parseFCurves(file, animDataAddr, name)
-    
-    childAddr = file.read('uint', address, offset=0x24)
-    if childAddr != 0:
-        for child in parseBones(file, childAddr, bones, useDefaultPose, sceneSettings):
-            bone.childIndices.append(child.index)
-            child.parentIndex = idx
-            
-    if k == 0x3: # skin node
-        meshAddr = file.read('uint', address, offset=0x30)
-        # very hack-y fix to a bug I need to look closer at
-        meshStartAddr = file.read('uint', meshAddr, offset=0x18)
-        if meshStartAddr != 0:
-            if meshAddr not in mesh_dict:
-                mesh_dict[meshAddr] = {
-                    'object': parseMesh(file, meshAddr),
-                    'index': len(mesh_dict)
-                }
-            bone.meshIndex = mesh_dict[meshAddr]['index']
-    yield bone
-    
-    nextAddr = file.read('uint', address, offset=0x28)
-    if nextAddr != 0:
-        for sibling in parseBones(file, nextAddr, bones, useDefaultPose, sceneSettings):
-            yield sibling
-
-def parseModel(path, useDefaultPose=False):
-    global mesh_dict, mat_dict, tex_dict, img_dict, anim_dict
-    mesh_dict = {}
-    mat_dict = {}
-    tex_dict = {}
-    img_dict = {}
-    anim_dict = {}
-
-    file = BinaryReader(path)
-
-    # skeleton
-    skeletons = []
-
-    if path[-4:] == '.mdr':
-        texturesListAddr = file.read('uint', 0x8)
-        numTextures = file.read('ushort', 0xc)
-        parseTextures(file, texturesListAddr, numTextures)
-
-        materialAddr = file.read('uint', 0x18)
-        mat_dict[materialAddr] = {
-            'object': parseMaterial(file, materialAddr),
-            'index': len(mat_dict)
-        }
-
-    elif path[-4:] == '.odr':
-        texturesListAddr = file.read('uint', 0xc)
-        numTextures = file.read('ushort', 0x18)
-        parseTextures(file, texturesListAddr, numTextures)
-
-        idk = file.read('uchar', 0x0)
-        idk1 = file.read('ushort', 0x2)
-        idk2 = file.read('uchar', 0x4)
-
-        sceneSettings = {'precomputedPivots': (idk < 1) or (idk1 < 3) or (idk2 == 0)}
-
-        materialsListAddr = file.read('uint', 0x14)
-        numMaterials = file.read('ushort', 0x1c)
-        for i in range(numMaterials):
-            materialAddr = file.read('uint', materialsListAddr, offset=(4 * i))
-            mat_dict[materialAddr] = {
-                'object': parseMaterial(file, materialAddr),
-                'index': len(mat_dict)
-            }
-
-        skeletonHeaderAddr = file.read('uint', 0x8)
-        skele = parseSkeleton(file, skeletonHeaderAddr, useDefaultPose, sceneSettings)
-        skeletons.append(skele)
-    else:
-        texturesListAddr = file.read('uint', 0xc)
-        numTextures = file.read('ushort', 0x1a)
-        parseTextures(file, texturesListAddr, numTextures)
-
-        idk = file.read('uchar', 0x0)
-        idk1 = file.read('ushort', 0x2)
-        idk2 = file.read('uchar', 0x4)
-
-        sceneSettings = {'precomputedPivots': (idk < 1) or (idk1 < 3) or (idk2 == 0)}
-
-        materialsListAddr = file.read('uint', 0x14)
-        numMaterials = file.read('ushort', 0x1e)
-        for i in range(numMaterials):
-            materialAddr = file.read('uint', materialsListAddr, offset=(4 * i))
-            mat_dict[materialAddr] = {
-                'object': parseMaterial(file, materialAddr),
-                'index': len(mat_dict)
-            }
-
-        skeletonsListAddrPtr = file.read('uint', 0x8)
-        numSkeletons = file.read('ushort', 0x18)
-        for i in range(numSkeletons):
-            skeletonHeaderAddr = file.read('uint', skeletonsListAddrPtr + 4 * i)
-            skele = parseSkeleton(file, skeletonHeaderAddr, useDefaultPose, sceneSettings)
-            skeletons.append(skele)
-        
-    
-    file.close()
-    
-    sdr = {
-        'skeletons': skeletons,
-        'meshes': flattenIndexedDict(mesh_dict),
-        'materials': flattenIndexedDict(mat_dict),
-        'textures': flattenIndexedDict(tex_dict),
-        'images': flattenIndexedDict(img_dict),
-        'actions': anim_dict
-    }
-    return sdr
+def toMatrix(m):
+    # the parser's matrices are NumPy arrays
+    return Matrix(m.tolist())
 
 def createExtensionNodes(node_tree, extension_x, extension_y):
     texCoord = node_tree.nodes.new('ShaderNodeTexCoord')
@@ -683,15 +37,19 @@ def createExtensionNodes(node_tree, extension_x, extension_y):
     node_tree.links.new(mathNodeY.outputs['Value'], combineXYZ.inputs['Y'])
     return combineXYZ
 
-def createMaterial(matData, texData, image):
+def createMaterial(matData, texData, image, simple=False):
     mat = bpy.data.materials.new(matData.name)
     mat.use_nodes = True
     bsdf = mat.node_tree.nodes['Principled BSDF']
     texImage = mat.node_tree.nodes.new('ShaderNodeTexImage')
     texImage.image = image
-    texImage.extension = 'EXTEND'
-    extension = createExtensionNodes(mat.node_tree, *texData.extensionType)
-    mat.node_tree.links.new(extension.outputs['Vector'], texImage.inputs['Vector'])
+    if simple:
+        # close enough for previews, without the extension nodes
+        texImage.extension = 'REPEAT'
+    else:
+        texImage.extension = 'EXTEND'
+        extension = createExtensionNodes(mat.node_tree, *texData.extensionType)
+        mat.node_tree.links.new(extension.outputs['Vector'], texImage.inputs['Vector'])
     mat.node_tree.links.new(texImage.outputs['Color'], bsdf.inputs['Base Color'])
     mat.node_tree.links.new(texImage.outputs['Alpha'], bsdf.inputs['Alpha'])
     mat.use_backface_culling = True
@@ -700,32 +58,21 @@ def createMaterial(matData, texData, image):
 
 def uvMap(obj, meshData, partData, material):
     obj.data.materials.append(material)
-    bpy.ops.object.mode_set(mode='EDIT')
-    bm = bmesh.from_edit_mesh(obj.data)
-    uv_layer = bm.loops.layers.uv.verify()
-    for face in bm.faces:
-        for loop in face.loops:
-            fdata = partData.faces[face.index]
-            idx = fdata.getMatchingTexCoord(loop.vert.index)
-            loop[uv_layer].uv = meshData.texCoords[idx]
-    bpy.ops.object.mode_set(mode='OBJECT')
+    uv_layer = obj.data.uv_layers.new()
+    # loops are in the faces' corner order
+    uvs = partData.loopTexCoords(meshData)
+    uv_layer.data.foreach_set('uv', np.ascontiguousarray(uvs, np.float32).reshape(-1))
 
 def applyWeights(meshData, bones):
-    vertices = []
-    normals = []
-    for i in range(len(meshData.vertices)):
-        transform = Matrix.Diagonal((0, 0, 0, 0))
-        for idx, w in meshData.weights[i].items():
-            transform = transform + \
-                         w * (Matrix.Identity(4))
-        #                w * (bones[idx].globalTransform @ \
-        #                     bones[idx].inverseBindMatrix)
-        #                 w * (bones[idx].inverseBindMatrix)
-        vert = transform @ Vector(meshData.vertices[i])
-        vertices.append(tuple(vert))
-        transform = transform.to_3x3() # remove translation
-        norm = (transform @ Vector(meshData.vertNormals[i])).normalized()
-        normals.append(tuple(norm))
+    # each vertex is scaled by its total weight; the bone transforms
+    # (bones[idx].globalTransform @ bones[idx].inverseBindMatrix)
+    # aren't applied yet
+    total = np.array([sum(weights.values()) for weights in meshData.weights],
+                     np.float32).reshape(-1, 1)
+    vertices = meshData.vertices * total
+    normals = meshData.vertNormals * total
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
     return vertices, normals
 
 def makeMesh(meshData, partData, bones):
@@ -736,15 +83,24 @@ def makeMesh(meshData, partData, bones):
     else:
         v = meshData.vertices
         n = meshData.vertNormals
-    f = [face.vertexIndices for face in partData.faces]
-    m.from_pydata(v, [], f)
+    faces = partData.vertexIndices
+    numLoops = faces.size
+    m.vertices.add(len(v))
+    m.vertices.foreach_set('co', np.ascontiguousarray(v, np.float32).reshape(-1))
+    m.loops.add(numLoops)
+    m.loops.foreach_set('vertex_index', np.ascontiguousarray(faces, np.int32).reshape(-1))
+    m.polygons.add(len(faces))
+    m.polygons.foreach_set('loop_start', np.arange(0, numLoops, 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        m.polygons.foreach_set('loop_total', np.full(len(faces), 3, np.int32))
+    m.update(calc_edges=True)
     # set mesh vertex normals
-    m.use_auto_smooth = True
-    m.normals_split_custom_set_from_vertices(meshData.vertNormals) 
+    if bpy.app.version < (4, 1, 0):
+        m.use_auto_smooth = True
+    m.normals_split_custom_set_from_vertices(
+        np.ascontiguousarray(meshData.vertNormals, np.float32))
     return m
 
-
-
 def makeAction(actionData, arma, skele):
     sampleFramerate = max(60, bpy.context.scene.render.fps) # hardcoded for now
     action = bpy.data.actions.new(actionData['name'])
@@ -845,14 +201,14 @@ def makeAction(actionData, arma, skele):
                 relativeBind = b.bone.matrix_local
 
             invRelativeBind = relativeBind.inverted()
-            jointOrientation = bone.bindRotation
+            jointOrientation = toMatrix(bone.bindRotation)
 
             # scale corrections for blender
-            s = bone.inverseBindMatrix.inverted().to_scale()
+            s = toMatrix(bone.inverseBindMatrix).inverted().to_scale()
             C_1 = Matrix.Diagonal((1 / s[0], 1 / s[1], 1 / s[2], 1.0))
             
             if b.parent:
-                s = bone.invparentBind.inverted().to_scale()
+                s = toMatrix(bone.invparentBind).inverted().to_scale()
                 C_2 = Matrix.Diagonal((s[0], s[1], s[2], 1.0))
             
             # sample curves and calculate values corrected for the edit bone transformation
@@ -910,9 +266,9 @@ def makeAction(actionData, arma, skele):
                 T_2 = bone.ScalePivot + bone.ScalePivotTranslate - bone.RotatePivot
                 T_3 = bone.RotatePivot + bone.RotationPivotTranslate
 
-            T_1 = Matrix.Translation(T_1)
-            T_2 = Matrix.Translation(T_2)
-            T_3 = Matrix.Translation(T_3)
+            T_1 = Matrix.Translation(Vector(T_1))
+            T_2 = Matrix.Translation(Vector(T_2))
+            T_3 = Matrix.Translation(Vector(T_3))
 
             local = bone.localTransform
             if b.parent:
@@ -972,28 +328,30 @@ def makeObject(context, meshData, partData, material, bones, meshBone):
     # UV map object
     if partData.texStride > 0:
         uvMap(o, meshData, partData, material)
-    # define vertex groups
+    # define vertex groups, adding vertices w/ the same weight together
     if meshData.weights is not None:
-        for i in range(len(meshData.vertices)):
-            for idx, w in meshData.weights[i].items():
-                name = bones[idx].name
-                if name not in o.vertex_groups:
-                    o.vertex_groups.new(name=name)
-                o.vertex_groups[name].add([i], w, 'REPLACE')
+        influences = {}
+        for i, weights in enumerate(meshData.weights):
+            for idx, w in weights.items():
+                influences.setdefault((idx, w), []).append(i)
+        for (idx, w), indices in influences.items():
+            name = bones[idx].name
+            if name not in o.vertex_groups:
+                o.vertex_groups.new(name=name)
+            o.vertex_groups[name].add(indices, w, 'REPLACE')
     else:
         # rigid skin
         name = meshBone.name
-        for i in range(len(meshData.vertices)):
-            if name not in o.vertex_groups:
-                o.vertex_groups.new(name=name)
-            o.vertex_groups[name].add([i], 1.0, 'REPLACE')
+        if name not in o.vertex_groups:
+            o.vertex_groups.new(name=name)
+        o.vertex_groups[name].add(list(range(len(meshData.vertices))), 1.0, 'REPLACE')
     return o
 
 def makeArmature_r(edit_bones, bones, boneIndex):
     boneData = bones[boneIndex]
     bone = edit_bones.new(boneData.name)
     bone.tail = (0, 0, 0.5) # length = 0.5
-    bone.matrix = boneData.inverseBindMatrix.inverted()
+    bone.matrix = toMatrix(boneData.inverseBindMatrix).inverted()
     for childIndex in boneData.childIndices:
         child = makeArmature_r(edit_bones, bones, childIndex)
         child.parent = bone
@@ -1022,19 +380,19 @@ def makeArmature(context, skele):
         if b.name != bone.name:
             print("DUPLICATE BONE NAME: ", b.name, " ", bone.name)
 
-        local = bone.localTransform
+        local = toMatrix(bone.localTransform)
         if b.parent:
             relativeBind = b.parent.bone.matrix_local.inverted() @ b.bone.matrix_local
         else:
             relativeBind = b.bone.matrix_local
 
         # scale corrections for blender
-        s = bone.inverseBindMatrix.to_scale()
+        s = toMatrix(bone.inverseBindMatrix).to_scale()
         C = Matrix.Diagonal((s[0], s[1], s[2], 1.0))
         local = local @ C
         
         if b.parent:
-            s = bone.invparentBind.to_scale()
+            s = toMatrix(bone.invparentBind).to_scale()
             C = Matrix.Diagonal((1 / s[0], 1 / s[1], 1 / s[2], 1.0))
             local = C @ local
 
@@ -1046,16 +404,47 @@ def makeArmature(context, skele):
     
     return arma
 
-def importSDR(context, path, useDefaultPose=False, joinMeshes=False):
-    model_data = parseModel(path, useDefaultPose)
+def importSDR(context, path, useDefaultPose=False, joinMeshes=False, traceIO=False,
+              cacheDir=None, cacheSize=0, decodeWorkers=1, previewScale=1,
+              modelCacheDir=None, modelCacheSize=0, version=()):
+    # previews (`previewScale` > 1) have textures at 1/previewScale
+    # resolution, simplified materials and no animations
+    preview = previewScale > 1
+    options = {'useDefaultPose': useDefaultPose,
+               'textureStep': previewScale,
+               'parseAnimations': not preview}
+
+    # traces need the file to actually be parsed
+    modelCache = None
+    if modelCacheDir and modelCacheSize > 0 and not traceIO:
+        modelCache = ModelCache(modelCacheDir, modelCacheSize, version)
+        key = modelCache.key(path, **options)
+        model_data = modelCache.get(key)
+        print('Model cache: ' + ('hit' if modelCache.hits else 'miss'))
+
+    if modelCache is None or model_data is None:
+        textureCache = None
+        if cacheDir and cacheSize > 0:
+            textureCache = TextureCache(cacheDir, cacheSize)
+        model_data = parseModel(path, traceIO=traceIO, textureCache=textureCache,
+                                decodeWorkers=decodeWorkers, **options)
+        if textureCache is not None:
+            print(f'Texture cache: {textureCache.hits} hit(s), ' + \
+                  f'{textureCache.misses} miss(es)')
+        if modelCache is not None:
+            modelCache.put(key, model_data)
 
     # save images
     images = model_data['images']
     for i in range(len(images)):
         img = images[i]
         image = bpy.data.images.new(f'image{i}', img.width, img.height)
-        # Blender expects values to be normalized
-        image.pixels = [(x / 255) for x in img.pixels][:len(image.pixels)]
+        # Blender expects values to be normalized; decoded data can
+        # be longer than the image (padding rows) or short of it
+        pixels = np.zeros(len(image.pixels), np.float32)
+        n = min(len(pixels), len(img.pixels))
+        np.divide(img.pixels[:n], 255, out=pixels[:n])
+        image.pixels.foreach_set(pixels)
         #path = f'{os.path.dirname(path)}/texture{i}.png'
         #image.filepath_raw = path
         #image.file_format = 'PNG'
@@ -1071,7 +460,7 @@ def importSDR(context, path, useDefaultPose=False, joinMeshes=False):
         if mat.textureIndex is not None:
             tex = textures[mat.textureIndex]
             img = images[tex.imageIndex]
-            materials[i] = createMaterial(mat, tex, img)
+            materials[i] = createMaterial(mat, tex, img, simple=preview)
         else:
             materials[i] = bpy.data.materials.new('empty')
 
@@ -1083,8 +472,8 @@ def importSDR(context, path, useDefaultPose=False, joinMeshes=False):
         arma.animation_data_create()
         for bone in arma.pose.bones:
             bone.rotation_mode = 'XYZ'
-        for action in anim_dict:
-            makeAction(anim_dict[action], arma, skele)
+        for actionData in model_data['actions'].values():
+            makeAction(actionData, arma, skele)
         arma.select_set(False)
         # create meshes
         for bone in skele.bones:
@@ -1106,3 +495,7 @@ def importSDR(context, path, useDefaultPose=False, joinMeshes=False):
                 context.view_layer.objects.active = arma
                 bpy.ops.object.parent_set(type='ARMATURE')
         arma.rotation_euler = Euler((math.pi / 2, 0, 0), 'XYZ')
+
+    if traceIO:
+        with open(path + '.iotrace.json', 'w') as f:
+            json.dump(model_data['trace'], f, indent=2)
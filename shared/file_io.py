@@ -1,79 +1,233 @@
-import struct
+import mmap, os, re, struct, sys
+from functools import lru_cache
+from itertools import chain
+
+import numpy as np
+
+# precompiled structs for each primitive type (big-endian)
+primitive_structs = {
+    'uchar'  : struct.Struct('>B'),
+    'char'   : struct.Struct('>b'),
+    'ushort' : struct.Struct('>H'),
+    'short'  : struct.Struct('>h'),
+    'uint'   : struct.Struct('>I'),
+    'int'    : struct.Struct('>i'),
+    'float'  : struct.Struct('>f'),
+    'double' : struct.Struct('>d'),
+}
+
+def _primitive_struct(type):
+    try:
+        return primitive_structs[type]
+    except KeyError:
+        raise ValueError(f'Invalid value for arg `type`: {type}') from None
+
+@lru_cache(maxsize=256)
+def _array_struct(type, count):
+    code = _primitive_struct(type).format[-1]
+    return struct.Struct(f'>{count}{code}')
+
+@lru_cache(maxsize=64)
+def _strided_struct(type, stride):
+    s = _primitive_struct(type)
+    return struct.Struct(f'>{s.format[-1]}{stride - s.size}x')
+
+@lru_cache(maxsize=256)
+def _compile_format(fmt):
+    # default to big-endian if no byte order is given
+    if fmt[:1] not in '@=<>!':
+        fmt = '>' + fmt
+    return struct.Struct(fmt)
 
 class BinaryReader:
     """
     Wrapper class to simplify reading data of various types
     from a binary file (assumes big-endian byte order)
     """
-    
+
     def __init__(self, path):
         self.file = open(path, 'rb')
+        if os.fstat(self.file.fileno()).st_size > 0:
+            self.buffer = mmap.mmap(self.file.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+        else:
+            # empty files can't be memory-mapped
+            self.buffer = b''
+        self.pos = 0
+        # decoded strings keyed by address
+        self.strings = {}
 
     def read(self, type, base, offset=0, whence='start'):
         """
         Reads data of type `type` from `base` + `offset`
         relative to `whence` ('start' or 'current')
         """
-        self.seek(base + offset, whence)
-        
-        if type == 'uchar':
-            return struct.unpack('>B', self.file.read(1))[0]
-        if type == 'ushort':
-            return struct.unpack('>H', self.file.read(2))[0]
-        if type == 'uint':
-            return struct.unpack('>I', self.file.read(4))[0]
-        if type == 'char':
-            return struct.unpack('>b', self.file.read(1))[0]
-        if type == 'short':
-            return struct.unpack('>h', self.file.read(2))[0]
-        if type == 'int':
-            return struct.unpack('>i', self.file.read(4))[0]
-        if type == 'float':
-            return struct.unpack('>f', self.file.read(4))[0]
-        if type == 'double':
-            return struct.unpack('>d', self.file.read(8))[0]
-        if type == 'string':
-            return self._read_string()
-        raise ValueError(f'Invalid value for arg `type`: {type}')
+        # inlined seek; this is by far the hottest path when parsing
+        if whence == 'start':
+            self.pos = base + offset
+        elif whence == 'current':
+            self.pos += base + offset
+        else:
+            raise ValueError(f'Invalid value for `whence`: {whence}')
+
+        s = primitive_structs.get(type)
+        if s is None:
+            if type == 'string':
+                return self._read_string()
+            raise ValueError(f'Invalid value for arg `type`: {type}')
+        value = s.unpack_from(self.buffer, self.pos)[0]
+        self.pos += s.size
+        return value
+
+    def read_array(self, type, address, count, stride=None):
+        """
+        Reads `count` values of primitive type `type` starting at
+        `address`, each `stride` bytes apart (tightly packed if no
+        stride is given), and returns them as a tuple
+        """
+        s = _primitive_struct(type)
+        if stride is None:
+            stride = s.size
+        if stride < s.size:
+            raise ValueError(f'Stride {stride} is smaller than `{type}`')
+        if count <= 0:
+            return ()
+        if stride == s.size:
+            values = _array_struct(type, count).unpack_from(self.buffer, address)
+        else:
+            end = address + count * stride
+            if end > len(self.buffer):
+                # the last element's padding may run past the end of the file
+                values = self.read_array(type, address, count - 1, stride) + \
+                         self.read_array(type, address + (count - 1) * stride, 1)
+            else:
+                view = memoryview(self.buffer)[address:end]
+                values = tuple(chain.from_iterable(
+                    _strided_struct(type, stride).iter_unpack(view)))
+                view.release()
+        self.pos = address + (count - 1) * stride + s.size
+        return values
+
+    def read_ndarray(self, dtype, address, count, stride=None):
+        """
+        Reads `count` elements of the NumPy dtype `dtype` (which
+        may be a subarray type like ('>f4', 3)) starting at `address`,
+        each `stride` bytes apart, and returns them as a contiguous
+        array in native byte order
+        """
+        dtype = np.dtype(dtype)
+        base = dtype.base
+        if stride is None:
+            stride = dtype.itemsize
+        if stride < dtype.itemsize:
+            raise ValueError(f'Stride {stride} is smaller than `{dtype}`')
+        shape = (max(count, 0),) + dtype.shape
+        if count <= 0:
+            return np.zeros(shape, base.newbyteorder('='))
+        end = address + (count - 1) * stride + dtype.itemsize
+        if end > len(self.buffer):
+            raise ValueError(f'Array at {hex(address)} runs past the end of the file')
+        # strided view over the buffer (the last element's padding may
+        # run past the end of the file), then one copy to native order
+        strides = (stride,) + np.empty(dtype.shape, base).strides
+        view = np.ndarray(shape, base, self.buffer, address, strides)
+        self.pos = end
+        return view.astype(base.newbyteorder('='))
+
+    def read_struct(self, fmt, address):
+        """
+        Unpacks the struct format string `fmt` (big-endian unless
+        specified otherwise) at `address` and returns a tuple
+        """
+        s = fmt if isinstance(fmt, struct.Struct) else _compile_format(fmt)
+        values = s.unpack_from(self.buffer, address)
+        self.pos = address + s.size
+        return values
+
+    def read_record(self, layout, address):
+        """
+        Decodes the record described by the RecordLayout
+        `layout` at `address`
+        """
+        record = layout.unpack_from(self.buffer, address)
+        self.pos = address + layout.size
+        return record
+
+    def read_records(self, layout, address, count):
+        """
+        Decodes `count` consecutive records described by
+        the RecordLayout `layout` starting at `address`
+        """
+        records = layout.unpack_array(self.buffer, address, count)
+        self.pos = address + count * layout.size
+        return records
 
     def _read_string(self):
         """
-        Reads a char[] from the current position
-        and converts it to an ascii string
+        Reads a null-terminated char[] from the current position
+        and converts it to a string (cached by address)
         """
-        s = ''
-        nextChar = self.file.read(1)[0] # converts byte to int
-        while nextChar != 0:
-            s += chr(nextChar)
-            nextChar = self.file.read(1)[0]
+        address = self.pos
+        s = self.strings.get(address)
+        if s is None:
+            s = self._decode_string(address)
+            self.strings[address] = s
+        self.pos = address + len(s) + 1
         return s
 
+    def _decode_string(self, address):
+        end = self.buffer.find(b'\x00', address)
+        if end < 0:
+            end = len(self.buffer)
+        # one byte per char, so len(s) is also the byte length
+        return self.buffer[address:end].decode('latin-1')
+
+    def index_strings(self, start=0, end=None, min_length=1):
+        """
+        Scans `start` to `end` in one pass for null-terminated runs
+        of at least `min_length` printable characters and adds them
+        to the string cache; returns the number of strings found
+        """
+        if end is None:
+            end = len(self.buffer)
+        pattern = re.compile(rb'[\x20-\x7e]{%d,}\x00' % min_length)
+        count = 0
+        for match in pattern.finditer(self.buffer, start, end):
+            self.strings.setdefault(match.start(),
+                                    match.group()[:-1].decode('latin-1'))
+            count += 1
+        return count
+
     def read_chunk(self, offset, size, whence='start'):
         """
         Reads `size` bytes from `offset`
         relative to `whence` ('start' or 'current')
         """
         self.seek(offset, whence)
-        return self.file.read(size)
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
 
     def seek(self, offset, whence='start'):
         """
-        Moves the BinaryReader's file to `offset`
+        Moves the BinaryReader's position to `offset`
         relative to `whence` ('start' or 'current')
         """
         if whence == 'start':
-            self.file.seek(offset)
+            self.pos = offset
         elif whence == 'current':
-            self.file.seek(offset, 1)
+            self.pos += offset
         else:
             raise ValueError(f'Invalid value for `whence`: {whence}')
 
     def tell(self):
         """Returns the BinaryReader's current position"""
-        return self.file.tell()
+        return self.pos
 
     def close(self):
         """Closes the BinaryReader's file"""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
         self.file.close()
 
     @staticmethod
@@ -88,40 +242,172 @@ class BinaryReader:
 
     @staticmethod
     def primitive_size(type):
-        primitive_sizes = {
-            'uchar'  : 1,
-            'char'   : 1,
-            'ushort' : 2,
-            'short'  : 2,
-            'uint'   : 4,
-            'int'    : 4,
-            'float'  : 4,
-            'double' : 8,
-        }
-
         if type == 'string':
             return 0
         if not BinaryReader.is_primitive(type):
             return 0
 
-        return primitive_sizes[type]
+        return primitive_structs[type].size
 
     @staticmethod
     def is_array(type):
         return type.endswith('[]')
-    
+
     @staticmethod
     def is_pointer(type):
         return type.endswith('*')
 
+class TracingBinaryReader(BinaryReader):
+    """
+    BinaryReader that records every access, for finding out where
+    parsing time goes: reads, bytes and non-sequential jumps per
+    calling function and per data type, plus which parts of the
+    file were read (and read more than once)
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = path
+        self.callers = {}
+        self.types = {}
+        self.spans = []
+        self.seen = set()
+        self.end = 0 # where the previous access ended
+        self._depth = 0
+
+    def _caller(self):
+        # first frame outside of this module
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_globals.get('__name__') == __name__:
+            frame = frame.f_back
+        return frame.f_code.co_name if frame is not None else '?'
+
+    def _trace(self, kind, address, call):
+        # nested calls (e.g. read_array splitting a read) count once
+        if self._depth > 0:
+            return call()
+        self._depth += 1
+        try:
+            result = call()
+        finally:
+            self._depth -= 1
+        size = max(self.pos - address, 0)
+
+        stats = self.callers.setdefault(self._caller(), {
+            'reads': 0, 'bytes': 0, 'seeks': 0, 'seekDistance': 0, 'rereads': 0,
+        })
+        stats['reads'] += 1
+        stats['bytes'] += size
+        if address != self.end:
+            stats['seeks'] += 1
+            stats['seekDistance'] += abs(address - self.end)
+        if (address, size) in self.seen:
+            stats['rereads'] += 1
+        else:
+            self.seen.add((address, size))
+        typeStats = self.types.setdefault(kind, {'reads': 0, 'bytes': 0})
+        typeStats['reads'] += 1
+        typeStats['bytes'] += size
+        self.spans.append((address, address + size))
+        self.end = address + size
+        return result
+
+    def read(self, type, base, offset=0, whence='start'):
+        address = base + offset
+        if whence == 'current':
+            address += self.pos
+        return self._trace(type, address, lambda:
+                           super(TracingBinaryReader, self).read(type, base, offset, whence))
+
+    def read_array(self, type, address, count, stride=None):
+        return self._trace(f'{type}[]', address, lambda:
+                           super(TracingBinaryReader, self).read_array(type, address, count, stride))
+
+    def read_ndarray(self, dtype, address, count, stride=None):
+        return self._trace(f'{np.dtype(dtype)}[]', address, lambda:
+                           super(TracingBinaryReader, self).read_ndarray(dtype, address, count, stride))
+
+    def read_struct(self, fmt, address):
+        return self._trace('struct', address, lambda:
+                           super(TracingBinaryReader, self).read_struct(fmt, address))
+
+    def read_record(self, layout, address):
+        return self._trace(layout.name, address, lambda:
+                           super(TracingBinaryReader, self).read_record(layout, address))
+
+    def read_records(self, layout, address, count):
+        return self._trace(f'{layout.name}[]', address, lambda:
+                           super(TracingBinaryReader, self).read_records(layout, address, count))
+
+    def read_chunk(self, offset, size, whence='start'):
+        address = offset + self.pos if whence == 'current' else offset
+        return self._trace('chunk', address, lambda:
+                           super(TracingBinaryReader, self).read_chunk(offset, size, whence))
+
+    def report(self):
+        """Summarizes the accesses recorded so far as a dict"""
+        # merge the accessed spans into disjoint ranges
+        ranges = []
+        for start, end in sorted(self.spans):
+            if end <= start:
+                continue
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        covered = sum(end - start for start, end in ranges)
+        bytesRead = sum(stats['bytes'] for stats in self.callers.values())
+        fileSize = len(self.buffer)
+        return {
+            'path': self.path,
+            'fileSize': fileSize,
+            'reads': sum(stats['reads'] for stats in self.callers.values()),
+            'bytesRead': bytesRead,
+            'seeks': sum(stats['seeks'] for stats in self.callers.values()),
+            'seekDistance': sum(stats['seekDistance'] for stats in self.callers.values()),
+            'coveredBytes': covered,
+            'coverage': covered / fileSize if fileSize > 0 else 0.0,
+            'rereadBytes': bytesRead - covered,
+            'callers': dict(sorted(self.callers.items(),
+                                   key=lambda item: item[1]['bytes'], reverse=True)),
+            'types': dict(sorted(self.types.items(),
+                                 key=lambda item: item[1]['bytes'], reverse=True)),
+            'coveredRanges': ranges,
+        }
+
 class BinaryWriter(BinaryReader):
     """
     Wrapper class to simplify writing data of various types
     to a binary file (uses big-endian byte order)
+
+    Data is assembled in memory and written to disk in one go
+    when the BinaryWriter is closed. Addresses can be given names
+    with `define`, and pointer slots referring to a name (possibly
+    one that isn't defined yet) are filled in by `close`
     """
-    
+
     def __init__(self, path):
-        self.file = open(path, 'wb+')
+        self.path = path
+        self.buffer = bytearray()
+        self.size = 0 # end of the data written so far
+        self.pos = 0
+        self.labels = {}
+        self.relocations = []
+
+    def _read_string(self):
+        # the buffer is still changing, so don't cache
+        s = self._decode_string(self.pos)
+        self.pos += len(s) + 1
+        return s
+
+    def _reserve(self, end):
+        """Grows the buffer so that it extends to at least `end`"""
+        if end > len(self.buffer):
+            # grow geometrically to keep appends cheap
+            capacity = max(end, 2 * len(self.buffer), 0x1000)
+            self.buffer.extend(bytes(capacity - len(self.buffer)))
+        if end > self.size:
+            self.size = end
 
     def write(self, type, data, base, offset=0, whence='start'):
         """
@@ -129,27 +415,36 @@ class BinaryWriter(BinaryReader):
         relative to `whence` ('start' or 'current')
         """
         self.seek(base + offset, whence)
-        
-        if type == 'uchar':
-            return self.file.write(struct.pack('>B', data))
-        if type == 'ushort':
-            return self.file.write(struct.pack('>H', data))
-        if type == 'uint':
-            return self.file.write(struct.pack('>I', data))
-        if type == 'char':
-            return self.file.write(struct.pack('>b', data))
-        if type == 'short':
-            return self.file.write(struct.pack('>h', data))
-        if type == 'int':
-            return self.file.write(struct.pack('>i', data))
-        if type == 'float':
-            return self.file.write(struct.pack('>f', data))
-        if type == 'double':
-            return self.file.write(struct.pack('>d', data))
+
         if type == 'string':
             # strings should be null terminated
-            return self.file.write(bytes(data, 'ascii') + b'\x00')
-        raise ValueError(f'Invalid value for arg `type`: {type}')
+            return self.write_chunk(bytes(data, 'ascii') + b'\x00', self.pos)
+        s = _primitive_struct(type)
+        self._reserve(self.pos + s.size)
+        s.pack_into(self.buffer, self.pos, data)
+        self.pos += s.size
+        return s.size
+
+    def write_array(self, type, values, address):
+        """
+        Writes `values` as a tightly packed array of
+        primitive type `type` to `address`
+        """
+        s = _array_struct(type, len(values))
+        self._reserve(address + s.size)
+        s.pack_into(self.buffer, address, *values)
+        self.pos = address + s.size
+        return s.size
+
+    def write_record(self, layout, address, **fields):
+        """
+        Writes the record described by the RecordLayout `layout`
+        to `address`; omitted fields are written as zero
+        """
+        self._reserve(address + layout.size)
+        layout.pack_into(self.buffer, address, **fields)
+        self.pos = address + layout.size
+        return layout.size
 
     def write_chunk(self, data, offset, whence='start'):
         """
@@ -157,4 +452,48 @@ class BinaryWriter(BinaryReader):
         to `whence` ('start' or 'current')
         """
         self.seek(offset, whence)
-        return self.file.write(data)
+        end = self.pos + len(data)
+        self._reserve(end)
+        self.buffer[self.pos:end] = data
+        self.pos = end
+        return len(data)
+
+    def alloc(self, size, align=4):
+        """
+        Reserves `size` zeroed bytes after the end of the data
+        written so far, aligned to a multiple of `align`, and
+        returns their address
+        """
+        address = (self.size + align - 1) // align * align
+        self._reserve(address + size)
+        return address
+
+    def define(self, name, address):
+        """Gives the name `name` to `address`"""
+        if name in self.labels:
+            raise ValueError(f'Address `{name}` is already defined')
+        self.labels[name] = address
+
+    def lookup(self, name):
+        """Returns the address previously given the name `name`"""
+        try:
+            return self.labels[name]
+        except KeyError:
+            raise ValueError(f'Address `{name}` is not defined') from None
+
+    def write_pointer(self, name, address):
+        """
+        Writes a pointer to the address named `name` to `address`;
+        the name only needs to be defined by the time the
+        BinaryWriter is closed
+        """
+        self._reserve(address + 4)
+        self.relocations.append((name, address))
+
+    def close(self):
+        """Fills in all pointer slots and writes the data to disk"""
+        s = primitive_structs['uint']
+        for name, address in self.relocations:
+            s.pack_into(self.buffer, address, self.lookup(name))
+        with open(self.path, 'wb') as f:
+            f.write(memoryview(self.buffer)[:self.size])
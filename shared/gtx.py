@@ -0,0 +1,299 @@
+import math
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+def expandRGB565(b1, b2):
+    r = b1 & 0xf8
+    g = ((b1 & 0x7) << 5) + ((b2 & 0xe0) >> 3)
+    b = (b2 & 0x1f) << 3
+    a = np.full_like(b1, 0xff)
+    return np.stack([r, g, b, a], axis=-1).astype(np.uint8)
+
+def expandRGB5A3(b1, b2):
+    opaque = (b1 & 0x80) != 0
+    r = np.where(opaque, (b1 & 0x7c) << 1, (b1 & 0xf) * 0x11)
+    g = np.where(opaque, ((b1 & 0x3) << 6) + ((b2 & 0xe0) >> 2),
+                 ((b2 & 0xf0) >> 4) * 0x11)
+    b = np.where(opaque, (b2 & 0x1f) << 3, (b2 & 0xf) * 0x11)
+    a = np.where(opaque, 0xff, (b1 & 0x70) << 1)
+    return np.stack([r, g, b, a], axis=-1).astype(np.uint8)
+
+def expandIA8(b1, b2):
+    return np.stack([b2, b2, b2, b1], axis=-1).astype(np.uint8)
+
+def expandIntensity(i, a):
+    return np.stack([i, i, i, np.broadcast_to(a, i.shape)], axis=-1).astype(np.uint8)
+
+expanders = {
+    'IA8': expandIA8,
+    'RGB565': expandRGB565,
+    'RGB5A3': expandRGB5A3,
+}
+
+# built on first use
+luts = {}
+
+def lookupTable(encoding):
+    """
+    Returns a (65536, 4) uint8 array mapping every 16-bit value
+    of `encoding` ('IA8', 'RGB565' or 'RGB5A3') to RGBA
+    """
+    lut = luts.get(encoding)
+    if lut is None:
+        values = np.arange(0x10000, dtype=np.uint32)
+        lut = expanders[encoding](values >> 8, values & 0xff)
+        luts[encoding] = lut
+    return lut
+
+def splitNibbles(values):
+    # high nibble first, so each byte becomes two adjacent texels
+    values = values.astype(np.uint32)
+    return np.stack([values >> 4, values & 0xf], axis=-1) \
+             .reshape(values.shape[0], -1)
+
+def readTexels(byte_arr, count, dtype):
+    dtype = np.dtype(dtype)
+    available = min(count, len(byte_arr) // dtype.itemsize)
+    texels = np.frombuffer(byte_arr, dtype=dtype, count=available)
+    if available < count:
+        # missing data decodes as zeros
+        texels = np.concatenate([texels, np.zeros(count - available, dtype)])
+    return texels
+
+def untile(texels, num_blocks_x, num_blocks_y, block_width, block_height):
+    """
+    Rearranges texels stored block by block into rows of
+    texels, ordered bottom-to-top b/c Blender uses bottom-left
+    instead of top-left as origin
+    """
+    blocks = texels.reshape(num_blocks_y, num_blocks_x, block_height, block_width)
+    rows = blocks.transpose(0, 2, 1, 3) \
+                 .reshape(num_blocks_y * block_height, num_blocks_x * block_width)
+    return rows[::-1]
+
+def generateTLUT(byte_arr, maxPaletteSize, palEncoding):
+    paletteSize = min(maxPaletteSize, len(byte_arr) // 2)
+    if palEncoding not in expanders:
+        return np.zeros((0, 4), np.uint8)
+    entries = readTexels(byte_arr, paletteSize, '>u2')
+    return lookupTable(palEncoding)[entries]
+    
+def parseImageData(byte_arr, img_width, img_height, encoding, palEncoding, palOffset, step=1):
+    if encoding == 'RGBA32':
+        return parseRGBA32Data(byte_arr, img_width, img_height, step)
+    elif encoding == 'CMPR':
+        return parseCMPRData(byte_arr, img_width, img_height, step)
+    
+    if encoding in ['C4', 'C8', 'C14X2']:
+        if encoding == 'C4': # 4 bit indices
+            maxPaletteSize = 0x10
+            img_width /= 2
+            block_width = 4
+            block_height = 8
+            px_sz = 1
+        elif encoding == 'C8': # 8 bit indices
+            maxPaletteSize = 0x100
+            block_width = 8
+            block_height = 4
+            px_sz = 1
+        elif encoding == 'C14X2': # 10 bit indices
+            maxPaletteSize = 0x400
+            block_width = block_height = 4
+            px_sz = 2
+        tlut = generateTLUT(byte_arr[palOffset:], maxPaletteSize, palEncoding)
+    elif encoding == 'I4':
+        img_width /= 2
+        block_width = 4
+        block_height = 8
+        px_sz = 1
+    elif encoding in ['IA4', 'I8']:
+        block_width = 8
+        block_height = 4
+        px_sz = 1
+    elif encoding in ['IA8', 'RGB565', 'RGB5A3']:
+        block_width = block_height = 4
+        px_sz = 2
+    num_blocks_x = math.ceil(img_width / block_width)
+    num_blocks_y = math.ceil(img_height / block_height)
+    count = num_blocks_x * num_blocks_y * block_width * block_height
+    texels = readTexels(byte_arr, count, np.uint8 if px_sz == 1 else '>u2')
+    texels = untile(texels, num_blocks_x, num_blocks_y, block_width, block_height)
+    # partial blocks keep their padding rows but drop padding columns;
+    # this might be incorrect for I4 but oh well
+    texels = texels[:, :max(math.floor(img_width - 1) + 1, 0)]
+    if encoding in ['C4', 'I4']:
+        texels = splitNibbles(texels)
+    # only look up the pixels that are kept
+    texels = texels[::step, ::step]
+
+    if encoding == 'I4':
+        rgba = expandIntensity(texels * 0x11, 0xff)
+    elif encoding == 'IA4':
+        texels = texels.astype(np.uint32)
+        rgba = expandIntensity((texels & 0xf) * 0x11, (texels >> 4) * 0x11)
+    elif encoding == 'I8':
+        rgba = expandIntensity(texels, 0xff)
+    elif encoding in ['IA8', 'RGB565', 'RGB5A3']:
+        rgba = lookupTable(encoding)[texels]
+    elif encoding == 'C4':
+        rgba = tlut[texels]
+    elif encoding == 'C8':
+        rgba = tlut[texels]
+    elif encoding == 'C14X2':
+        rgba = tlut[texels & 0x4FFF]
+    return rgba.reshape(-1)
+
+def parseRGBA32Data(byte_arr, img_width, img_height, step=1):
+    block_width = block_height = 4
+    num_blocks_x = math.ceil(img_width / block_width)
+    num_blocks_y = math.ceil(img_height / block_height)
+    # each block stores its 16 AR pairs followed by its 16 GB pairs
+    count = num_blocks_x * num_blocks_y * block_width * block_height * 4
+    blocks = readTexels(byte_arr, count, np.uint8) \
+                 .reshape(-1, 2, block_width * block_height, 2)
+    channels = [blocks[:, 0, :, 1], # r
+                blocks[:, 1, :, 0], # g
+                blocks[:, 1, :, 1], # b
+                blocks[:, 0, :, 0]] # a
+    channels = [untile(c.reshape(-1), num_blocks_x, num_blocks_y,
+                       block_width, block_height)[::step, ::step] for c in channels]
+    return np.stack(channels, axis=-1).reshape(-1)
+
+def interpolate(v1, v2, weight):
+    # same float arithmetic as interpolating one value at a time
+    return (v1 * (1 - weight) + v2 * weight).astype(np.uint8)
+
+def getCMPRColors(headers):
+    """
+    Builds the 4-color palette of every sub-block from its
+    first 4 bytes; returns an array of shape (..., 4, 4)
+    """
+    v1 = (headers[..., 0].astype(np.uint32) << 8) + headers[..., 1]
+    v2 = (headers[..., 2].astype(np.uint32) << 8) + headers[..., 3]
+    lut = lookupTable('RGB565')
+    color1 = lut[v1]
+    color2 = lut[v2]
+    c1 = color1.astype(np.float64)
+    c2 = color2.astype(np.float64)
+    # 4-color mode, otherwise 3 colors and transparent
+    fourColors = (v1 > v2)[..., np.newaxis]
+    color3 = np.where(fourColors, interpolate(c1, c2, 1/3),
+                      interpolate(c1, c2, 1/2))
+    color4 = np.where(fourColors, interpolate(c1, c2, 2/3), 0)
+    return np.stack([color1, color2, color3, color4], axis=-2).astype(np.uint8)
+
+def parseCMPRData(byte_arr, img_width, img_height, step=1):
+    block_width = block_height = 2 # num. sub-blocks
+    # each sub-block is 4 pixels wide
+    num_blocks_x = math.ceil(img_width / (block_width * 4))
+    num_blocks_y = math.ceil(img_height / (block_height * 4))
+    # every sub-block consists of 8 bytes
+    count = num_blocks_x * num_blocks_y * block_width * block_height * 8
+    subblocks = readTexels(byte_arr, count, np.uint8).reshape(-1, 8)
+    sub_size = max(4 // step, 1)
+    if step < 4:
+        colors = getCMPRColors(subblocks[:, :4])
+        # 2 bit indices, leftmost pixel in the high bits
+        shifts = np.array([6, 4, 2, 0], np.uint8)
+        indices = (subblocks[:, 4:, np.newaxis] >> shifts) & 0x3
+        # keep every `step`-th pixel of each sub-block
+        indices = indices[:, ::step, ::step].reshape(len(subblocks), sub_size * sub_size)
+        pixels = colors[np.arange(len(subblocks))[:, np.newaxis], indices]
+    else:
+        # one pixel per sub-block, colored by its first end point
+        c0 = (subblocks[:, 0].astype(np.uint32) << 8) | subblocks[:, 1]
+        pixels = lookupTable('RGB565')[c0]
+    # (block row, block col, sub-block row, sub-block col, row, px, channel)
+    pixels = pixels.reshape(num_blocks_y, num_blocks_x, block_height,
+                            block_width, sub_size, sub_size, 4)
+    rows = pixels.transpose(0, 2, 4, 1, 3, 5, 6) \
+                 .reshape(num_blocks_y * block_height * sub_size,
+                          num_blocks_x * block_width * sub_size, 4)
+    # add rows bottom-to-top b/c Blender uses bottom-left
+    # instead of top-left as origin; drop partial block columns
+    rows = rows[::-1, :math.ceil(img_width / step)]
+    return rows.reshape(-1)
+
+def decompress(byte_arr, img_width, img_height, encoding, palEncoding, palOffset, step=1):
+    """
+    Decodes the image data into a flat uint8 array of RGBA
+    values, rows ordered bottom-to-top; with a `step` above 1,
+    only every `step`-th pixel of every `step`-th row is decoded
+    (1, 2 or 4 for CMPR)
+    """
+    rgba = parseImageData(byte_arr, img_width, img_height, encoding, palEncoding, palOffset, step)
+    #assert len(rgba) / 4 == img_width * img_height
+    return rgba
+
+def decodedSize(img_width, img_height, encoding, step=1):
+    """Returns the length of the array `decompress` produces"""
+    if encoding == 'RGBA32':
+        num_rows = math.ceil(img_height / 4) * 4
+        num_cols = math.ceil(img_width / 4) * 4
+        return math.ceil(num_rows / step) * math.ceil(num_cols / step) * 4
+    elif encoding == 'CMPR':
+        num_rows = math.ceil(img_height / 8) * 8
+        return math.ceil(num_rows / step) * math.ceil(img_width / step) * 4
+    # see parseImageData
+    px_per_texel = 1
+    block_height = 4
+    if encoding in ['C4', 'I4']:
+        # 2 pixels per byte
+        img_width /= 2
+        px_per_texel = 2
+        block_height = 8
+    num_rows = math.ceil(img_height / block_height) * block_height
+    num_cols = max(math.floor(img_width - 1) + 1, 0) * px_per_texel
+    return math.ceil(num_rows / step) * math.ceil(num_cols / step) * 4
+
+# block size in pixels for each format
+blockSizes = {
+    'I4': (8, 8),
+    'IA4': (8, 4),
+    'I8': (8, 4),
+    'IA8': (4, 4),
+    'RGB565': (4, 4),
+    'RGB5A3': (4, 4),
+    'RGBA32': (4, 4),
+    'C4': (8, 8),
+    'C8': (8, 4),
+    'C14X2': (4, 4),
+    'CMPR': (8, 8),
+}
+
+def levelSize(img_width, img_height, encoding):
+    """Returns the size in bytes of one mipmap level's data"""
+    block_width, block_height = blockSizes[encoding]
+    # RGBA32 blocks are stored in two halves of 32 bytes
+    block_size = 0x40 if encoding == 'RGBA32' else 0x20
+    return math.ceil(img_width / block_width) * \
+           math.ceil(img_height / block_height) * block_size
+
+def mipmapLevels(img_width, img_height, encoding, numLevels):
+    """
+    Returns the (width, height, offset) of each level of a
+    mipmap chain, the levels being stored one after another
+    """
+    levels = []
+    offset = 0
+    for i in range(max(numLevels, 1)):
+        level_width = max(img_width >> i, 1)
+        level_height = max(img_height >> i, 1)
+        levels.append((level_width, level_height, offset))
+        offset += levelSize(level_width, level_height, encoding)
+    return levels
+
+def decompressInto(shmName, byte_arr, img_width, img_height, encoding, palEncoding, palOffset, step=1):
+    """
+    Decodes the image data into the shared memory block `shmName`
+    (for use in worker processes); returns the number of bytes written
+    """
+    rgba = decompress(byte_arr, img_width, img_height, encoding, palEncoding, palOffset, step)
+    # the block is owned (and unlinked) by the parent process
+    shm = SharedMemory(name=shmName)
+    try:
+        shm.buf[:len(rgba)] = np.ascontiguousarray(rgba).data
+    finally:
+        shm.close()
+    return len(rgba)
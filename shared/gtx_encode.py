@@ -0,0 +1,508 @@
+import math
+
+import numpy as np
+
+from . import gtx
+
+blockSizes = gtx.blockSizes
+
+def channels(rgba):
+    # work on wider ints so shifts can't overflow
+    rgba = rgba.astype(np.uint32)
+    return rgba[..., 0], rgba[..., 1], rgba[..., 2], rgba[..., 3]
+
+def intensity(r, g, b):
+    # exact for gray pixels, which is what the decoders produce
+    return (r * 299 + g * 587 + b * 114 + 500) // 1000
+
+def rgbaToI4(rgba):
+    r, g, b, a = channels(rgba)
+    i = intensity(r, g, b) >> 4
+    # 2 pixels per byte, left one in the high nibble
+    return (i[:, 0::2] << 4) | i[:, 1::2]
+
+def rgbaToIA4(rgba):
+    r, g, b, a = channels(rgba)
+    return ((a >> 4) << 4) | (intensity(r, g, b) >> 4)
+
+def rgbaToI8(rgba):
+    r, g, b, a = channels(rgba)
+    return intensity(r, g, b)
+
+def rgbaToIA8(rgba):
+    r, g, b, a = channels(rgba)
+    return (a << 8) | intensity(r, g, b)
+
+def rgbaToRGB565(rgba):
+    r, g, b, a = channels(rgba)
+    return ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+
+def rgbaToRGB5A3(rgba):
+    r, g, b, a = channels(rgba)
+    translucent = ((a >> 5) << 12) | ((r // 0x11) << 8) | \
+                  ((g // 0x11) << 4) | (b // 0x11)
+    opaque = 0x8000 | ((r >> 3) << 10) | ((g >> 3) << 5) | (b >> 3)
+    return np.where(a < 0xff, translucent, opaque)
+
+converters = {
+    'I4': (rgbaToI4, np.uint8),
+    'IA4': (rgbaToIA4, np.uint8),
+    'I8': (rgbaToI8, np.uint8),
+    'IA8': (rgbaToIA8, '>u2'),
+    'RGB565': (rgbaToRGB565, '>u2'),
+    'RGB5A3': (rgbaToRGB5A3, '>u2'),
+}
+
+def tile(texels, block_width, block_height):
+    """
+    Rearranges rows of texels into blocks of
+    `block_width` x `block_height` texels each
+    """
+    num_rows, num_cols = texels.shape[:2]
+    blocks = texels.reshape(num_rows // block_height, block_height,
+                            num_cols // block_width, block_width,
+                            *texels.shape[2:])
+    return blocks.swapaxes(1, 2)
+
+def quantizeRGB565(colors):
+    # the decoder expands by shifting, so round to multiples of 8/4/8
+    colors = np.clip(np.rint(colors), 0, 255).astype(np.uint32)
+    r = np.minimum((colors[..., 0] + 4) >> 3, 0x1f)
+    g = np.minimum((colors[..., 1] + 2) >> 2, 0x3f)
+    b = np.minimum((colors[..., 2] + 4) >> 3, 0x1f)
+    return (r << 11) | (g << 5) | b
+
+def principalEndpoints(pixels, opaque):
+    """
+    Picks each sub-block's end points as the extremes of its opaque
+    pixels along their principal axis
+    """
+    weights = opaque[..., np.newaxis].astype(np.float64)
+    count = np.maximum(weights.sum(axis=1), 1)
+    mean = (pixels * weights).sum(axis=1) / count
+    centered = (pixels - mean[:, np.newaxis]) * weights
+    cov = np.einsum('nki,nkj->nij', centered, centered)
+    # power iteration, starting from the luminance direction
+    axis = np.broadcast_to(np.array([0.299, 0.587, 0.114]), mean.shape).copy()
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', cov, axis)
+        norm = np.linalg.norm(axis, axis=1, keepdims=True)
+        axis = np.where(norm > 1e-9, axis / np.maximum(norm, 1e-9), 0.0)
+    proj = np.einsum('nki,ni->nk', pixels - mean[:, np.newaxis], axis)
+    tmax = np.where(opaque, proj, -np.inf).max(axis=1)
+    tmin = np.where(opaque, proj, np.inf).min(axis=1)
+    tmax = np.where(np.isfinite(tmax), tmax, 0.0)[:, np.newaxis]
+    tmin = np.where(np.isfinite(tmin), tmin, 0.0)[:, np.newaxis]
+    return mean + tmax * axis, mean + tmin * axis
+
+def orderEndpoints(c0, c1, hasAlpha):
+    # 4-color mode needs c0 > c1, 3-color + transparent mode c0 <= c1
+    swap = np.where(hasAlpha, c0 > c1, c0 < c1)
+    return np.where(swap, c1, c0), np.where(swap, c0, c1)
+
+def assignIndices(pixels, opaque, c0, c1):
+    """
+    Returns each pixel's index into the palette the decoder builds
+    from `c0` and `c1`, and the squared error of each sub-block
+    """
+    headers = np.stack([c0 >> 8, c0 & 0xff, c1 >> 8, c1 & 0xff], axis=-1)
+    palette = gtx.getCMPRColors(headers.astype(np.uint8)).astype(np.int32)
+    dist = np.zeros(pixels.shape[:2] + (4,), np.int32)
+    for ch in range(3):
+        diff = pixels[:, :, np.newaxis, ch] - palette[:, np.newaxis, :, ch]
+        dist += diff * diff
+    # the 4th color is transparent in 3-color mode
+    dist[c0 <= c1, :, 3] = 1 << 30
+    indices = dist.argmin(axis=-1)
+    best = np.take_along_axis(dist, indices[..., np.newaxis], axis=-1)[..., 0]
+    error = np.where(opaque, best, 0).sum(axis=1)
+    indices = np.where(opaque, indices, 3)
+    return indices, error
+
+# position of each palette index between c0 and c1
+cmprWeights = {
+    False: np.array([0.0, 1.0, 1/3, 2/3]),
+    True: np.array([0.0, 1.0, 1/2, 0.0]),
+}
+
+def refineEndpoints(pixels, opaque, indices, threeColors):
+    """
+    Least-squares fit of both end points to the pixels, given
+    which palette entry each pixel is assigned to
+    """
+    w = np.where(threeColors[:, np.newaxis], cmprWeights[True][indices],
+                 cmprWeights[False][indices]) * opaque
+    v = (1 - w) * opaque
+    aa = (v * v).sum(axis=1)
+    ab = (v * w).sum(axis=1)
+    bb = (w * w).sum(axis=1)
+    ax = (v[..., np.newaxis] * pixels).sum(axis=1)
+    bx = (w[..., np.newaxis] * pixels).sum(axis=1)
+    det = aa * bb - ab * ab
+    ok = np.abs(det) > 1e-9
+    det = np.where(ok, det, 1.0)[:, np.newaxis]
+    e0 = (bb[:, np.newaxis] * ax - ab[:, np.newaxis] * bx) / det
+    e1 = (aa[:, np.newaxis] * bx - ab[:, np.newaxis] * ax) / det
+    return e0, e1, ok
+
+def padToBlocks(rgba, block_width, block_height):
+    """
+    Returns the image top-to-bottom, zero-padded
+    to a whole number of blocks
+    """
+    img_height, img_width = rgba.shape[:2]
+    num_blocks_x = math.ceil(img_width / block_width)
+    num_blocks_y = math.ceil(img_height / block_height)
+    pixels = np.zeros((num_blocks_y * block_height,
+                       num_blocks_x * block_width, 4), np.uint8)
+    pixels[:img_height, :img_width] = rgba[::-1]
+    return pixels
+
+def encodeCMPR(rgba, quality='REFINE'):
+    """
+    Encodes an RGBA8 image as CMPR; `quality` is 'FAST' (end points
+    taken along each sub-block's principal axis) or 'REFINE' (those
+    end points are then improved with least-squares fits). Pixels
+    with alpha below 0x80 become transparent
+    """
+    pixels = padToBlocks(rgba, 8, 8)
+    # each 8x8 block holds 2x2 sub-blocks of 4x4 pixels
+    blocks = tile(pixels, 8, 8).reshape(-1, 2, 4, 2, 4, 4)
+    subblocks = blocks.swapaxes(2, 3).reshape(-1, 16, 4)
+    opaque = subblocks[..., 3] >= 0x80
+    hasAlpha = ~opaque.all(axis=1)
+    colors = subblocks[..., :3].astype(np.int32)
+
+    e0, e1 = principalEndpoints(colors.astype(np.float64), opaque)
+    c0, c1 = orderEndpoints(quantizeRGB565(e0), quantizeRGB565(e1), hasAlpha)
+    indices, error = assignIndices(colors, opaque, c0, c1)
+    if quality == 'REFINE':
+        for _ in range(2):
+            e0, e1, ok = refineEndpoints(colors.astype(np.float64), opaque,
+                                         indices, c0 <= c1)
+            n0, n1 = orderEndpoints(quantizeRGB565(e0), quantizeRGB565(e1), hasAlpha)
+            newIndices, newError = assignIndices(colors, opaque, n0, n1)
+            # only keep improvements
+            better = ok & (newError < error)
+            c0 = np.where(better, n0, c0)
+            c1 = np.where(better, n1, c1)
+            indices = np.where(better[:, np.newaxis], newIndices, indices)
+            error = np.where(better, newError, error)
+
+    # 2 bits per pixel, leftmost pixel in the high bits
+    rows = indices.reshape(-1, 4, 4).astype(np.uint32)
+    packed = (rows[..., 0] << 6) | (rows[..., 1] << 4) | (rows[..., 2] << 2) | rows[..., 3]
+    out = np.empty((len(subblocks), 8), np.uint8)
+    out[:, 0] = c0 >> 8
+    out[:, 1] = c0 & 0xff
+    out[:, 2] = c1 >> 8
+    out[:, 3] = c1 & 0xff
+    out[:, 4:] = packed
+    return out.tobytes()
+
+def encode(rgba, encoding, quality='REFINE'):
+    """
+    Encodes an RGBA8 image of shape (height, width, 4), rows
+    ordered bottom-to-top as in Blender, as `encoding`
+    """
+    if encoding == 'CMPR':
+        return encodeCMPR(rgba, quality)
+    block_width, block_height = blockSizes[encoding]
+    pixels = padToBlocks(rgba, block_width, block_height)
+
+    if encoding == 'RGBA32':
+        blocks = tile(pixels, block_width, block_height) \
+                     .reshape(pixels.shape[0] // 4, pixels.shape[1] // 4, 16, 4)
+        # each block stores its 16 AR pairs followed by its 16 GB pairs
+        ar = blocks[..., [3, 0]]
+        gb = blocks[..., [1, 2]]
+        return np.stack([ar, gb], axis=2).tobytes()
+
+    convert, dtype = converters[encoding]
+    texels = convert(pixels)
+    if encoding == 'I4':
+        block_width //= 2
+    return tile(texels.astype(dtype), block_width, block_height).tobytes()
+
+paletteConverters = {
+    'IA8': rgbaToIA8,
+    'RGB565': rgbaToRGB565,
+    'RGB5A3': rgbaToRGB5A3,
+}
+
+def choosePaletteEncoding(rgba):
+    r, g, b, a = channels(rgba.reshape(-1, 4))
+    if ((r == g) & (g == b)).all():
+        return 'IA8'
+    elif (a == 0xff).all():
+        return 'RGB565'
+    return 'RGB5A3'
+
+def medianCut(colors, numColors):
+    """
+    Splits the colors into at most `numColors` boxes, always
+    halving the box with the widest channel range (weighted by
+    its size) at its median, and returns the box means
+    """
+    boxes = [colors]
+    while len(boxes) < numColors:
+        scores = [np.ptp(box, axis=0).max() * len(box) if len(box) > 1 else -1
+                  for box in boxes]
+        i = int(np.argmax(scores))
+        if scores[i] <= 0:
+            break
+        box = boxes.pop(i)
+        channel = np.ptp(box, axis=0).argmax()
+        box = box[box[:, channel].argsort(kind='stable')]
+        half = len(box) // 2
+        boxes += [box[:half], box[half:]]
+    return np.array([box.mean(axis=0) for box in boxes])
+
+def nearestColors(colors, palette, chunkSize=0x4000):
+    """Returns the index of the closest palette entry for each color"""
+    colors = colors.astype(np.float32)
+    palette = palette.astype(np.float32)
+    paletteNorms = (palette ** 2).sum(axis=1)
+    indices = np.empty(len(colors), np.intp)
+    # chunked so the distance matrix stays small
+    for start in range(0, len(colors), chunkSize):
+        chunk = colors[start:start + chunkSize]
+        dist = paletteNorms - 2 * chunk @ palette.T
+        indices[start:start + chunkSize] = dist.argmin(axis=1)
+    return indices
+
+def quantizePalette(rgba, numColors, palEncoding, maxSamples=0x4000, iterations=4):
+    """
+    Picks up to `numColors` colors representing the image and
+    returns them as 16-bit `palEncoding` values
+    """
+    pixels = rgba.reshape(-1, 4)
+    packed = pixels.view(np.uint32).reshape(-1)
+    unique = np.unique(packed)
+    if len(unique) <= numColors:
+        # few enough colors to keep them all
+        palette = unique.view(np.uint8).reshape(-1, 4).astype(np.float64)
+    else:
+        # median cut over a subsample, then a few rounds of k-means
+        step = max(len(pixels) // maxSamples, 1)
+        samples = pixels[::step].astype(np.float64)
+        palette = medianCut(samples, numColors)
+        for _ in range(iterations):
+            indices = nearestColors(samples, palette)
+            counts = np.bincount(indices, minlength=len(palette))
+            sums = np.stack([np.bincount(indices, samples[:, ch], len(palette))
+                             for ch in range(4)], axis=1)
+            used = counts > 0
+            palette[used] = sums[used] / counts[used, np.newaxis]
+    palette = np.clip(np.rint(palette), 0, 255).astype(np.uint8)
+    values = paletteConverters[palEncoding](palette).astype(np.uint16)
+    # drop entries that became identical once encoded
+    return np.unique(values)
+
+def encodePaletted(rgba, encoding, palEncoding=None, mipmaps=()):
+    """
+    Encodes an RGBA8 image as C4 (16 colors) or C8 (256 colors);
+    returns the index data, the palette (TLUT) data and the
+    palette encoding ('IA8', 'RGB565' or 'RGB5A3', picked from
+    the image's contents if not given). The `mipmaps` levels
+    share the image's palette and follow it in the index data
+    """
+    if palEncoding is None:
+        palEncoding = choosePaletteEncoding(rgba)
+    numColors = 0x10 if encoding == 'C4' else 0x100
+    values = quantizePalette(rgba, numColors, palEncoding)
+    # match against the colors the decoder will actually produce
+    palette = gtx.lookupTable(palEncoding)[values]
+    data = b''.join(paletteIndices(level, encoding, palette)
+                    for level in [rgba, *mipmaps])
+    return data, values.astype('>u2').tobytes(), palEncoding
+
+def paletteIndices(rgba, encoding, palette):
+    """Maps every pixel to its closest palette entry, as tiled index data"""
+    block_width, block_height = blockSizes[encoding]
+    pixels = padToBlocks(rgba, block_width, block_height)
+    packed = pixels.reshape(-1, 4).view(np.uint32).reshape(-1)
+    unique, inverse = np.unique(packed, return_inverse=True)
+    colors = unique.view(np.uint8).reshape(-1, 4)
+    indices = nearestColors(colors, palette)[inverse.reshape(-1)] \
+                  .reshape(pixels.shape[:2]).astype(np.uint8)
+    if encoding == 'C4':
+        # 2 pixels per byte, left one in the high nibble
+        indices = (indices[:, 0::2] << 4) | indices[:, 1::2]
+        block_width //= 2
+    return tile(indices, block_width, block_height).tobytes()
+
+def encodeTexture(rgba, encoding, quality='REFINE', mipmaps=()):
+    """
+    Encodes an RGBA8 image, followed by its `mipmaps` levels, as
+    any supported format; returns the image data, the palette
+    data and the palette encoding (both None unless the format
+    is color-indexed)
+    """
+    if encoding in ['C4', 'C8']:
+        return encodePaletted(rgba, encoding, mipmaps=mipmaps)
+    data = b''.join(encode(level, encoding, quality) for level in [rgba, *mipmaps])
+    return data, None, None
+
+def analyzeImage(rgba):
+    """Summarizes the properties of an image that decide its format"""
+    pixels = rgba.reshape(-1, 4)
+    r, g, b, a = pixels.T
+    return {
+        'grayscale': bool(((r == g) & (g == b)).all()),
+        'hasAlpha': bool((a < 0xff).any()),
+        'binaryAlpha': bool(((a == 0) | (a == 0xff)).all()),
+        'numColors': len(np.unique(pixels.view(np.uint32))),
+    }
+
+# formats tried by `chooseEncoding`, smallest first
+autoEncodings = ['C4', 'I4', 'CMPR', 'I8', 'IA4', 'C8', 'IA8', 'RGB565', 'RGB5A3']
+
+def candidateEncodings(info):
+    """Returns the formats able to represent an image, smallest first"""
+    candidates = []
+    for encoding in autoEncodings:
+        if encoding == 'C4' and info['numColors'] > 0x10:
+            continue
+        if encoding == 'C8' and info['numColors'] > 0x100:
+            continue
+        if encoding in ['I4', 'I8'] and (not info['grayscale'] or info['hasAlpha']):
+            continue
+        if encoding in ['IA4', 'IA8'] and not info['grayscale']:
+            continue
+        if encoding == 'CMPR' and not info['binaryAlpha']:
+            continue
+        if encoding == 'RGB565' and info['hasAlpha']:
+            continue
+        # RGB565 keeps more color precision for opaque images
+        if encoding == 'RGB5A3' and not info['hasAlpha']:
+            continue
+        candidates.append(encoding)
+    return candidates
+
+def decodedPixels(data, img_width, img_height, encoding, palEncoding=None, palOffset=None):
+    """
+    Decodes encoded image data back into an (img_height, img_width, 4)
+    array, rows bottom-to-top like the source image
+    """
+    decoded = gtx.decompress(data, img_width, img_height, encoding, palEncoding, palOffset)
+    # the decoded image is padded to whole blocks at the top (and, for
+    # some formats, to the right)
+    block_height = blockSizes[encoding][1]
+    num_rows = math.ceil(img_height / block_height) * block_height
+    return decoded.reshape(num_rows, -1, 4)[num_rows - img_height:, :img_width]
+
+def encodingError(rgba, encoded, encoding):
+    """
+    Returns the RMS difference between an image and its encoded
+    form, with colors weighted by alpha since the color of
+    transparent pixels doesn't show
+    """
+    data, tlut, palEncoding = encoded
+    img_height, img_width = rgba.shape[:2]
+    palOffset = None
+    if tlut is not None:
+        palOffset = len(data)
+        data += tlut
+    decoded = decodedPixels(data, img_width, img_height, encoding, palEncoding, palOffset)
+    num_cols = min(decoded.shape[1], img_width)
+
+    def premultiply(pixels):
+        pixels = pixels[:, :num_cols].astype(np.float32)
+        pixels[..., :3] *= pixels[..., 3:] / 0xff
+        return pixels
+    diff = premultiply(decoded) - premultiply(rgba)
+    return float(np.sqrt((diff * diff).mean())) if diff.size else 0.0
+
+# largest per-channel (r, g, b, a) difference each encoding can introduce
+maxQuantizationError = {
+    'RGB5A3': (0x10, 0x10, 0x10, 0x1f),
+    'RGBA32': (0, 0, 0, 0),
+}
+
+def quantizationError(rgba, data, encoding):
+    """Returns the largest per-channel difference the encoding introduced"""
+    img_height, img_width = rgba.shape[:2]
+    decoded = decodedPixels(data, img_width, img_height, encoding).astype(np.int32)
+    diff = np.abs(decoded - rgba[:, :decoded.shape[1]].astype(np.int32))
+    return diff.reshape(-1, 4).max(axis=0, initial=0)
+
+def chooseEncoding(rgba, maxError, quality='REFINE', mipmaps=()):
+    """
+    Picks the smallest format that encodes the image with an RMS
+    error of at most `maxError` (on the 0-255 scale), falling back
+    to the most precise 16-bit format; returns the format and the
+    `encodeTexture` output
+    """
+    candidates = candidateEncodings(analyzeImage(rgba))
+    for encoding in candidates:
+        encoded = encodeTexture(rgba, encoding, quality, mipmaps)
+        if encoding == candidates[-1] or encodingError(rgba, encoded, encoding) <= maxError:
+            return encoding, encoded
+
+# GX textures have at most 11 levels
+MAX_MIPMAP_LEVELS = 11
+
+def kaiserWeights(beta=4.0, radius=3):
+    """
+    Taps of a Kaiser-windowed sinc filter that halves the
+    resolution, at distances 0.5, 1.5, ... from the new pixel center
+    """
+    dist = np.arange(radius) + 0.5
+    weights = np.sinc(dist / 2) * np.i0(beta * np.sqrt(1 - (dist / radius) ** 2)) / np.i0(beta)
+    return weights / (2 * weights.sum())
+
+def halve(pixels, axis, weights):
+    """Halves the float image along `axis`, clamping at the edges"""
+    n = pixels.shape[axis]
+    size = max(n // 2, 1)
+    centers = np.arange(size) * 2
+    out = 0
+    for i, weight in enumerate(weights):
+        # the taps on both sides of each new pixel
+        left = np.clip(centers - i, 0, n - 1)
+        right = np.clip(centers + 1 + i, 0, n - 1)
+        out = out + weight * (pixels.take(left, axis) + pixels.take(right, axis))
+    return out
+
+def downsample(rgba, filter='BOX'):
+    """
+    Halves both dimensions of an RGBA8 image with a box or
+    Kaiser filter; colors are weighted by alpha so transparent
+    pixels don't bleed into their neighbors
+    """
+    weights = np.array([0.5]) if filter == 'BOX' else kaiserWeights()
+    pixels = rgba.astype(np.float32)
+    pixels[..., :3] *= pixels[..., 3:] / 0xff
+    for axis in [0, 1]:
+        if pixels.shape[axis] > 1:
+            pixels = halve(pixels, axis, weights)
+    alpha = pixels[..., 3:]
+    pixels[..., :3] = np.where(alpha > 0, pixels[..., :3] * 0xff / np.maximum(alpha, 1e-6), 0)
+    return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+def mipmapChain(rgba, filter='BOX'):
+    """
+    Returns the lower mipmap levels of an RGBA8 image, halving
+    it until its smaller dimension reaches 1
+    """
+    img_height, img_width = rgba.shape[:2]
+    numLevels = min(int(math.log2(max(min(img_width, img_height), 1))) + 1,
+                    MAX_MIPMAP_LEVELS)
+    levels = []
+    for _ in range(numLevels - 1):
+        rgba = downsample(rgba, filter)
+        levels.append(rgba)
+    return levels
+
+def imagePixels(image):
+    """
+    Reads a Blender image's pixels into an RGBA8
+    array of shape (height, width, 4)
+    """
+    w,h = image.size
+    pixels = np.empty(len(image.pixels), np.float32)
+    image.pixels.foreach_get(pixels)
+    # same rounding as int(f * 255)
+    rgba = np.clip(pixels.astype(np.float64) * 255, 0, 255).astype(np.uint8)
+    return rgba.reshape(h, w, 4)
@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+
+from . import gtx
+from .const import *
+
+## 4x4 transformation matrices (column vectors, as in Blender)
+
+def translationMatrix(x, y, z):
+    m = np.identity(4)
+    m[:3, 3] = (x, y, z)
+    return m
+
+def rotationMatrix(x, y, z):
+    """Rotation by the Euler angles `x`, `y`, `z`, applied in that order"""
+    cx, sx = math.cos(x), math.sin(x)
+    cy, sy = math.cos(y), math.sin(y)
+    cz, sz = math.cos(z), math.sin(z)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    m = np.identity(4)
+    m[:3, :3] = rz @ ry @ rx
+    return m
+
+def scaleMatrix(x, y, z):
+    return np.diag((x, y, z, 1.0))
+
+class Image:
+    def __init__(self, pixels, w, h, mipmaps=()):
+        self.width = w
+        self.height = h
+        self.pixels = pixels
+        # gtx.decompress arguments of each lower mipmap level
+        self.mipmaps = list(mipmaps)
+        self.decodedMipmaps = {}
+
+    @property
+    def numLevels(self):
+        return len(self.mipmaps) + 1
+
+    def level(self, i):
+        """
+        Returns the pixels and size of mipmap level `i`; lower
+        levels are only decoded the first time they are requested
+        """
+        if i == 0:
+            return self.pixels, self.width, self.height
+        if i not in self.decodedMipmaps:
+            self.decodedMipmaps[i] = gtx.decompress(*self.mipmaps[i - 1])
+        args = self.mipmaps[i - 1]
+        return self.decodedMipmaps[i], args[1], args[2]
+
+class Texture:
+    def __init__(self, imgID, extType):
+        self.imageIndex = imgID
+        self.extensionType = extType
+
+class Material:
+    def __init__(self, name, texID):
+        self.name = name
+        self.textureIndex = texID
+
+class Mesh:
+    def __init__(self, v, n, t, w):
+        # float32 (N, 3) positions and normals, (N, 2) uvs or None
+        self.vertices = v
+        self.vertNormals = n
+        self.texCoords = t
+        self.weights = w
+        # every decoded vertex attribute by GX attribute
+        self.attributes = {}
+        
+        self.parts = []
+        
+class MeshPart:
+    def __init__(self, indices, matID):
+        """
+        `indices` maps GX attributes to int32 (F, 3) arrays holding
+        each triangle's corner indices into that attribute's data
+        """
+        self.vertStride = 0
+        self.texStride = 0
+        self.vertexAttrs = {}
+
+        # filter out degenerate faces w/ repeated vertices
+        v = indices.get(GX_VA_POS)
+        if v is not None:
+            keep = (v[:, 0] != v[:, 1]) & (v[:, 1] != v[:, 2]) & (v[:, 0] != v[:, 2])
+            if not keep.all():
+                indices = {attr: idx[keep] for attr, idx in indices.items()}
+        self.indices = indices
+        self.materialIndex = matID
+
+    @property
+    def numFaces(self):
+        return len(self.vertexIndices)
+
+    @property
+    def vertexIndices(self):
+        return self.indices.get(GX_VA_POS, np.zeros((0, 3), np.int32))
+
+    @property
+    def vertNormalIndices(self):
+        return self.indices.get(GX_VA_NRM)
+
+    @property
+    def texCoordIndices(self):
+        return self.indices.get(GX_VA_TEX0)
+
+    def loopTexCoords(self, mesh):
+        """Returns the uv of every face corner, as a (F * 3, 2) array"""
+        return mesh.texCoords[self.texCoordIndices.reshape(-1)]
+
+class Bone:
+    def __init__(self, i, name, type, pivots, trans, mat, brot, rot, sca, pos, nodeFlags, boneFlags):
+        self.index = i
+        self.name = name
+        self.type = type
+
+        self.ScalePivot = pivots[0]
+        self.ScalePivotTranslate = pivots[1]
+        self.RotatePivot = pivots[2]
+        self.RotationPivotTranslate = pivots[3]
+
+        self.inverseBindMatrix = mat
+        
+        self.initialRot = rot
+        self.initialScale = sca
+        self.initialTrans = pos
+        self.bindRotation = brot
+        self.nodeFlags = nodeFlags
+        self.boneFlags = boneFlags
+
+        self.parentRelativeBind = None
+        
+        self.localTransform = trans
+        # self.globalTransform calculated by Skeleton
+
+        self.childIndices = []
+        self.parentIndex = None
+        
+        self.meshIndex = None
+
+class Skeleton:
+    def __init__(self, name, numBones, bones):
+        self.name = name
+        self.numBones = numBones
+        self.bones = bones
+
+        self.calcGlobalTransforms(0, np.identity(4))
+
+    def calcGlobalTransforms(self, idx, parentTransform, invparentBind=np.identity(4)):
+        bone = self.bones[idx]
+        bone.invparentBind = invparentBind
+        bone.parentRelativeBind = invparentBind @ np.linalg.inv(bone.inverseBindMatrix)
+        bone.globalTransform = parentTransform @ bone.localTransform
+
+        for childIndex in bone.childIndices:
+            self.calcGlobalTransforms(childIndex, bone.globalTransform, bone.inverseBindMatrix)
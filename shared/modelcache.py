@@ -0,0 +1,340 @@
+import os, json, shutil, hashlib
+
+import numpy as np
+
+from .const import *
+from .model import *
+
+# bump whenever the layout of cache entries changes
+MODEL_CACHE_FORMAT = 3
+
+interpolations = ['CONSTANT', 'LINEAR', 'BEZIER']
+
+class ModelCache:
+    """
+    Stores `parser.parseModel` output on disk, one folder per model
+    holding .npy arrays (geometry, weights, transforms, keyframes,
+    pixels) and a JSON file for everything else. Entries are keyed
+    by the model file's path, size, modification time and contents,
+    the parse options and the add-on version, so stale entries are
+    never found. Once the cache grows past `maxSize` bytes, the
+    least recently used entries are evicted
+    """
+
+    def __init__(self, directory, maxSize, version):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.version = tuple(version)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path, **options):
+        st = os.stat(path)
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(0x100000), b''):
+                h.update(block)
+        params = json.dumps([MODEL_CACHE_FORMAT, self.version, os.path.abspath(path),
+                             st.st_size, st.st_mtime_ns, sorted(options.items())])
+        h.update(params.encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Returns the cached model for `key` or None"""
+        path = self.path(key)
+        try:
+            with open(os.path.join(path, 'model.json')) as f:
+                meta = json.load(f)
+            arrays = {name: loadArray(os.path.join(path, name + '.npy'))
+                      for name in meta['arrays']}
+            model = unpackModel(arrays, meta)
+            # mark as recently used
+            os.utime(path)
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.isdir(path):
+                print(f'Ignoring unreadable model cache entry {key}: {e}')
+            self.misses += 1
+            return None
+        self.hits += 1
+        return model
+
+    def put(self, key, model):
+        """Stores a model returned by `parser.parseModel` under `key`"""
+        path = self.path(key)
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        try:
+            arrays, meta = packModel(model)
+            os.makedirs(tmpPath, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmpPath, name + '.npy'), array)
+            meta['arrays'] = sorted(arrays)
+            with open(os.path.join(tmpPath, 'model.json'), 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmpPath, path)
+        except OSError as e:
+            print(f'Could not write to model cache: {e}')
+            shutil.rmtree(tmpPath, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until under the size cap"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((mtime, size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.maxSize:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+def loadArray(path):
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # empty arrays can't be memory-mapped
+        return np.load(path)
+
+## Model <-> arrays
+
+# stored as the meshes' vertices, vertNormals and texCoords
+mainAttributes = [GX_VA_POS, GX_VA_NRM, GX_VA_TEX0]
+
+def packModel(model):
+    """Splits a model into a dict of arrays and a JSON-compatible dict"""
+    arrays = {}
+    meta = {'format': MODEL_CACHE_FORMAT}
+
+    meta['images'] = []
+    for i, image in enumerate(model['images']):
+        arrays[f'image{i}'] = np.asarray(image.pixels, np.uint8)
+        mipmaps = []
+        for j, (data, *params) in enumerate(image.mipmaps):
+            arrays[f'image{i}_mip{j}'] = np.frombuffer(data, np.uint8)
+            mipmaps.append(params)
+        meta['images'].append({'width': image.width, 'height': image.height,
+                               'mipmaps': mipmaps})
+    meta['textures'] = [[tex.imageIndex, list(tex.extensionType)]
+                        for tex in model['textures']]
+    meta['materials'] = [[mat.name, mat.textureIndex] for mat in model['materials']]
+
+    meta['meshes'] = []
+    for i, mesh in enumerate(model['meshes']):
+        prefix = f'mesh{i}_'
+        arrays[prefix + 'vertices'] = mesh.vertices
+        arrays[prefix + 'normals'] = mesh.vertNormals
+        if mesh.texCoords is not None:
+            arrays[prefix + 'uvs'] = mesh.texCoords
+        for attr, values in mesh.attributes.items():
+            if attr not in mainAttributes:
+                arrays[f'{prefix}attr{attr}'] = values
+        numWeights = None
+        if mesh.weights is not None:
+            numWeights = len(mesh.weights)
+            # one (vertex, bone, weight) entry per influence, in order
+            influences = [(v, bone, w) for v, weights in enumerate(mesh.weights)
+                          for bone, w in weights.items()]
+            arrays[prefix + 'weightVertices'] = np.array([v for v, _, _ in influences], np.int32)
+            arrays[prefix + 'weightBones'] = np.array([b for _, b, _ in influences], np.int32)
+            arrays[prefix + 'weights'] = np.array([w for _, _, w in influences], np.float64)
+        parts = []
+        for j, part in enumerate(mesh.parts):
+            for attr, indices in part.indices.items():
+                arrays[f'{prefix}part{j}_indices{attr}'] = indices
+            parts.append([part.materialIndex, part.vertStride, part.texStride,
+                          list(part.indices)])
+        meta['meshes'].append({'hasUVs': mesh.texCoords is not None,
+                               'attributes': list(mesh.attributes),
+                               'numWeights': numWeights,
+                               'parts': parts})
+
+    meta['skeletons'] = []
+    for i, skele in enumerate(model['skeletons']):
+        prefix = f'skeleton{i}_'
+        bones = [bone for bone in skele.bones if bone is not None]
+        slots = [slot for slot, bone in enumerate(skele.bones) if bone is not None]
+        arrays[prefix + 'localTransforms'] = np.array([b.localTransform for b in bones]).reshape(-1, 4, 4)
+        arrays[prefix + 'inverseBindMatrices'] = np.array([b.inverseBindMatrix for b in bones]).reshape(-1, 4, 4)
+        arrays[prefix + 'bindRotations'] = np.array([b.bindRotation for b in bones]).reshape(-1, 4, 4)
+        arrays[prefix + 'pivots'] = np.array([[b.ScalePivot, b.ScalePivotTranslate,
+                                               b.RotatePivot, b.RotationPivotTranslate]
+                                              for b in bones]).reshape(-1, 4, 3)
+        meta['skeletons'].append({
+            'name': skele.name,
+            'numBones': skele.numBones,
+            'bones': [{
+                'slot': slot,
+                'index': b.index,
+                'name': b.name,
+                'type': b.type,
+                'nodeFlags': b.nodeFlags,
+                'boneFlags': b.boneFlags,
+                'idk1': b.idk1,
+                'idk2': b.idk2,
+                'initialRot': list(b.initialRot),
+                'initialScale': list(b.initialScale),
+                'initialTrans': list(b.initialTrans),
+                'childIndices': b.childIndices,
+                'parentIndex': b.parentIndex,
+                'meshIndex': b.meshIndex,
+            } for slot, b in zip(slots, bones)],
+        })
+
+    # keyframes of all fcurves, concatenated
+    times, values, derivsL, derivsR, interps = [], [], [], [], []
+    count = 0
+    meta['actions'] = []
+    for actionIndex, action in model['actions'].items():
+        bones = {}
+        for boneName, fcurves in action['bones'].items():
+            bones[boneName] = []
+            for fcurve in fcurves:
+                keyframes = fcurve['keyframes']
+                value = np.array([k['value'] for k in keyframes], np.float64)
+                derivL = np.array([k['derivativeL'] for k in keyframes], np.float64)
+                derivR = np.array([k['derivativeR'] for k in keyframes], np.float64)
+                times += [k['time'] for k in keyframes]
+                interps += [interpolations.index(k['interpolation']) for k in keyframes]
+                values.append(value.reshape(len(keyframes), -1))
+                derivsL.append(derivL.reshape(len(keyframes), -1))
+                derivsR.append(derivR.reshape(len(keyframes), -1))
+                bones[boneName].append({
+                    'axis': fcurve['axis'],
+                    'component': fcurve['component'],
+                    'start': count,
+                    'count': len(keyframes),
+                    # vector values are stored flattened
+                    'valueShape': list(value.shape[1:]),
+                    'derivativeShape': list(derivL.shape[1:]),
+                })
+                count += len(keyframes)
+        meta['actions'].append([actionIndex, action['name'], bones])
+    arrays['keyTimes'] = np.array(times, np.float64)
+    arrays['keyInterpolations'] = np.array(interps, np.uint8)
+    arrays['keyValues'] = flatConcat(values)
+    arrays['keyDerivativesL'] = flatConcat(derivsL)
+    arrays['keyDerivativesR'] = flatConcat(derivsR)
+    return arrays, meta
+
+def flatConcat(arrays):
+    if not arrays:
+        return np.zeros(0, np.float64)
+    return np.concatenate([a.reshape(-1) for a in arrays])
+
+def unpackModel(arrays, meta):
+    """Inverse of `packModel`"""
+    if meta['format'] != MODEL_CACHE_FORMAT:
+        raise ValueError(f'unsupported format {meta["format"]}')
+
+    images = []
+    for i, imageMeta in enumerate(meta['images']):
+        mipmaps = [(arrays[f'image{i}_mip{j}'], *params)
+                   for j, params in enumerate(imageMeta['mipmaps'])]
+        images.append(Image(arrays[f'image{i}'], imageMeta['width'],
+                            imageMeta['height'], mipmaps))
+    textures = [Texture(imageIndex, tuple(extensionType))
+                for imageIndex, extensionType in meta['textures']]
+    materials = [Material(name, textureIndex) for name, textureIndex in meta['materials']]
+
+    meshes = []
+    for i, meshMeta in enumerate(meta['meshes']):
+        prefix = f'mesh{i}_'
+        v = arrays[prefix + 'vertices']
+        n = arrays[prefix + 'normals']
+        t = arrays[prefix + 'uvs'] if meshMeta['hasUVs'] else None
+        w = None
+        if meshMeta['numWeights'] is not None:
+            w = [{} for _ in range(meshMeta['numWeights'])]
+            for vert, bone, weight in zip(arrays[prefix + 'weightVertices'].tolist(),
+                                          arrays[prefix + 'weightBones'].tolist(),
+                                          arrays[prefix + 'weights'].tolist()):
+                w[vert][bone] = weight
+        mesh = Mesh(v, n, t, w)
+        main = {GX_VA_POS: v, GX_VA_NRM: n, GX_VA_TEX0: t}
+        mesh.attributes = {attr: main[attr] if attr in main else arrays[f'{prefix}attr{attr}']
+                           for attr in meshMeta['attributes']}
+        for j, (materialIndex, vertStride, texStride, attrs) in enumerate(meshMeta['parts']):
+            indices = {attr: arrays[f'{prefix}part{j}_indices{attr}'] for attr in attrs}
+            part = MeshPart(indices, materialIndex)
+            part.vertStride = vertStride
+            part.texStride = texStride
+            mesh.parts.append(part)
+        meshes.append(mesh)
+
+    skeletons = []
+    for i, skeleMeta in enumerate(meta['skeletons']):
+        prefix = f'skeleton{i}_'
+        bones = [None] * skeleMeta['numBones']
+        for k, b in enumerate(skeleMeta['bones']):
+            pivots = [np.array(p) for p in arrays[prefix + 'pivots'][k]]
+            bone = Bone(b['index'], b['name'], b['type'], pivots,
+                        np.array(arrays[prefix + 'localTransforms'][k]),
+                        np.array(arrays[prefix + 'inverseBindMatrices'][k]),
+                        np.array(arrays[prefix + 'bindRotations'][k]),
+                        tuple(b['initialRot']), tuple(b['initialScale']),
+                        tuple(b['initialTrans']), b['nodeFlags'], b['boneFlags'])
+            bone.idk1 = b['idk1']
+            bone.idk2 = b['idk2']
+            bone.childIndices = b['childIndices']
+            bone.parentIndex = b['parentIndex']
+            bone.meshIndex = b['meshIndex']
+            bones[b['slot']] = bone
+        skeletons.append(Skeleton(skeleMeta['name'], skeleMeta['numBones'], bones))
+
+    times = arrays['keyTimes'].tolist()
+    interps = arrays['keyInterpolations'].tolist()
+    actions = {}
+    valuePos = derivPos = 0
+    for actionIndex, name, bones in meta['actions']:
+        actions[actionIndex] = {'name': name, 'bones': {}}
+        for boneName, fcurves in bones.items():
+            actions[actionIndex]['bones'][boneName] = []
+            for fcurve in fcurves:
+                start, count = fcurve['start'], fcurve['count']
+                values, valuePos = takeValues(arrays['keyValues'], valuePos,
+                                              count, fcurve['valueShape'])
+                derivsL, _ = takeValues(arrays['keyDerivativesL'], derivPos,
+                                        count, fcurve['derivativeShape'])
+                derivsR, derivPos = takeValues(arrays['keyDerivativesR'], derivPos,
+                                               count, fcurve['derivativeShape'])
+                keyframes = [{'value': values[k],
+                              'derivativeL': derivsL[k],
+                              'derivativeR': derivsR[k],
+                              'interpolation': interpolations[interps[start + k]],
+                              'time': times[start + k]}
+                             for k in range(count)]
+                actions[actionIndex]['bones'][boneName].append({
+                    'axis': fcurve['axis'],
+                    'component': fcurve['component'],
+                    'keyframes': keyframes})
+
+    return {
+        'skeletons': skeletons,
+        'meshes': meshes,
+        'materials': materials,
+        'textures': textures,
+        'images': images,
+        'actions': actions,
+    }
+
+def takeValues(flat, pos, count, shape):
+    """Reads `count` values of `shape` from `flat` at `pos`; returns them and the new position"""
+    size = int(np.prod(shape))
+    block = np.array(flat[pos:pos + count * size])
+    if shape:
+        values = list(block.reshape(count, *shape))
+    else:
+        values = block.tolist()
+    return values, pos + count * size
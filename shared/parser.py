@@ -0,0 +1,777 @@
+import os, math, operator, importlib, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from . import gtx, records, vtx
+from .const import *
+from .model import *
+from .file_io import BinaryReader, TracingBinaryReader
+
+encodings = {
+        0x00: 'C4',
+        0x01: 'C8',
+        0x30: 'C14X2',
+        0x40: 'I4',
+        0x41: 'IA4',
+        0x42: 'I8',
+        0x43: 'IA8',
+        0x44: 'RGB565',
+        0x45: 'RGBA32',
+        0x90: 'RGB5A3',
+        0xB0: 'CMPR',
+    }
+
+palEncodings = {
+        0x0: 'UNUSED',
+        0x1: 'IA8', 
+        0x2: 'RGB565',
+        0x3: 'RGB5A3',
+    }
+
+mesh_dict = {}
+mat_dict = {}
+tex_dict = {}
+img_dict = {}
+anim_dict = {}
+tex_cache = None
+decode_workers = 1
+# preview imports decode textures at reduced resolution and skip animations
+texture_step = 1
+parse_animations = True
+
+def flattenIndexedDict(d):
+    return [data['object'] for addr,data in
+            sorted(d.items(), key=lambda item: item[1]['index'])]
+
+def parseTextures(file, address, numTextures):
+    images = []
+    for textureAddr in file.read_array('uint', address, numTextures):
+        header = file.read_record(records.TEXTURE, textureAddr)
+        imageAddr = textureAddr + header.imageOffset
+        if imageAddr not in img_dict:
+            img_dict[imageAddr] = {
+                'object': None,
+                'index': len(img_dict)
+            }
+            images.append((header, imageAddr))
+        tex = Texture(img_dict[imageAddr]['index'],
+                      (header.extrapX, header.extrapY))
+        tex_dict[textureAddr] = {
+            'object': tex,
+            'index': len(tex_dict)
+        }
+    # decode all of the images at once so they can be done in parallel
+    for (header, imageAddr), img in zip(images, decompressImages(file, images)):
+        img_dict[imageAddr]['object'] = img
+
+def decompressImages(file, images):
+    jobs = []
+    for header, imageAddr in images:
+        compressedData = file.read_chunk(imageAddr, header.dataSize)
+        params = (header.width, header.height,
+                  encodings[header.encoding],
+                  palEncodings[header.paletteEncoding],
+                  header.paletteAddr - imageAddr,
+                  texture_step)
+        jobs.append((compressedData, params))
+
+    results = [None] * len(jobs)
+    keys = [None] * len(jobs)
+    if tex_cache is not None:
+        for i, (compressedData, params) in enumerate(jobs):
+            keys[i] = tex_cache.key(compressedData, *params)
+            results[i] = tex_cache.get(keys[i])
+    missing = [i for i in range(len(jobs)) if results[i] is None]
+    decoded = decodeTextures([jobs[i] for i in missing], decode_workers)
+    for i, imageData in zip(missing, decoded):
+        results[i] = imageData
+        if tex_cache is not None:
+            tex_cache.put(keys[i], imageData)
+
+    return [Image(imageData,
+                  math.ceil(header.width / texture_step),
+                  math.ceil(header.height / texture_step),
+                  mipmaps(header, compressedData, params))
+            for (header, _), (compressedData, params), imageData
+            in zip(images, jobs, results)]
+
+def mipmaps(header, compressedData, params):
+    """
+    Returns the decoding arguments of each mipmap level below the
+    base one, leaving out levels that lie outside the image data
+    """
+    # previews only use the base level
+    if header.numLevels <= 1 or texture_step > 1:
+        return []
+    w, h, encoding, palEncoding, palOffset, _ = params
+    data = memoryview(compressedData)
+    levels = []
+    for levelWidth, levelHeight, offset in gtx.mipmapLevels(w, h, encoding, header.numLevels)[1:]:
+        if offset + gtx.levelSize(levelWidth, levelHeight, encoding) > len(data):
+            break
+        levels.append((data[offset:], levelWidth, levelHeight,
+                       encoding, palEncoding, palOffset - offset))
+    return levels
+
+# decoding takes about 5 (16-bit formats) to 11 (CMPR) ms per MB of
+# output, and even a running pool adds 2-4 ms per MB to move the
+# results back, so smaller batches are quicker to decode serially
+MIN_PARALLEL_DECODE_SIZE = 0x1000000
+
+def decodeTextures(jobs, numWorkers):
+    totalSize = sum(gtx.decodedSize(*params[:3], params[5]) for _, params in jobs)
+    if numWorkers > 1 and len(jobs) > 1 and totalSize >= MIN_PARALLEL_DECODE_SIZE:
+        try:
+            return decodeTexturesParallel(jobs, numWorkers)
+        except (OSError, ImportError, BrokenProcessPool) as e:
+            shutdownDecodePool()
+            print(f'Parallel texture decoding failed ({e}), decoding serially')
+    return [gtx.decompress(compressedData, *params)
+            for compressedData, params in jobs]
+
+# the worker processes load gtx.py by path under this name, since
+# importing it through the add-on's package would pull in bpy
+WORKER_MODULE = '_pbr_import_gtx'
+
+WORKER_INIT = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location(name, path)
+module = importlib.util.module_from_spec(spec)
+sys.modules[name] = module
+spec.loader.exec_module(module)
+for encoding in module.expanders:
+    module.lookupTable(encoding)
+"""
+
+class WorkerModule:
+    """Stands in for gtx in tasks; unpickles as the workers' copy of it"""
+
+    def __reduce__(self):
+        return (importlib.import_module, (WORKER_MODULE,))
+
+# kept alive between imports, since starting the workers
+# (a new interpreter each) takes longer than most decoding
+decode_pool = None
+decode_pool_workers = 0
+
+def decodePool(numWorkers):
+    global decode_pool, decode_pool_workers
+    if decode_pool is None or decode_pool_workers != numWorkers:
+        shutdownDecodePool()
+        context = multiprocessing.get_context('spawn')
+        decode_pool = ProcessPoolExecutor(numWorkers, mp_context=context,
+                                          initializer=exec,
+                                          initargs=(WORKER_INIT, {
+                                              'name': WORKER_MODULE,
+                                              'path': os.path.abspath(gtx.__file__),
+                                          }))
+        decode_pool_workers = numWorkers
+    return decode_pool
+
+def shutdownDecodePool():
+    global decode_pool, decode_pool_workers
+    if decode_pool is not None:
+        decode_pool.shutdown(cancel_futures=True)
+    decode_pool = None
+    decode_pool_workers = 0
+
+def decodeTexturesParallel(jobs, numWorkers):
+    pool = decodePool(numWorkers)
+    blocks = []
+    try:
+        # results are written straight into shared memory
+        for compressedData, params in jobs:
+            size = gtx.decodedSize(*params[:3], params[5])
+            blocks.append(SharedMemory(create=True, size=max(size, 1)))
+        # start with the largest textures
+        order = sorted(range(len(jobs)), key=lambda i: len(jobs[i][0]),
+                       reverse=True)
+        futures = {i: pool.submit(operator.methodcaller(
+                          'decompressInto', blocks[i].name, bytes(jobs[i][0]),
+                          *jobs[i][1]), WorkerModule())
+                   for i in order}
+        sizes = [futures[i].result() for i in range(len(jobs))]
+        return [np.frombuffer(blocks[i].buf, np.uint8, count=sizes[i]).copy()
+                for i in range(len(jobs))]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+def parseMaterial(file, address):
+    header = file.read_record(records.MATERIAL, address)
+    name = file.read('string', header.nameAddr)
+    textureAddr = header.textureAddr
+    mat = Material(name,
+                   tex_dict[textureAddr]['index'] if textureAddr else None)
+    return mat
+
+def parseVertices(file, address, numEntries, va):
+    return vtx.decodeComponents(file, va, address, numEntries, va.stride, 3)
+
+def parseNormals(file, address, numEntries, va, stride):
+    return vtx.decodeComponents(file, va, address, numEntries, stride, 3)
+
+def parseColors(file, address, numEntries, va, stride):
+    return vtx.decodeColors(file, va, address, numEntries, stride)
+
+def parseTextureCoords(file, address, numEntries, va):
+    texcoords = vtx.decodeComponents(file, va, address, numEntries, va.stride, 2)
+    # mirror vertically
+    texcoords[:, 1] = 1.0 - texcoords[:, 1]
+    return texcoords
+
+def parseVertexBlock(file, address, numEntries, vas):
+    """
+    Decodes the attributes interleaved in a mesh's vertex block:
+    position, then normal and colors if present, in that order
+    """
+    pos = vas[GX_VA_POS]
+    attrs = {GX_VA_POS: parseVertices(file, address, numEntries, pos)}
+    offset = vtx.elementSize(pos)
+    nrm = vas.get(GX_VA_NRM) or vas.get(GX_VA_NBT)
+    if nrm is not None:
+        attrs[GX_VA_NRM] = parseNormals(file, address + offset, numEntries,
+                                        nrm, pos.stride)
+        offset += vtx.elementSize(nrm)
+    for attr in vtx.colorAttrs:
+        va = vas.get(attr)
+        # colors that don't fit in the stride aren't part of the block
+        if va is None or offset + vtx.elementSize(va) > pos.stride:
+            continue
+        attrs[attr] = parseColors(file, address + offset, numEntries,
+                                  va, pos.stride)
+        offset += vtx.elementSize(va)
+    return attrs
+
+def parseActions(file, address, numActions):
+    actions = file.read_records(records.ACTION, address, numActions)
+    for i, action in enumerate(actions):
+        name = file.read('string', action.nameAddr)
+        anim_dict[i] = {'name': name,
+                        'bones': {}}
+
+# these are the types used in the game code as far as I can tell
+keyframeDataTypes = {
+    0 : 'float',
+    2 : 'quat',
+    5 : 'uchar',
+    6 : 'char',
+    7 : 'ushort',
+    8 : 'short', 
+}
+# for vector quantities, component 0 implies 3 component float and 4, 5, 6 imply 2 component float values
+
+# these data types are suggested by some setup code
+# they could correspond to the types implied by certain components
+unknownKeyFrameDataTypes = {
+    1 : 'unknown 1',
+    3 : 'unknown 3',
+    4 : 'unknown 4',
+    10 : 'unknown 10',
+    11 : 'unknown 11',
+}
+
+def parseFCurves(file, address, boneName):
+    nextAddr = address
+    while nextAddr != 0:
+        animData = file.read_record(records.ANIM_DATA, nextAddr)
+        actionIndex = animData.actionIndex
+        fcurveListAddr = animData.fcurveListAddr
+        anim_dict[actionIndex]['bones'][boneName] = []
+        fcurves = file.read_records(records.FCURVE, fcurveListAddr,
+                                    animData.numFCurves)
+        for i, entry in enumerate(fcurves):
+            fcurveAddr = fcurveListAddr + i * records.FCURVE.size
+            axis = entry.axis
+            if axis == 0:
+                # implies vec3 values
+                dataType = 'vec3'
+            elif (axis == 4 or axis == 5 or axis == 6):
+                # the actual ingame implementation of this looks broken so I don't expect it to be used outside of texture animation which uses different code
+                print('vec2 animation found in 3d anim: ', boneName)
+
+            compIndex = entry.component
+            dataType = entry.dataType
+            if dataType in keyframeDataTypes:
+                dataType = keyframeDataTypes[dataType]
+            elif dataType in unknownKeyFrameDataTypes:
+                print('found one of the expected but undocumented data types: ', dataType)
+            else:
+                print('completely undocumented data type: ', dataType)
+            channelIndex = entry.channelIndex
+            unkIndex = entry.unkIndex
+            idk = entry.idk
+            if compIndex >= 3:
+                print(f'Unknown component type: {compIndex} ({boneName}, {hex(fcurveAddr)})')
+                continue
+            component = ['location', 'rotation_euler', 'scale'][compIndex]
+            exp = entry.exponent
+            if dataType == 'float' or dataType == 'quat' or dataType == 'vec3' or dataType == 'vec2':
+                # float values, no scaling required
+                exp = 0.0
+            keyframes = parseKeyframes(file, entry.keyframeDataAddr, exp, dataType)
+            if len(keyframes) == 0:
+                continue
+            fcurve = {'axis': axis,
+                      'component': component,
+                      'keyframes': keyframes}
+            anim_dict[actionIndex]['bones'][boneName].append(fcurve)
+        nextAddr = animData.nextAddr
+
+def parseKeyframes(file, address, scale_exp, dataType):
+    header = file.read_record(records.KEYFRAME_DATA, address)
+    valsAddr = header.valuesAddr
+    derivsAddr = header.derivativesAddr
+    valueCount = header.valueCount
+    numKeyframes = header.numKeyframes
+    keyframes = []
+    if numKeyframes > 0:
+        entries = file.read_records(records.KEYFRAME, header.keyframesAddr,
+                                    numKeyframes)
+        for entry in entries:
+            interpolation = ['CONSTANT', 'LINEAR', 'BEZIER'][entry.interpolation]
+            value = readKeyframeValue(file, dataType, valsAddr, entry.valueIndex)
+            if derivsAddr > 0:
+                derivLIndex = entry.derivativeLIndex
+                derivRIndex = entry.derivativeRIndex
+                if dataType == 'quat' or dataType == 'vec3' or dataType == 'vec2':
+                    derivLeft = readKeyframeValue(file, dataType, derivsAddr, derivLIndex)
+                    derivRight = readKeyframeValue(file, dataType, derivsAddr, derivRIndex)
+                else:
+                    derivLeft = file.read('float', derivsAddr, offset=(4 * derivLIndex))
+                    derivRight = file.read('float', derivsAddr, offset=(4 * derivRIndex))
+            else:
+                print('derivative data not present even though it should be ...')
+                derivLeft = 0.0
+                derivRight = 0.0
+            time = entry.time
+            keyframe = {'value': value / (2 ** scale_exp),
+                        'derivativeL': derivLeft,
+                        'derivativeR': derivRight,
+                        'interpolation': interpolation,
+                        'time': time}
+            keyframes.append(keyframe)
+    elif valueCount > 0:
+        # "keyframe" animation. stores data for each individual frame
+        # probably used for baked data, such as animation data from constraints and IK
+        framerate = header.framerate & 0xFF
+        for i in range(valueCount):
+            value = readKeyframeValue(file, dataType, valsAddr, i)
+            time = (0.5 + (i - 1)) / framerate
+            keyframe = {'value': value / (2 ** scale_exp),
+                        'derivativeL': 0.0,
+                        'derivativeR': 0.0,
+                        'interpolation': 'CONSTANT',
+                        'time': time}
+            keyframes.append(keyframe)
+    return keyframes
+
+def readKeyframeValue(file, type, baseAdress, index):
+
+    if BinaryReader.is_primitive(type):
+        size = BinaryReader.primitive_size(type)
+        return file.read(type, baseAdress, offset=(size * index))
+    elif type == 'quat' or type == 'vec3' or type == 'vec2':
+        # multicomponent stuff needs to be handled separately
+        size = 4
+        if type == 'vec2':
+            n = 2
+            return np.array(file.read_array('float', baseAdress + size * index * n, n))
+        elif type == 'vec3':
+            n = 3
+            return np.array(file.read_array('float', baseAdress + size * index * n, n))
+        elif type == 'quat':
+            n = 4
+            # (w, x, y, z)
+            return np.array(file.read_array('float', baseAdress + size * index * n, n))
+    else:
+        print('unknown data type: ', type)
+        return None
+
+def parseWeights(file, address):
+    weights = []
+    skin = file.read_record(records.SKIN, address)
+
+    n = skin.numSingle
+    file.seek(skin.singleAddr)
+    for i in range(n):
+        numVerts = file.read('ushort', 0, whence='current')
+        bone1 = file.read('ushort', 0, whence='current')
+        for j in range(numVerts):
+            weights.append({bone1: 1.0})
+
+    n = skin.numDouble
+    addr1 = skin.doubleGroupsAddr
+    addr2 = skin.doubleWeightsAddr
+    count = 0
+    for i in range(n):
+        numVerts = file.read('ushort', addr1, offset=(6 * i))
+        bone1 = file.read('ushort', 0, whence='current')
+        bone2 = file.read('ushort', 0, whence='current')
+        file.seek(addr2 + 2 * count)
+        for j in range(numVerts):
+            # weights need to be normalized
+            w = file.read('ushort', 0, whence='current') / 0xffff
+            weights.append({bone1: w, bone2: 1 - w})
+        count += numVerts
+
+    n = skin.numExtra
+    file.seek(skin.extraAddr)
+    for i in range(n):
+        vertNum = file.read('ushort', 0, whence='current')
+        bone1 = file.read('ushort', 0, whence='current')
+        bone2 = file.read('ushort', 0, whence='current')
+        # weights need to be normalized
+        w1 = file.read('ushort', 0, whence='current') / 0xffff
+        w2 = file.read('ushort', 0, whence='current') / 0xffff
+        for bone in weights[vertNum]:
+            weights[vertNum][bone] *= (1 - w1 - w2)
+        weights[vertNum][bone1] = w1
+        if bone2 != 0xffff:
+            weights[vertNum][bone2] = w2
+            
+    return weights
+
+def triangleCorners(op, count):
+    """
+    Returns the positions within a primitive group of `count` vertices
+    of each triangle's corners, as an (N, 3) array
+    """
+    if op == GX_DRAW_QUADS:
+        start = np.arange(0, count - 3, 4)
+        return (start[:, None, None] + [[1, 0, 2], [2, 0, 3]]).reshape(-1, 3)
+    elif op == GX_DRAW_TRIANGLES:
+        start = np.arange(0, count - 2, 3)
+        return start[:, None] + [1, 0, 2]
+    elif op == GX_DRAW_TRIANGLE_STRIP:
+        start = np.arange(max(count - 2, 0))
+        # every other triangle is flipped to keep the winding consistent
+        corners = start[:, None] + [1, 0, 2]
+        corners[1::2] = start[1::2, None] + [0, 1, 2]
+        return corners
+    return None
+
+def parseFaces(file, address, numGroups, vertAttrs):
+    """
+    Decodes a display list into one (N, 3) int32 array of triangle
+    corner indices per vertex attribute
+    """
+    # normals are indexed the same way whether or not they have NBT
+    attrs = [GX_VA_NRM if attr == GX_VA_NBT else attr for attr in vertAttrs]
+    groups = []
+    pos = address
+    for i in range(numGroups):
+        op = file.read('uchar', pos)
+        count = file.read('ushort', 0, whence='current')
+        indices = file.read_ndarray(('>u2', len(attrs)), pos + 3, count)
+        corners = triangleCorners(op, count)
+        if corners is None:
+            raise Exception(f"Unknown opcode '{op}' at offset {hex(pos)}")
+        groups.append(indices.astype(np.int32)[corners])
+        pos += 3 + 2 * len(attrs) * count
+
+    triangles = np.concatenate(groups) if groups else \
+                np.zeros((0, 3, len(attrs)), np.int32)
+    return {attr: np.ascontiguousarray(triangles[:, :, i])
+            for i, attr in enumerate(attrs)}
+
+def parseMesh(file, address):
+    header = file.read_record(records.MESH, address)
+    parts = []
+    for mesh in parseMeshPart(file, header.partsAddr):
+        parts.append(mesh)
+    vertStride = max([part.vertStride for part in parts])
+    assert vertStride != 0
+    assert all([part.vertStride == vertStride for part in parts])
+    texStride = max([part.texStride for part in parts])
+    assert all([part.texStride == 0 or part.texStride == texStride
+                for part in parts])
+    # every part shares the mesh's vertex data
+    vas = {}
+    for part in parts:
+        for attr, va in part.vertexAttrs.items():
+            vas.setdefault(attr, va)
+
+    # vertices, vertex normals and colors
+    numVertices = header.numVertices
+    attrs = parseVertexBlock(file, header.verticesAddr, numVertices, vas)
+    # texture coordinates, one layer per TEXn attribute
+    uvLayerAddr = header.uvLayersAddr
+    if uvLayerAddr != 0:
+        for i, attr in enumerate(vtx.texCoordAttrs[:header.numUVLayers]):
+            va = vas.get(attr)
+            if va is None or va.stride == 0:
+                continue
+            uvLayer = file.read_record(records.UV_LAYER,
+                                       uvLayerAddr + i * records.UV_LAYER.size)
+            attrs[attr] = parseTextureCoords(file, uvLayer.coordsAddr,
+                                             uvLayer.numCoords, va)
+    v = attrs[GX_VA_POS]
+    # zero normals leave the shading to Blender
+    n = attrs.get(GX_VA_NRM, np.zeros_like(v))
+    t = attrs.get(GX_VA_TEX0)
+
+    # bone weights
+    boneWeightsAddr = header.weightsAddr
+    if boneWeightsAddr != 0:
+        w = parseWeights(file, boneWeightsAddr)
+    else:
+        w = None
+
+    meshGroup = Mesh(v, n, t, w)
+    meshGroup.attributes = attrs
+    meshGroup.parts = parts
+    return meshGroup
+
+def parseMeshPart(file, address):
+    header = file.read_record(records.MESH_PART, address)
+    vas = {}
+    vaAddr = header.vertInfoAddr
+    va = file.read_record(records.VERTEX_ATTR, vaAddr)
+    while va.attr != 0xff:
+        vas[va.attr] = va
+        vaAddr += records.VERTEX_ATTR.size
+        va = file.read_record(records.VERTEX_ATTR, vaAddr)
+    
+    f = parseFaces(file, header.facesAddr, header.numGroups, vas)
+    mesh = MeshPart(f, mat_dict[header.materialAddr]['index'])
+    mesh.vertexAttrs = vas
+    if GX_VA_POS in vas:
+        mesh.vertStride = vas[GX_VA_POS].stride
+    if GX_VA_TEX0 in vas:
+        mesh.texStride = vas[GX_VA_TEX0].stride
+    yield mesh
+    
+    # check if there is a next part of the mesh
+    nextMeshAddr = header.nextAddr
+    if nextMeshAddr != 0:
+        for mesh in parseMeshPart(file, nextMeshAddr):
+            yield mesh
+
+def parseSkeleton(file, address, useDefaultPose=False, sceneSettings=None):
+    header = file.read_record(records.SKELETON, address)
+    name = file.read('string', header.nameAddr)
+    # actions
+    if parse_animations:
+        parseActions(file, header.actionsAddr, header.numActions)
+    # bones
+    numBones = header.numBones
+    bones = [None] * numBones
+    rootBone = next(parseBones(file, header.rootAddr, bones, useDefaultPose, sceneSettings))
+    return Skeleton(name, numBones, bones)
+
+def parseBones(file, address, bones, useDefaultPose=False, sceneSettings=None):
+    node = file.read_record(records.NODE, address)
+    k = node.type
+    name = file.read('string', node.nameAddr)
+    idx = node.boneIndex
+    nodeFlags = node.nodeFlags
+
+    if k == 2:
+        boneFlags = node.typeData
+    else:
+        boneFlags = 0
+    
+
+    i = 1
+    blenderName = name
+    boneNames = [bone.name for bone in bones if bone]
+    while blenderName in boneNames:
+        blenderName = f'{name}.{i:03d}'
+        i += 1
+    name = blenderName
+
+    pos = np.identity(4)
+    posAddr = node.posAddr
+    if posAddr != 0:
+        x, y, z = file.read_array('float', posAddr, 3)
+        pos = translationMatrix(x, y, z)
+    else:
+        pos = np.identity(4)
+        (x, y, z) = (0, 0, 0)
+    
+    if useDefaultPose:
+        rotAddr = node.rotAddr
+        if rotAddr != 0:
+            rx, ry, rz = file.read_array('float', rotAddr, 3)
+            rot = rotationMatrix(rx, ry, rz)
+        else:
+            rot = np.identity(4)
+            (rx, ry, rz) = (0, 0, 0)
+    else:
+        rot = np.identity(4)
+        (rx, ry, rz) = (0, 0, 0)
+    
+    scaAddr = node.scaAddr
+    if scaAddr != 0:
+        sx, sy, sz = file.read_array('float', scaAddr, 3)
+        sca = scaleMatrix(sx, sy, sz)
+    else:
+        sca = np.identity(4)
+        (sx, sy, sz) = (1, 1, 1)
+
+
+    sp = np.zeros(3)
+    st = np.zeros(3)
+    rp = np.zeros(3)
+    rt = np.zeros(3)
+    pivots = [sp, st, rp, rt]
+    
+    if k == 0x2:
+        # bind pose rotation
+        brx, bry, brz = node.bindRotation
+        rot2 = rotationMatrix(brx, bry, brz)
+        orot = rot
+        rot = rot2 @ rot
+        # inverse bind matrix
+        m = node.inverseBindMatrix
+        mat = [m[0:4], m[4:8], m[8:12], (0.0, 0.0, 0.0, 1.0)]
+    else:
+        transPointer = node.pivotsAddr
+        if transPointer:
+            print("MAYA MEME DETECTED IN ", name)
+            precomputed = sceneSettings['precomputedPivots']
+            if precomputed:
+                length = 3
+                rt[0] = rt[1] = rt[2] = float('inf')
+            else:
+                length = 4 #len(pivots)
+
+            values = file.read_array('float', transPointer, 3 * length)
+            for i in range(length):
+                pivots[i][:] = values[3 * i:3 * i + 3]
+
+        mat = [[1.0, 0.0, 0.0, 0.0],
+               [0.0, 1.0, 0.0, 0.0],
+               [0.0, 0.0, 1.0, 0.0],
+               [0.0, 0.0, 0.0, 1.0]]
+        rot2 = np.identity(4)
+        orot = np.identity(4)
+
+    mat = np.array(mat)
+    bone = Bone(idx, name, k, pivots, (pos @ rot @ sca), mat, rot2, (rx, ry, rz), (sx, sy, sz), (x, y, z), nodeFlags, boneFlags)
+    bone.type = k
+    bone.idk1 = node.idk1
+    bone.idk2 = node.idk2
+    bones[idx] = bone
+
+    animDataAddr = node.animDataAddr
+    if animDataAddr != 0 and parse_animations:
+        parseFCurves(file, animDataAddr, name)
+    
+    childAddr = node.childAddr
+    if childAddr != 0:
+        for child in parseBones(file, childAddr, bones, useDefaultPose, sceneSettings):
+            bone.childIndices.append(child.index)
+            child.parentIndex = idx
+            
+    if k == 0x3: # skin node
+        meshAddr = node.typeData
+        # very hack-y fix to a bug I need to look closer at
+        meshStartAddr = file.read('uint', meshAddr, offset=0x18)
+        if meshStartAddr != 0:
+            if meshAddr not in mesh_dict:
+                mesh_dict[meshAddr] = {
+                    'object': parseMesh(file, meshAddr),
+                    'index': len(mesh_dict)
+                }
+            bone.meshIndex = mesh_dict[meshAddr]['index']
+    yield bone
+    
+    nextAddr = node.siblingAddr
+    if nextAddr != 0:
+        for sibling in parseBones(file, nextAddr, bones, useDefaultPose, sceneSettings):
+            yield sibling
+
+def parseModel(path, useDefaultPose=False, traceIO=False, textureCache=None,
+               decodeWorkers=1, textureStep=1, parseAnimations=True):
+    global mesh_dict, mat_dict, tex_dict, img_dict, anim_dict, tex_cache, decode_workers
+    global texture_step, parse_animations
+    mesh_dict = {}
+    mat_dict = {}
+    tex_dict = {}
+    img_dict = {}
+    anim_dict = {}
+    tex_cache = textureCache
+    decode_workers = decodeWorkers
+    texture_step = textureStep
+    parse_animations = parseAnimations
+
+    if traceIO:
+        file = TracingBinaryReader(path)
+    else:
+        file = BinaryReader(path)
+
+    # skeleton
+    skeletons = []
+
+    if path[-4:] == '.mdr':
+        header = file.read_record(records.MDR_HEADER, 0)
+        parseTextures(file, header.texturesListAddr, header.numTextures)
+
+        materialAddr = header.materialAddr
+        mat_dict[materialAddr] = {
+            'object': parseMaterial(file, materialAddr),
+            'index': len(mat_dict)
+        }
+
+    elif path[-4:] == '.odr':
+        header = file.read_record(records.ODR_HEADER, 0)
+        parseTextures(file, header.texturesListAddr, header.numTextures)
+
+        idk = header.idk0
+        idk1 = header.idk2
+        idk2 = header.idk4
+
+        sceneSettings = {'precomputedPivots': (idk < 1) or (idk1 < 3) or (idk2 == 0)}
+
+        for materialAddr in file.read_array('uint', header.materialsListAddr,
+                                            header.numMaterials):
+            mat_dict[materialAddr] = {
+                'object': parseMaterial(file, materialAddr),
+                'index': len(mat_dict)
+            }
+
+        skele = parseSkeleton(file, header.skeletonAddr, useDefaultPose, sceneSettings)
+        skeletons.append(skele)
+    else:
+        header = file.read_record(records.SDR_HEADER, 0)
+        parseTextures(file, header.texturesListAddr, header.numTextures)
+
+        idk = header.idk0
+        idk1 = header.idk2
+        idk2 = header.idk4
+
+        sceneSettings = {'precomputedPivots': (idk < 1) or (idk1 < 3) or (idk2 == 0)}
+
+        for materialAddr in file.read_array('uint', header.materialsListAddr,
+                                            header.numMaterials):
+            mat_dict[materialAddr] = {
+                'object': parseMaterial(file, materialAddr),
+                'index': len(mat_dict)
+            }
+
+        for skeletonHeaderAddr in file.read_array('uint', header.skeletonsListAddr,
+                                                  header.numSkeletons):
+            skele = parseSkeleton(file, skeletonHeaderAddr, useDefaultPose, sceneSettings)
+            skeletons.append(skele)
+        
+    
+    file.close()
+    
+    sdr = {
+        'skeletons': skeletons,
+        'meshes': flattenIndexedDict(mesh_dict),
+        'materials': flattenIndexedDict(mat_dict),
+        'textures': flattenIndexedDict(tex_dict),
+        'images': flattenIndexedDict(img_dict),
+        'actions': anim_dict
+    }
+    if traceIO:
+        sdr['trace'] = file.report()
+    return sdr
+
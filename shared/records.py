@@ -0,0 +1,281 @@
+import struct
+from collections import namedtuple
+
+from .file_io import primitive_structs
+
+class RecordLayout:
+    """
+    Describes an on-disk record as named fields at fixed offsets
+    and compiles it into a single struct (big-endian), so that a
+    whole record can be decoded or encoded with one call
+    """
+
+    def __init__(self, name, fields, size=None):
+        """
+        `fields` is a list of (name, offset, type) or
+        (name, offset, type, count) tuples; fields with a count
+        are decoded as tuples. Gaps between fields are skipped
+        when reading and zero-filled when writing
+        """
+        self.name = name
+        self.fields = sorted(fields, key=lambda field: field[1])
+        fmt = '>'
+        pos = 0
+        # (index into the flat value tuple, count) for every field
+        self._spans = []
+        index = 0
+        for field in self.fields:
+            fieldName, offset, type = field[:3]
+            count = field[3] if len(field) > 3 else 1
+            if offset < pos:
+                raise ValueError(f'{name}.{fieldName} overlaps previous field')
+            if offset > pos:
+                fmt += f'{offset - pos}x'
+            s = primitive_structs[type]
+            fmt += f'{count}{s.format[-1]}'
+            pos = offset + count * s.size
+            self._spans.append((index, count))
+            index += count
+        if size is not None:
+            if size < pos:
+                raise ValueError(f'{name} fields exceed record size {size:#x}')
+            fmt += f'{size - pos}x'
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.record = namedtuple(name, [field[0] for field in self.fields])
+        self._grouped = any(count > 1 for _, count in self._spans)
+        self._defaults = {field[0]: (0,) * field[3] if len(field) > 3 else 0
+                          for field in self.fields}
+
+    def _make(self, values):
+        if self._grouped:
+            values = [values[i] if n == 1 else values[i:i + n]
+                      for i, n in self._spans]
+        return self.record._make(values)
+
+    def unpack_from(self, buffer, offset=0):
+        """Decodes the record at `offset` in `buffer`"""
+        return self._make(self.struct.unpack_from(buffer, offset))
+
+    def unpack_array(self, buffer, offset, count):
+        """Decodes `count` consecutive records starting at `offset`"""
+        end = offset + count * self.size
+        view = memoryview(buffer)[offset:end]
+        records = [self._make(values)
+                   for values in self.struct.iter_unpack(view)]
+        view.release()
+        return records
+
+    def _flatten(self, fields):
+        unknown = fields.keys() - self._defaults.keys()
+        if unknown:
+            raise ValueError(f'Unknown {self.name} field(s): {", ".join(unknown)}')
+        values = []
+        for field in self.fields:
+            value = fields.get(field[0], self._defaults[field[0]])
+            if len(field) > 3:
+                values.extend(value)
+            else:
+                values.append(value)
+        return values
+
+    def pack(self, **fields):
+        """
+        Encodes a record from keyword arguments; omitted
+        fields are written as zero
+        """
+        return self.struct.pack(*self._flatten(fields))
+
+    def pack_into(self, buffer, offset, **fields):
+        """Encodes a record directly into `buffer` at `offset`"""
+        self.struct.pack_into(buffer, offset, *self._flatten(fields))
+
+## Record layouts
+
+# file headers
+SDR_HEADER = RecordLayout('SDRHeader', [
+    ('idk0', 0x0, 'uchar'),
+    ('idk2', 0x2, 'ushort'),
+    ('idk4', 0x4, 'uchar'),
+    ('skeletonsListAddr', 0x8, 'uint'),
+    ('texturesListAddr', 0xc, 'uint'),
+    ('materialsListAddr', 0x14, 'uint'),
+    ('numSkeletons', 0x18, 'ushort'),
+    ('numTextures', 0x1a, 'ushort'),
+    ('numMaterials', 0x1e, 'ushort'),
+], size=0x20)
+
+ODR_HEADER = RecordLayout('ODRHeader', [
+    ('idk0', 0x0, 'uchar'),
+    ('idk2', 0x2, 'ushort'),
+    ('idk4', 0x4, 'uchar'),
+    ('skeletonAddr', 0x8, 'uint'),
+    ('texturesListAddr', 0xc, 'uint'),
+    ('materialsListAddr', 0x14, 'uint'),
+    ('numTextures', 0x18, 'ushort'),
+    ('numMaterials', 0x1c, 'ushort'),
+], size=0x20)
+
+MDR_HEADER = RecordLayout('MDRHeader', [
+    ('texturesListAddr', 0x8, 'uint'),
+    ('numTextures', 0xc, 'ushort'),
+    ('materialAddr', 0x18, 'uint'),
+], size=0x1c)
+
+TEXTURE = RecordLayout('Texture', [
+    ('width', 0x0, 'ushort'),
+    ('height', 0x2, 'ushort'),
+    ('numLevels', 0x5, 'uchar'), # presumably the mipmap count
+    ('encoding', 0x8, 'uint'),
+    ('paletteEncoding', 0xc, 'uint'),
+    ('extrapX', 0x10, 'uint'),
+    ('extrapY', 0x14, 'uint'),
+    ('imageOffset', 0x28, 'uint'),
+    ('paletteAddr', 0x48, 'uint'),
+    ('dataSize', 0x4c, 'uint'),
+], size=0x50)
+
+MATERIAL = RecordLayout('Material', [
+    ('nameAddr', 0x0, 'uint'),
+    ('textureAddr', 0x18, 'uint'),
+    ('idk2c', 0x2c, 'uint'),
+    ('idk40', 0x40, 'uint'),
+    ('idk5a', 0x5a, 'uchar', 4),
+    ('color60', 0x60, 'uchar', 4),
+    ('color64', 0x64, 'uchar', 4),
+    ('color70', 0x70, 'uchar', 4),
+    ('idk74', 0x74, 'uchar'),
+    ('color78', 0x78, 'uchar', 4),
+    ('color80', 0x80, 'uchar', 4),
+    ('animDataAddr', 0x84, 'uint'),
+], size=0x8c)
+
+SKELETON = RecordLayout('Skeleton', [
+    ('nameAddr', 0x0, 'uint'),
+    ('numBones', 0x6, 'ushort'),
+    ('numActions', 0x8, 'ushort'),
+    ('actionsAddr', 0xc, 'uint'),
+    ('rootAddr', 0x10, 'uint'),
+], size=0x1c)
+
+ACTION = RecordLayout('Action', [
+    ('nameAddr', 0x0, 'uint'),
+    ('idk4', 0x4, 'float'), # portion of the animation played during attacks
+    ('idk8', 0x8, 'float'), # position of the mon during the animation
+    ('length', 0xc, 'float'),
+    ('loops', 0x28, 'uchar'),
+    ('idk29', 0x29, 'uchar'),
+    ('idk2a', 0x2a, 'uchar'),
+], size=0x30)
+
+_NODE_FIELDS = [
+    ('type', 0x0, 'uint'),
+    ('nameAddr', 0x4, 'uint'),
+    ('boneIndex', 0x8, 'ushort'),
+    ('nodeFlags', 0xa, 'ushort'),
+    ('posAddr', 0xc, 'uint'),
+    ('rotAddr', 0x10, 'uint'),
+    ('scaAddr', 0x14, 'uint'),
+    ('pivotsAddr', 0x18, 'uint'),
+    ('idk1c', 0x1c, 'float'),
+    ('animDataAddr', 0x20, 'uint'),
+    ('childAddr', 0x24, 'uint'),
+    ('siblingAddr', 0x28, 'uint'),
+]
+
+# the part of a node shared by every node type
+NODE_HEADER = RecordLayout('NodeHeader', _NODE_FIELDS, size=0x30)
+
+NODE = RecordLayout('Node', _NODE_FIELDS + [
+    # bone flags for bones (type 2), mesh address for skin nodes (type 3)
+    ('typeData', 0x30, 'uint'),
+    ('bindRotation', 0x34, 'float', 3),
+    ('idk1', 0x40, 'uint'),
+    ('inverseBindMatrix', 0x44, 'float', 12), # 3x4, row-major
+    ('idk2', 0x74, 'uint'),
+], size=0x78)
+
+ANIM_DATA = RecordLayout('AnimData', [
+    ('actionIndex', 0x0, 'ushort'),
+    ('numFCurves', 0x2, 'ushort'),
+    ('fcurveListAddr', 0x4, 'uint'),
+    ('length', 0x8, 'float'),
+    ('nextAddr', 0xc, 'uint'),
+], size=0x10)
+
+FCURVE = RecordLayout('FCurve', [
+    ('idk', 0x0, 'uchar'),
+    ('component', 0x1, 'uchar'),
+    ('axis', 0x2, 'uchar'),
+    ('channelIndex', 0x3, 'uchar'),
+    ('unkIndex', 0x4, 'uchar'),
+    ('dataType', 0x6, 'uchar'),
+    ('exponent', 0x7, 'uchar'),
+    ('keyframeDataAddr', 0x8, 'uint'),
+], size=0x10)
+
+KEYFRAME_DATA = RecordLayout('KeyframeData', [
+    ('valuesAddr', 0x0, 'uint'),
+    ('derivativesAddr', 0x4, 'uint'),
+    ('valueCount', 0x8, 'ushort'),
+    ('maxTime', 0xc, 'float'),
+    ('keyframesAddr', 0x10, 'uint'),
+    ('numKeyframes', 0x14, 'ushort'),
+    ('framerate', 0x16, 'ushort'), # only the low byte is used
+    ('idk18', 0x18, 'float'),
+], size=0x1c)
+
+KEYFRAME = RecordLayout('Keyframe', [
+    ('interpolation', 0x0, 'ushort'),
+    ('valueIndex', 0x2, 'ushort'),
+    ('derivativeLIndex', 0x4, 'ushort'),
+    ('derivativeRIndex', 0x6, 'ushort'),
+    ('time', 0x8, 'float'),
+], size=0xc)
+
+MESH = RecordLayout('Mesh', [
+    ('idk0', 0x0, 'ushort'),
+    ('numVertices', 0x2, 'ushort'),
+    ('numUVLayers', 0x6, 'ushort'),
+    ('verticesAddr', 0x8, 'uint'),
+    ('weightsAddr', 0xc, 'uint'),
+    ('uvLayersAddr', 0x14, 'uint'),
+    ('partsAddr', 0x18, 'uint'),
+    ('bboxesAddr', 0x1c, 'uint'),
+], size=0x30)
+
+MESH_PART = RecordLayout('MeshPart', [
+    ('idk0', 0x0, 'uint'),
+    ('materialAddr', 0x8, 'uint'),
+    ('numGroups', 0xc, 'ushort'),
+    ('vertInfoAddr', 0x10, 'uint'),
+    ('facesAddr', 0x14, 'uint'),
+    ('facesSize', 0x18, 'uint'),
+    ('nextAddr', 0x1c, 'uint'),
+], size=0x20)
+
+# one entry per vertex attribute, terminated by an 0xff attribute
+VERTEX_ATTR = RecordLayout('VertexAttr', [
+    ('attr', 0x0, 'uchar'),
+    ('componentCount', 0x1, 'uchar'),
+    ('componentType', 0x2, 'uchar'),
+    ('fracBits', 0x3, 'uchar'),
+    ('indexType', 0x4, 'uchar'),
+    ('stride', 0x5, 'uchar'),
+], size=0x8)
+
+UV_LAYER = RecordLayout('UVLayer', [
+    ('coordsAddr', 0x0, 'uint'),
+    ('numCoords', 0x4, 'ushort'),
+], size=0x8)
+
+SKIN = RecordLayout('Skin', [
+    ('numSingle', 0x0, 'ushort'),
+    ('singleAddr', 0x4, 'uint'),
+    ('numDouble', 0x8, 'ushort'),
+    ('numDoubleVerts', 0xa, 'ushort'),
+    ('doubleGroupsAddr', 0xc, 'uint'),
+    ('doubleWeightsAddr', 0x10, 'uint'),
+    ('numExtra', 0x14, 'ushort'),
+    ('extraAddr', 0x18, 'uint'),
+], size=0x1c)
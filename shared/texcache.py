@@ -0,0 +1,85 @@
+import hashlib, os
+
+import numpy as np
+
+# bump whenever the decoders' output changes, so that stale
+# entries are no longer found
+DECODER_VERSION = 2
+
+class TextureCache:
+    """
+    Stores decoded RGBA8 texture data on disk, keyed by a hash of
+    the encoded data and the parameters used to decode it. Once
+    the cache grows past `maxSize` bytes, the least recently used
+    entries are evicted
+    """
+
+    def __init__(self, directory, maxSize):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(data, width, height, encoding, palEncoding, palOffset, step=1):
+        h = hashlib.sha1(data)
+        params = f'v{DECODER_VERSION}:{width}x{height}:{encoding}'
+        # the palette only matters to color-indexed formats
+        if encoding in ['C4', 'C8', 'C14X2']:
+            params += f':{palEncoding}:{palOffset}'
+        if step > 1:
+            params += f':/{step}'
+        h.update(params.encode('ascii'))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.rgba')
+
+    def get(self, key):
+        """Returns the cached pixels for `key` or None"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(data, np.uint8)
+
+    def put(self, key, pixels):
+        """Stores `pixels` (a uint8 array) under `key`"""
+        path = self.path(key)
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmpPath, 'wb') as f:
+                f.write(np.ascontiguousarray(pixels, np.uint8).data)
+            os.replace(tmpPath, path)
+        except OSError as e:
+            print(f'Could not write to texture cache: {e}')
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until under the size cap"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.rgba'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
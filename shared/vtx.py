@@ -0,0 +1,101 @@
+import numpy as np
+
+from .const import *
+
+# GX component types of position, normal and texture coordinate data
+componentTypes = {
+    0: np.dtype('u1'), # GX_U8
+    1: np.dtype('i1'), # GX_S8
+    2: np.dtype('>u2'), # GX_U16
+    3: np.dtype('>i2'), # GX_S16
+    4: np.dtype('>f4'), # GX_F32
+}
+
+# GX color formats: size in bytes and (shift, bits) of each channel
+# within the big-endian value, in RGBA order
+colorFormats = {
+    0: (2, [(11, 5), (5, 6), (0, 5)]), # GX_RGB565
+    1: (3, [(16, 8), (8, 8), (0, 8)]), # GX_RGB8
+    2: (4, [(24, 8), (16, 8), (8, 8)]), # GX_RGBX8
+    3: (2, [(12, 4), (8, 4), (4, 4), (0, 4)]), # GX_RGBA4
+    4: (3, [(18, 6), (12, 6), (6, 6), (0, 6)]), # GX_RGBA6
+    5: (4, [(24, 8), (16, 8), (8, 8), (0, 8)]), # GX_RGBA8
+}
+
+texCoordAttrs = [GX_VA_TEX0, GX_VA_TEX1, GX_VA_TEX2, GX_VA_TEX3,
+                 GX_VA_TEX4, GX_VA_TEX5, GX_VA_TEX6, GX_VA_TEX7]
+colorAttrs = [GX_VA_CLR0, GX_VA_CLR1]
+
+def isColor(attr):
+    return attr in colorAttrs
+
+def componentCount(va):
+    """Number of components stored per element of the attribute `va`"""
+    if va.attr == GX_VA_POS:
+        return 3 if va.componentCount else 2
+    if va.attr in [GX_VA_NRM, GX_VA_NBT]:
+        # normal, binormal and tangent
+        return 9 if va.attr == GX_VA_NBT or va.componentCount else 3
+    if va.attr in texCoordAttrs:
+        return 2 if va.componentCount else 1
+    raise ValueError(f'Attribute {hex(va.attr)} has no components')
+
+def componentType(va):
+    try:
+        return componentTypes[va.componentType]
+    except KeyError:
+        raise ValueError(f'Unknown component type {va.componentType} ' + \
+                         f'for attribute {hex(va.attr)}') from None
+
+def colorFormat(va):
+    try:
+        return colorFormats[va.componentType]
+    except KeyError:
+        raise ValueError(f'Unknown color format {va.componentType} ' + \
+                         f'for attribute {hex(va.attr)}') from None
+
+def elementSize(va):
+    """Size in bytes of one element of the attribute `va`"""
+    if isColor(va.attr):
+        return colorFormat(va)[0]
+    return componentCount(va) * componentType(va).itemsize
+
+def scale(va):
+    """Factor that dequantizes the attribute's integer components"""
+    dtype = componentType(va)
+    if dtype.kind == 'f':
+        return 1.0
+    if va.attr in [GX_VA_NRM, GX_VA_NBT]:
+        # normals have a fixed shift in hardware
+        return 2.0 ** -(6 if dtype.itemsize == 1 else 14)
+    return 2.0 ** -va.fracBits
+
+def decodeComponents(file, va, address, count, stride, numComponents):
+    """
+    Reads `count` elements of the attribute `va`, each `stride` bytes
+    apart, and returns their first `numComponents` components (missing
+    ones are zero) as a (count, numComponents) float32 array
+    """
+    n = min(componentCount(va), numComponents)
+    raw = file.read_ndarray((componentType(va), n), address, count, stride)
+    values = np.zeros((len(raw), numComponents), np.float32)
+    np.multiply(raw, scale(va), out=values[:, :n], casting='unsafe')
+    return values
+
+def decodeColors(file, va, address, count, stride):
+    """
+    Reads `count` colors of the attribute `va`, each `stride` bytes
+    apart, and returns them as a (count, 4) float32 RGBA array
+    """
+    size, channels = colorFormat(va)
+    raw = file.read_ndarray(('u1', size), address, count, stride).astype(np.uint32)
+    # each color's bytes as one big-endian integer
+    packed = np.zeros(len(raw), np.uint32)
+    for i in range(size):
+        packed = (packed << 8) | raw[:, i]
+    # opaque unless the format has alpha
+    colors = np.ones((len(raw), 4), np.float32)
+    for i, (shift, bits) in enumerate(channels):
+        maxValue = (1 << bits) - 1
+        colors[:, i] = ((packed >> shift) & maxValue) / maxValue
+    return colors
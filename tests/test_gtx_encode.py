@@ -0,0 +1,34 @@
+import os, sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import gtx_encode
+
+def randomImage(w, h, opaque=False, seed=0):
+    rgba = np.random.RandomState(seed).randint(0, 0x100, (h, w, 4)).astype(np.uint8)
+    if opaque:
+        rgba[..., 3] = 0xff
+    return rgba
+
+@pytest.mark.parametrize('size', [(6, 6), (10, 7), (8, 8), (3, 1)])
+def test_rgba32_is_lossless(size):
+    rgba = randomImage(*size)
+    data, _, _ = gtx_encode.encodeTexture(rgba, 'RGBA32')
+    assert tuple(gtx_encode.quantizationError(rgba, data, 'RGBA32')) == (0, 0, 0, 0)
+
+@pytest.mark.parametrize('size', [(6, 6), (10, 7), (5, 9)])
+@pytest.mark.parametrize('opaque', [True, False])
+def test_rgb5a3_within_bounds(size, opaque):
+    rgba = randomImage(*size, opaque=opaque)
+    data, _, _ = gtx_encode.encodeTexture(rgba, 'RGB5A3')
+    error = gtx_encode.quantizationError(rgba, data, 'RGB5A3')
+    assert all(error <= gtx_encode.maxQuantizationError['RGB5A3'])
+
+@pytest.mark.parametrize('encoding', ['I4', 'I8', 'IA8', 'RGB565', 'RGB5A3', 'RGBA32', 'CMPR'])
+def test_decoded_pixels_match_source_size(encoding):
+    rgba = randomImage(10, 7)
+    data, _, _ = gtx_encode.encodeTexture(rgba, encoding)
+    decoded = gtx_encode.decodedPixels(data, 10, 7, encoding)
+    assert decoded.shape == (7, 10, 4)